@@ -384,7 +384,11 @@ print('floor(10.19) is equal to:      {}'.format(h2))
 
 
 import geopandas as gpd
-glacier_data = gpd.read_file('E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week1\data_files\Glaciers.shp')
+
+sys.path.append('..')  # add the repository root to the path, so that we can import the egm722 helper functions
+from egm722 import catalog  # look up the practical datasets by name, rather than by their full path
+
+glacier_data = catalog.load('glaciers')
 print(glacier_data.head())
 
 
@@ -448,7 +452,7 @@ import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point
 
-df = pd.read_csv('E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week1\data_files\GPSPoints.txt')
+df = pd.read_csv(catalog.path('gps'))
 
 
 # Like we did with the `geopandas` data above, let's have a look at the `DataFrame` we've just loaded:
@@ -472,6 +476,8 @@ df['geometry'] = df['geometry'].apply(Point) # using the 'apply' method of the d
                                              # NB: Point takes (x, y) coordinates
 
 
+# This creates a tuple, and then a `Point`, for each row of the `DataFrame` one at a time, which is fine for a small file like this one. For much larger files (millions of GPS points, say), `geopandas` can create all of the points at once using `gpd.points_from_xy(df['lon'], df['lat'])`. The `read_points()` and `ingest_points()` functions in the __egm722.points__ module (in the main folder of the repository) do this for you, and `ingest_points()` can convert a file that is too large to fit in memory a chunk at a time.
+
 # Let's look at the `DataFrame` again. We should have a `geometry` column, with the lat/lon coordinates for each feature:
 
 # In[33]:
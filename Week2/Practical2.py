@@ -4,6 +4,11 @@ from cartopy.feature import ShapelyFeature
 import cartopy.crs as ccrs
 import matplotlib.patches as mpatches
 import matplotlib.lines as mlines
+import sys
+
+sys.path.append('..')
+from egm722 import catalog
+from egm722.mapping import add_categorical, category_handles
 
 
 # generate matplotlib handles to create a legend of the features we put in our map.
@@ -34,13 +39,13 @@ def scale_bar(ax, location=(0.92, 0.95)):
     plt.text(sbx-24500, sby-4500, '1 km', transform=tmc, fontsize=8)
 
 # load the outline of Northern Ireland for a backdrop
-outline = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/NI_outline.shp')
+outline = catalog.load('outline')
 
 
-towns = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Towns.shp')
-water = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Water.shp')
-rivers = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Rivers.shp')
-counties = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Counties.shp')
+towns = catalog.load('towns')
+water = catalog.load('water')
+rivers = catalog.load('rivers')
+counties = catalog.load('counties', epsg=32629)
 
 
 # run this to see what the geodataframe looks like.
@@ -85,17 +90,13 @@ county_colors = ['tomato', 'lightgreen', 'olive', 'darkmagenta', 'skyblue', 'gol
 county_names = list(counties.CountyName.unique())
 county_names.sort() # sort the counties alphabetically by name
 
-# next, add the municipal outlines to the map using the colors that we've picked.
-# here, we're iterating over the unique values in the 'CountyName' field.
-# we're also setting the edge color to be black, with a line width of 0.5 pt.
+# next, add the county outlines to the map using the colors that we've picked.
+# add_categorical() draws all of the counties as a single collection, giving each county the color from county_colors
+# that matches its place in the sorted list of names (the same order as county_names).
+# we're also setting the edge color to be black, with a line width of 1 pt.
 # Feel free to experiment with different colors and line widths.
-for i, name in enumerate(county_names):
-    feat = ShapelyFeature(counties['geometry'][counties['CountyName'] == name], myCRS,
-                          edgecolor='k',
-                          facecolor=county_colors[i],
-                          linewidth=1,
-                          alpha=0.35)
-    ax.add_feature(feat)
+county_feat, county_color_map = add_categorical(ax, counties, 'CountyName', county_colors, crs=myCRS,
+                                                edgecolor='k', linewidth=1, alpha=0.35)
 
 # here, we're setting the edge color to be the same as the face color. Feel free to change this around,
 # and experiment with different line widths.
@@ -115,7 +116,7 @@ ax.add_feature(river_feat)
 town_handle = ax.plot(towns.geometry.x, towns.geometry.y, 's', color='red', ms=3, transform=myCRS)
 
 # generate a list of handles for the county datasets
-county_handles = generate_handles(counties.CountyName.unique(), county_colors, alpha=0.25)
+county_handles = category_handles(county_color_map, alpha=0.25)
 
 # note: if you change the color you use to display lakes, you'll want to change it here, too
 water_handle = generate_handles(['Lakes'], ['mediumblue'])
@@ -4,6 +4,14 @@ from cartopy.feature import ShapelyFeature
 import cartopy.crs as ccrs
 import matplotlib.patches as mpatches
 import matplotlib.lines as mlines
+import sys
+
+sys.path.append('..')
+from egm722.mapping import add_categorical, category_handles
+from egm722.labels import add_labels
+from egm722.simplify import add_scaled_layer
+from egm722 import catalog
+from egm722 import profiling  # named timing spans; set EGM722_PROFILE=practical2_trace.json to record them
 
 
 # generate matplotlib handles to create a legend of the features we put in our map.
@@ -35,14 +43,12 @@ def scale_bar(ax, location=(0.92, 0.95)):
     plt.text(sbx-24500, sby-4500, '0 km', transform=tmc, fontsize=8)
 
 
-outline = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/NI_outline.shp')
+outline = catalog.load('outline')
 
 
-# load the datasets
-towns = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Towns.shp')
-water = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Water.shp')
-rivers = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Rivers.shp')
-counties = gpd.read_file('E:/GIS/GIS_Practicals/GIS_Course EGM722 Practicals/GitHub/egm722/Week2/data_files/Counties.shp')
+# load the datasets by name from the data catalog, rather than using the full path to each file
+towns = catalog.load('towns')
+counties = catalog.load('counties', epsg=32629)
 
 # create a figure of size 10x10 (representing the page size in inches)
 myFig = plt.figure(figsize=(10, 10))
@@ -56,7 +62,8 @@ ax = plt.axes(projection=ccrs.Mercator())  # finally, create an axes object in t
 outline_feature = ShapelyFeature(outline['geometry'], myCRS, edgecolor='k', facecolor='w')
 
 xmin, ymin, xmax, ymax = outline.total_bounds
-ax.add_feature(outline_feature) # add the features we've created to the map.
+with profiling.span('add_feature', count=len(outline)):
+    ax.add_feature(outline_feature) # add the features we've created to the map.
 
 # using the boundary of the shapefile features, zoom the map to our area of interest
 ax.set_extent([xmin, xmax, ymin, ymax], crs=myCRS) # because total_bounds gives output as xmin, ymin, xmax, ymax,
@@ -69,37 +76,41 @@ county_colors = ['firebrick', 'seagreen', 'royalblue', 'coral', 'violet', 'corns
 county_names = list(counties.CountyName.unique())
 county_names.sort()  # sort the counties alphabetically by name
 
-# next, add the municipal outlines to the map using the colors that we've picked.
-# here, we're iterating over the list of names we created above
-# we're also setting the edge color to be black, with a line width of 0.5 pt.
+# next, add the county outlines to the map using the colors that we've picked.
+# add_categorical() draws all of the counties as a single collection, giving each county the color from county_colors
+# that matches its place in the sorted list of names (the same order as county_names).
+# we're also setting the edge color to be black, with a line width of 1 pt.
 # Feel free to experiment with different colors and line widths.
-for i, name in enumerate(county_names):
-    feat = ShapelyFeature(counties['geometry'][counties['CountyName'] == name], myCRS,
-                          edgecolor='k',
-                          facecolor=county_colors[i],
-                          linewidth=1,
-                          alpha=0.25)
-    ax.add_feature(feat)
+with profiling.span('add_feature', count=len(counties)):
+    county_feat, county_color_map = add_categorical(ax, counties, 'CountyName', county_colors, crs=myCRS,
+                                                    edgecolor='k', linewidth=1, alpha=0.25)
 
 # here, we're setting the edge color to be the same as the face color. Feel free to change this around,
 # and experiment with different line widths.
-water_feat = ShapelyFeature(water['geometry'], myCRS,
-                            edgecolor='mediumblue',
-                            facecolor='mediumblue',
-                            linewidth=1)
-ax.add_feature(water_feat)
-
-river_feat = ShapelyFeature(rivers['geometry'], myCRS,
-                            edgecolor='royalblue',
-                            linewidth=0.2)
-
-ax.add_feature(river_feat)
+# water and rivers are drawn using add_scaled_layer(), which uses simplified copies of the geometries (stored in
+# ~/.egm722_cache the first time they are built) that match the scale of the map and the output dpi, rather than
+# drawing every vertex of the full-resolution layers.
+with profiling.span('add_feature') as this_span:
+    water_feat = add_scaled_layer(ax, catalog.path('water'),
+                                  crs=myCRS,
+                                  edgecolor='mediumblue',
+                                  facecolor='mediumblue',
+                                  linewidth=1)
+    this_span.count = water_feat.num_features()
+
+with profiling.span('add_feature') as this_span:
+    river_feat = add_scaled_layer(ax, catalog.path('rivers'),
+                                  crs=myCRS,
+                                  edgecolor='royalblue',
+                                  facecolor='none',
+                                  linewidth=0.2)
+    this_span.count = river_feat.num_features()
 
 # ShapelyFeature creates a polygon, so for point data we can just use ax.plot()
 town_handle = ax.plot(towns.geometry.x, towns.geometry.y, 's', color='0.5', ms=6, transform=myCRS)
 
 # generate a list of handles for the county datasets
-county_handles = generate_handles(counties.CountyName.unique(), county_colors, alpha=0.25)
+county_handles = category_handles(county_color_map, alpha=0.25)
 
 # note: if you change the color you use to display lakes, you'll want to change it here, too
 water_handle = generate_handles(['Lakes'], ['mediumblue'])
@@ -125,13 +136,15 @@ gridlines.left_labels = False
 gridlines.bottom_labels = False
 ax.set_extent([xmin, xmax, ymin, ymax], crs=myCRS)
 
-# add the text labels for the towns
-for i, row in towns.iterrows():
-    x, y = row.geometry.x, row.geometry.y
-    plt.text(x, y, row['TOWN_NAME'].title(), fontsize=8, transform=myCRS) # use plt.text to place a label at x,y
+# add the text labels for the towns. rather than adding one plt.text() per town, add_labels() projects all of the
+# points at once, drops any labels that would overlap, and draws the rest using a single artist.
+town_labels = add_labels(ax, towns.geometry.x, towns.geometry.y, towns['TOWN_NAME'].str.title(), crs=myCRS, fontsize=8)
 
 scale_bar = (ax)
 
-myFig.savefig('map.png', bbox_inches='tight', dpi=300)
+# the layers are only drawn when the figure is saved, so most of the drawing time is counted in the savefig span
+with profiling.span('savefig'):
+    myFig.savefig('map.png', bbox_inches='tight', dpi=300)
+profiling.report()  # print a summary of the timing spans (only if profiling is switched on)
 plt.show()
 
@@ -39,10 +39,18 @@
 # this lets us use the figures interactively
 get_ipython().run_line_magic('matplotlib', 'notebook')
 
+import sys
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point, LineString, Polygon
 
+sys.path.append('..')  # add the repository root to the path, so that we can import the egm722 helper functions
+from egm722.measures import add_measure
+from egm722.zones import clip_by_zones
+from egm722.join_cache import cached_sjoin
+from egm722 import catalog  # load the practical datasets by name, rather than by their full path
+from egm722 import profiling  # named timing spans; set EGM722_PROFILE=practical3_trace.json to record them
+
 
 # ## 2. Shapely geometry types
 # ### 2.1 Points
@@ -313,7 +321,7 @@ print(line1.intersection(line2)) # if the geometries intersect, this will be the
 # In[16]:
 
 
-roads = gpd.read_file(r'E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week3\data_files\NI_roads.shp')
+roads = catalog.load('roads')
 print(roads.head())
 
 
@@ -362,7 +370,7 @@ roads.crs
 # In[83]:
 
 
-roads_itm = roads.to_crs(epsg=2157)
+roads_itm = profiling.timed('to_crs', roads.to_crs, epsg=2157)
 
 print(roads_itm.head())
 
@@ -402,13 +410,19 @@ roads_itm[roads_itm['Road_class'] == 'MOTORWAY']
 # ```
 # 
 # assigns the `length` property of the row's geometry to a new column, __Length__, at the corresponding index. Putting it all together, it looks like this:
+# 
+# ```python
+# for i, row in roads_itm.iterrows(): # iterate over each row in the GeoDataFrame
+#     roads_itm.loc[i, 'Length'] = row['geometry'].length # assign the row's geometry length to a new column, Length
+# ```
+# 
+# This works, but it is very slow for large datasets - each step of the loop creates a new __Series__ for the row, and assigns a single value using `.loc`. Instead, we can use `add_measure` from the __egm722.measures__ module, which calculates the `length` of every geometry in one go and assigns the entire __Length__ column at once:
 
 # In[27]:
 
 
-for i, row in roads_itm.iterrows(): # iterate over each row in the GeoDataFrame
-    roads_itm.loc[i, 'Length'] = row['geometry'].length # assign the row's geometry length to a new column, Length
-    
+roads_itm = profiling.timed('add_measure', add_measure, roads_itm, 'Length', 'length') # assign the length of each geometry to a new column, Length
+
 print(roads_itm.head()) # print the updated GeoDataFrame to see the changes
 
 
@@ -438,7 +452,9 @@ print('{:.2f} total m of motorway'.format(sum_motorway))
 # In[30]:
 
 
-roads_itm.groupby(['Road_class'])['Length'].sum() / 1000 # convert to km
+with profiling.span('groupby', count=len(roads_itm)):
+    class_lengths = roads_itm.groupby(['Road_class'])['Length'].sum() / 1000 # convert to km
+class_lengths
 
 
 # The `groupby` method returns a __GeoDataFrame__, which we can then index to return a single column, _Length_. As this is a numeric column, we can also use arithmetic on it to divide by a conversion factor. The `groupby` method is a very useful way to quickly summarize a __DataFrame__ (or a __GeoDataFrame__ - remember that this is a __child__ class of __DataFrame__).
@@ -453,8 +469,8 @@ roads_itm.groupby(['Road_class'])['Length'].sum() / 1000 # convert to km
 # In[73]:
 
 
-counties = gpd.read_file(r'E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week3\data_files\Counties.shp') # load the Counties shapefileif
-counties = counties.to_crs(epsg=29900) # your line of code might go here.
+counties = catalog.load('counties') # load the Counties shapefile
+counties = profiling.timed('to_crs', counties.to_crs, epsg=29900) # your line of code might go here.
 if counties.crs == roads_itm.crs:
     print("Same CRS:", counties.crs, roads_itm.crs)# test if the crs is the same for roads_itm and counties.
 else:
@@ -467,7 +483,11 @@ else:
 # In[65]:
 
 
-join = gpd.sjoin(counties, roads_itm, how='inner', lsuffix='left', rsuffix='right') # perform the spatial join
+# cached_sjoin() gives the same rows as gpd.sjoin(), but stores the matching pairs so that the next run doesn't have to
+# test the geometries again. The keys come from the source files, so the pairs are re-calculated if a file changes.
+join = profiling.timed('sjoin', cached_sjoin, counties, roads_itm, how='inner', lsuffix='left', rsuffix='right',
+                       left_key=catalog.key('counties', crs=counties.crs),
+                       right_key=catalog.key('roads', crs=roads_itm.crs)) # perform the spatial join
 join # show the joined table
 
 
@@ -479,7 +499,9 @@ join # show the joined table
 
 
 join_total = join['Length'].sum() # find the total length of roads in the join GeoDataFrame
-print(join.groupby(['CountyName', 'Road_class'])['Length'].sum() / 1000) # summarize the road lengths by CountyName, Road_class
+with profiling.span('groupby', count=len(join)):
+    county_lengths = join.groupby(['CountyName', 'Road_class'])['Length'].sum() / 1000
+print(county_lengths) # summarize the road lengths by CountyName, Road_class
 
 print(sum_roads / join_total) # check that the total length of roads is the same between both GeoDataFrames; this should be 1.
 
@@ -503,22 +525,25 @@ print(sum_roads / join_total) # check that the total length of roads is the same
 # ...
 # ```
 # 
-# But, we have to do this for each of the boundaries - `gpd.clip` will take the total boundary for the __GeoDataFrame__ if there are multiple __Polygon__ objects. Using a `for` loop to loop over the `counties` __GeoDataFrame__, we can clip `roads_itm` to each county, and combine the results in another __GeoDataFrame__:
+# But, we have to do this for each of the boundaries - `gpd.clip` will take the total boundary for the __GeoDataFrame__ if there are multiple __Polygon__ objects. Using a `for` loop to loop over the `counties` __GeoDataFrame__, we could clip `roads_itm` to each county, and combine the results in another __GeoDataFrame__:
+# 
+# ```python
+# clipped = [] # initialize an empty list
+# for county in counties['CountyName'].unique():
+#     tmp_clip = gpd.clip(roads_itm, counties[counties['CountyName'] == county]) # clip the roads by county border
+#     tmp_clip = add_measure(tmp_clip, 'Length', 'length') # we have to update the length for any clipped roads
+#     tmp_clip['CountyName'] = county # set the county name for each road feature
+#     clipped.append(tmp_clip) # add the clipped GeoDataFrame to the list
+# 
+# clipped_gdf = gpd.GeoDataFrame(pd.concat(clipped)) # combine (concatenate) the list of GeoDataFrames
+# ```
+# 
+# Each call to `gpd.clip` has to search through all of the roads again, though, which gets slow when we have many zones (for example, wards instead of counties). `clip_by_zones` from the __egm722.zones__ module does the same thing in one step: it splits each road at the county boundaries, sets the _CountyName_ for each piece, and updates the _Length_:
 
 # In[70]:
 
 
-clipped = [] # initialize an empty list
-for county in counties['CountyName'].unique():
-    tmp_clip = gpd.clip(roads_itm, counties[counties['CountyName'] == county]) # clip the roads by county border
-    for i, row in tmp_clip.iterrows():
-        tmp_clip.loc[i, 'Length'] = row['geometry'].length # we have to update the length for any clipped roads
-        tmp_clip.loc[i, 'CountyName'] = county # set the county name for each road feature    
-    clipped.append(tmp_clip) # add the clipped GeoDataFrame to the 
-
-# pandas has a function, concat, which will combine (concatenate) a list of DataFrames (or GeoDataFrames)
-# we can then create a GeoDataFrame from the combined DataFrame, as the combined DataFrame will have a geometry column.
-clipped_gdf = gpd.GeoDataFrame(pd.concat(clipped))
+clipped_gdf = profiling.timed('clip', clip_by_zones, roads_itm, counties, 'CountyName') # clip the roads by county border, and update the length
 clip_total = clipped_gdf['Length'].sum()
 
 print(sum_roads / clip_total) # check that the total length of roads is the same between both GeoDataFrames; this should be close to 1.
@@ -552,5 +577,4 @@ print(sum_road, sum_county)
 # In[ ]:
 
 
-
-
+profiling.report()  # print a summary of the timing spans (only if profiling is switched on)
@@ -7,6 +7,11 @@ import cartopy.crs as ccrs
 import matplotlib.patches as mpatches
 import numpy as np
 import pandas as pd
+import sys
+
+sys.path.append('..')  # add the repository root to the path, so that we can import the egm722 helper functions
+from egm722 import catalog
+from egm722.incremental import incremental_sum
 
 
 # generate matplotlib handles to create a legend of the features we put in our map.
@@ -20,10 +25,15 @@ def generate_handles(labels, colors, edge='k', alpha=1):
 # in this section, write the script to load the data and complete the main part of the analysis.
 
 
-counties = gpd.read_file(r'E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week3\data_files\Counties.shp')
-counties = counties.to_crs(epsg=32629)
-ward = gpd.read_file(r'E:\GIS\GIS_Practicals\GIS_Course EGM722 Practicals\GitHub\egm722\Week3\data_files\NI_Wards.shp')
-ward = ward.to_crs(epsg=32629)
+counties = catalog.load('counties', epsg=32629)
+ward = catalog.load('wards', epsg=32629)
+
+# sum the ward population by county. incremental_sum() stores the join and the totals between runs, so when the script
+# is run again, only the wards that have been added, removed, or changed are joined to the counties again.
+county_population, changes = incremental_sum(counties, ward, 'CountyName', ['Population'], id_field='Ward Code')
+print('{added} wards added, {removed} removed, {modified} modified since the last run'.format(**changes))
+for county, row in county_population.iterrows():
+    print('{}: {:,} people in {} wards'.format(county, row['Population'], row['count']))
 
 
 # ---------------------------------------------------------------------------------------------------------------------
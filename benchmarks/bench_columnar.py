@@ -0,0 +1,74 @@
+'''
+Round-trip (write, then read) vector layers as Shapefile, GeoParquet, and Feather files, and compare the times and
+file sizes.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_columnar.py
+    python benchmarks/bench_columnar.py Week3/data_files/NI_roads.shp
+'''
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import geopandas as gpd
+from egm722.columnar import write_parquet, read_parquet, write_feather, read_feather
+
+
+DEFAULT_LAYERS = ['Week1/data_files/Glaciers.shp', 'Week2/data_files/Rivers.shp', 'Week3/data_files/NI_Wards.shp']
+
+
+def file_size(fn):
+    # the total size of a file, including any shapefile sidecar files
+    if fn.endswith('.shp'):
+        return sum(os.path.getsize(f) for f in glob.glob(os.path.splitext(fn)[0] + '.*'))
+    return os.path.getsize(fn)
+
+
+def timed(func, *args, **kwargs):
+    tic = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - tic
+
+
+def round_trip(gdf, out_dir):
+    formats = [('Shapefile', 'layer.shp', lambda g, fn: g.to_file(fn), gpd.read_file),
+               ('GeoParquet', 'layer.parquet', write_parquet, read_parquet),
+               ('Feather', 'layer.feather', write_feather, read_feather)]
+
+    for name, fn, write, read in formats:
+        fn = os.path.join(out_dir, fn)
+        _, write_time = timed(write, gdf, fn)
+        back, read_time = timed(read, fn)
+        assert len(back) == len(gdf)
+        print('    {:<10} write: {:7.3f} s  read: {:7.3f} s  size: {:8.1f} kB'.format(
+            name, write_time, read_time, file_size(fn) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('layers', nargs='*', default=DEFAULT_LAYERS, help='the vector layers to round-trip')
+    args = parser.parse_args()
+
+    for fn in args.layers:
+        if not os.path.exists(fn):
+            print('{}: not found, skipping'.format(fn))
+            continue
+        gdf = gpd.read_file(fn)
+        print('{}: {} features, {} columns'.format(fn, len(gdf), len(gdf.columns)))
+
+        out_dir = tempfile.mkdtemp()
+        try:
+            round_trip(gdf, out_dir)
+        finally:
+            shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Compare gpd.sjoin() against cold (empty cache) and warm (cached pairs) runs of egm722.join_cache.cached_sjoin(), with
+the layers hashed on every call or with known keys, followed by the kind of summary we run in Week 3:
+
+    join.groupby(['CountyName', 'Road_class'])['Length'].sum()
+
+Usage (from the repository root):
+
+    python benchmarks/bench_join_cache.py -n 100000 --zones 30
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import geopandas as gpd
+from egm722.measures import add_measure
+from egm722.hashing import layer_hash
+from egm722.join_cache import cached_sjoin
+from synthetic import random_lines, random_zones
+
+
+def timed(label, func, *args, **kwargs):
+    tic = time.perf_counter()
+    result = func(*args, **kwargs)
+    print('    {}: {:.3f} s'.format(label, time.perf_counter() - tic))
+    return result
+
+
+def summarize(join):
+    return join.groupby(['CountyName', 'Road_class'])['Length'].sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=100000, help='number of synthetic road features')
+    parser.add_argument('--zones', type=int, default=30, help='number of synthetic zones')
+    parser.add_argument('--repeats', type=int, default=3, help='number of warm joins to run')
+    args = parser.parse_args()
+
+    roads = add_measure(random_lines(args.n))
+    zones = random_zones(args.zones)
+    cache_dir = tempfile.mkdtemp()
+
+    print('{} roads, {} zones'.format(len(roads), len(zones)))
+    try:
+        expected = summarize(timed('gpd.sjoin', gpd.sjoin, zones, roads, how='inner'))
+        keys = dict(left_key=layer_hash(zones), right_key=layer_hash(roads))
+        cold = summarize(timed('cached_sjoin (cold)', cached_sjoin, zones, roads, cache_dir=cache_dir, **keys))
+        # hashing the geometries of both layers on every call costs about as much as the join itself
+        for _ in range(args.repeats):
+            warm = summarize(timed('cached_sjoin (warm, hashing the layers)', cached_sjoin, zones, roads,
+                                   cache_dir=cache_dir, left_key=layer_hash(zones), right_key=layer_hash(roads)))
+        # with keys that are already known (e.g., from catalog.key()), the layers aren't hashed
+        for _ in range(args.repeats):
+            warm = summarize(timed('cached_sjoin (warm, known keys)', cached_sjoin, zones, roads, cache_dir=cache_dir,
+                                   **keys))
+
+        assert np.allclose(expected, cold.reindex(expected.index))
+        assert np.allclose(expected, warm.reindex(expected.index))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Compare the per-row iterrows() loop from Week3/Practical3.py against egm722.measures.add_measure.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_measures.py -n 10000 100000
+    python benchmarks/bench_measures.py --shapefile Week3/data_files/NI_roads.shp
+    python benchmarks/bench_measures.py --scale 72
+
+--scale tiles the shapefile (NI_roads.shp, by default) with shifted copies of itself. NI_roads.shp has about 139,000
+line segments, so --scale 72 gives about 10 million segments (1.8 million features).
+'''
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import geopandas as gpd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from egm722.measures import add_measure
+from synthetic import DATA_FILES, REPO_ROOT, random_lines, scale_layer
+
+
+def iterrows_lengths(gdf):
+    # the original loop from the Week 3 practical
+    for i, row in gdf.iterrows():
+        gdf.loc[i, 'Length'] = row['geometry'].length
+    return gdf
+
+
+def count_segments(gdf):
+    parts = gdf.geometry.explode(index_parts=False)
+    return len(parts.get_coordinates()) - len(parts)
+
+
+def time_it(func, gdf):
+    tic = time.perf_counter()
+    func(gdf)
+    return time.perf_counter() - tic
+
+
+def compare(gdf, label, max_loop=200000):
+    vec_time = time_it(add_measure, gdf.copy())
+
+    # the loop gets very slow for large datasets, so we time a subset and scale up
+    nloop = min(len(gdf), max_loop)
+    loop_time = time_it(iterrows_lengths, gdf.iloc[:nloop].copy()) * len(gdf) / nloop
+
+    # check that the two methods agree
+    check = iterrows_lengths(gdf.iloc[:1000].copy())
+    assert np.allclose(check['Length'], add_measure(gdf.iloc[:1000].copy())['Length'])
+
+    print('{}: {} features, {} segments'.format(label, len(gdf), count_segments(gdf)))
+    print('    iterrows: {:.3f} s{}'.format(loop_time, ' (estimated)' if nloop < len(gdf) else ''))
+    print('    add_measure: {:.3f} s ({:.0f}x faster)'.format(vec_time, loop_time / vec_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of synthetic road features to benchmark')
+    parser.add_argument('--shapefile', help='benchmark using a shapefile (e.g., NI_roads.shp) instead')
+    parser.add_argument('--scale', type=int, help='benchmark using this many tiled copies of the shapefile (by '
+                                                  'default, NI_roads.shp)')
+    parser.add_argument('--max-loop', type=int, default=20000,
+                        help='maximum number of features to time with the iterrows loop')
+    args = parser.parse_args()
+
+    if args.shapefile is not None or args.scale is not None:
+        fn = args.shapefile if args.shapefile is not None else os.path.join(REPO_ROOT, DATA_FILES['roads'])
+        roads = gpd.read_file(fn).to_crs(epsg=2157)
+        label = os.path.basename(fn)
+        if args.scale is not None:
+            roads = scale_layer(roads, args.scale)
+            label = '{} x {}'.format(label, args.scale)
+        compare(roads, label, args.max_loop)
+    else:
+        for n in args.n:
+            compare(random_lines(n), 'synthetic', args.max_loop)
+
+
+if __name__ == '__main__':
+    main()
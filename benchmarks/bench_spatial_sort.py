@@ -0,0 +1,150 @@
+'''
+Compare reading, clipping, and drawing small areas of the practical layers, stored in their original order and
+sorted along a Hilbert curve with egm722.spatial_sort.
+
+- Week 3 clip: for each county, read the roads inside of the county's bounding box and clip them with
+  clip_by_zones().
+- Week 2 map: for each quarter of Northern Ireland, read the water and rivers inside of the map extent, and draw and
+  save the map.
+
+For each layer, the records that have to be read (or decoded) are reported as well as the times: GDAL has to check
+every record of an unsorted shapefile, and read_parquet() has to decode every row group that the area touches.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_spatial_sort.py
+    python benchmarks/bench_spatial_sort.py --scale 10 --curve morton
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pyarrow.parquet as pq
+from egm722.columnar import ROW_GROUP_KEY, read_parquet, write_parquet
+from egm722.spatial_sort import BLOCK_SIZE, BLOCKS_EXT, block_runs, read_blocks, write_sorted
+from egm722.zones import clip_by_zones
+from synthetic import load_layer, random_zones
+
+
+def timed(func, *args, **kwargs):
+    tic = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - tic
+
+
+def _intersects(bounds, bbox):
+    xmin, ymin, xmax, ymax = bbox
+    return (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+
+
+def records_read(fn, bbox, total):
+    # the number of records that have to be read (or decoded) to find the features inside of bbox
+    if fn.endswith('.parquet'):
+        metadata = pq.ParquetFile(fn).schema_arrow.metadata
+        rg_bounds = np.array(json.loads(metadata[ROW_GROUP_KEY]), dtype=float)
+        sizes = np.diff(np.append(np.arange(0, total, BLOCK_SIZE), total))
+        return int(sizes[_intersects(rg_bounds, bbox)].sum())
+    if os.path.exists(fn + BLOCKS_EXT):
+        with open(fn + BLOCKS_EXT, 'r') as f:
+            return sum(stop - start for start, stop in block_runs(json.load(f), bbox))
+    return total
+
+
+def write_both(gdf, out_dir, name, curve):
+    # write the layer in its original order and sorted, as both shapefiles and GeoParquet
+    fns = {}
+    for fmt in ['shp', 'parquet']:
+        fns[('original', fmt)] = os.path.join(out_dir, '{}.{}'.format(name, fmt))
+        fns[('sorted', fmt)] = os.path.join(out_dir, '{}_sorted.{}'.format(name, fmt))
+        if fmt == 'shp':
+            gdf.to_file(fns[('original', fmt)])
+        else:
+            write_parquet(gdf, fns[('original', fmt)], row_group_size=BLOCK_SIZE)
+        write_sorted(gdf, fns[('sorted', fmt)], curve=curve, block_size=BLOCK_SIZE)
+    return fns
+
+
+def read_area(fn, bbox):
+    if fn.endswith('.parquet'):
+        return read_parquet(fn, bbox=bbox)
+    return read_blocks(fn, bbox=bbox)
+
+
+def clip_counties(fns, counties, total):
+    print('Week 3 clip: roads by county ({} features)'.format(total))
+    for key, fn in sorted(fns.items()):
+        elapsed, nread, pieces = 0., 0, 0
+        for _, county in counties.iterrows():
+            bbox = county.geometry.bounds
+            roads, read_time = timed(read_area, fn, bbox)
+            clipped, clip_time = timed(clip_by_zones, roads, counties.loc[[county.name]], 'CountyName')
+            elapsed += read_time + clip_time
+            nread += records_read(fn, bbox, total)
+            pieces += len(clipped)
+        print('    {:<9} {:<8} {:8.3f} s  {:>10} records read  {:>8} pieces'.format(key[0], key[1], elapsed, nread,
+                                                                                     pieces))
+
+
+def draw_quarters(layer_fns, counts, bounds, out_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    from egm722.mapping import geometry_collection, project_geometries
+
+    myCRS = ccrs.UTM(29)
+    xmin, ymin, xmax, ymax = bounds
+    xmid, ymid = (xmin + xmax) / 2, (ymin + ymax) / 2
+    quarters = [(xmin, ymin, xmid, ymid), (xmid, ymin, xmax, ymid), (xmin, ymid, xmid, ymax), (xmid, ymid, xmax, ymax)]
+    styles = [dict(edgecolor='mediumblue', facecolor='mediumblue'), dict(edgecolor='royalblue', facecolor='none',
+                                                                         linewidth=0.2)]
+
+    print('Week 2 map: water and rivers, one map for each quarter of the area')
+    for order in ['original', 'sorted']:
+        for fmt in ['shp', 'parquet']:
+            tic = time.perf_counter()
+            nread = 0
+            for bbox in quarters:
+                fig = plt.figure(figsize=(5, 5))
+                ax = plt.axes(projection=ccrs.Mercator())
+                ax.set_extent([bbox[0], bbox[2], bbox[1], bbox[3]], crs=myCRS)
+                for fns, total, style in zip(layer_fns, counts, styles):
+                    layer = read_area(fns[(order, fmt)], bbox)
+                    nread += records_read(fns[(order, fmt)], bbox, total)
+                    geoms = project_geometries(layer.geometry.values, myCRS, ax.projection)
+                    ax.add_collection(geometry_collection(geoms, transform=ax.transData, **style), autolim=False)
+                fig.savefig(os.path.join(out_dir, 'map.png'), dpi=100)
+                plt.close(fig)
+            print('    {:<9} {:<8} {:8.3f} s  {:>10} records read'.format(order, fmt, time.perf_counter() - tic,
+                                                                          nread))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='the factor to scale the datasets by')
+    parser.add_argument('--curve', choices=['hilbert', 'morton'], default='hilbert', help='the curve to sort along')
+    args = parser.parse_args()
+
+    out_dir = tempfile.mkdtemp()
+    try:
+        roads = load_layer('roads', args.scale, crs='epsg:2157')
+        counties = random_zones(6, radius=40000.)  # Counties.shp isn't included in the repository
+        clip_counties(write_both(roads, out_dir, 'roads', args.curve), counties, len(roads))
+
+        water = load_layer('water', args.scale, crs='epsg:32629')
+        rivers = load_layer('rivers', args.scale, crs='epsg:32629')
+        layer_fns = [write_both(water, out_dir, 'water', args.curve), write_both(rivers, out_dir, 'rivers', args.curve)]
+        draw_quarters(layer_fns, [len(water), len(rivers)], water.total_bounds, out_dir)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+'''
+Time the hot paths of each practical (and the egm722 versions of them) on the shipped datasets, scaled up by 1x, 10x
+and 100x, and keep a history of the results so that we can catch performance regressions between versions.
+
+Each benchmark is run in a new process, so that its peak memory use (resident set size) can be recorded. On Linux, the
+peak is reset once the data have been set up, so that the memory used by the benchmark itself is reported as well.
+The results of each run are added to a JSON history file, and compared against the last run at the same scale. If a
+benchmark fails, its error is recorded in the history instead, and the other benchmarks are still run.
+
+By default, only the 1x and 10x scales are run. The 100x scale has to be asked for with --scale, as it needs more
+memory than most laptops have: the land cover raster alone is 312 million pixels at 100x, and the Week 4
+img_display() case makes several float32 copies of a 3-band image of that size (more than 10 GB in total).
+
+Usage (from the repository root):
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scale 1 10 100 --history benchmarks/history.json
+    python benchmarks/run_benchmarks.py --cases length_loop add_measure --scale 10
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import inspect
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio as rio
+from shapely.geometry import Point
+from synthetic import DATA_FILES, REPO_ROOT, load_layer, random_points, random_zones, scale_raster, scale_table
+from bench_measures import iterrows_lengths
+from egm722.profiling import peak_rss, reset_peak
+
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+GPS_BASE = 1000  # GPSPoints.txt only has a few rows, so it is copied this many times before scaling
+MAX_LOOP = 20000  # the maximum number of rows to time in per-row loops - longer loops are extrapolated
+REGRESSION = 1.25  # flag any benchmark that is this many times slower than the last run
+
+
+# gpd.sjoin() takes the predicate as op= in the version of geopandas in environment.yml (0.9), and as predicate= in
+# later versions (where op= is deprecated, then removed)
+SJOIN_PREDICATE = 'predicate' if 'predicate' in inspect.signature(gpd.sjoin).parameters else 'op'
+
+
+# the original versions of the functions from the practicals
+def count_unique(array, nodata=0):
+    count_dict = {}
+    for val in np.unique(array):
+        if val == nodata:
+            continue
+        count_dict[str(val)] = np.count_nonzero(array == val)
+    return count_dict
+
+
+def percentile_stretch(img, pmin=0., pmax=100.):
+    minval = np.percentile(img, pmin)
+    maxval = np.percentile(img, pmax)
+
+    stretched = (img - minval) / (maxval - minval)
+    stretched[img < minval] = 0
+    stretched[img > maxval] = 1
+    return stretched
+
+
+def img_display(img, bands, stretch_args):
+    # img_display() from the Week 4 assignment, up to (but not including) the call to ax.imshow()
+    dispimg = img.copy().astype(np.float32)
+    for b in range(img.shape[0]):
+        dispimg[b] = percentile_stretch(img[b], **stretch_args)
+    dispimg = dispimg.transpose([1, 2, 0])
+    return dispimg[:, :, bands]
+
+
+def clip_loop(roads, zones):
+    clipped = []
+    for name in zones['CountyName'].unique():
+        tmp_clip = gpd.clip(roads, zones[zones['CountyName'] == name])
+        tmp_clip['CountyName'] = name
+        clipped.append(tmp_clip)
+    return pd.concat(clipped)
+
+
+def _landcover(scale):
+    # the land cover raster, tiled to scale times the number of pixels, and its profile
+    with rio.open(os.path.join(REPO_ROOT, DATA_FILES['landcover'])) as dataset:
+        landcover = scale_raster(dataset.read(1), scale)
+        profile = dict(dataset.profile, width=landcover.shape[1], height=landcover.shape[0], tiled=True,
+                       blockxsize=256, blockysize=256)
+    return landcover, profile
+
+
+def _raster_zones(profile, n=6):
+    # zones that cover the (scaled) raster, like the counties cover the land cover map
+    transform = profile['transform']
+    xmin, ymax = transform.c, transform.f
+    xmax, ymin = xmin + transform.a * profile['width'], ymax + transform.e * profile['height']
+    radius = max(xmax - xmin, ymax - ymin) / 5
+    return random_zones(n, vertices=2000, radius=radius, bounds=(xmin, ymin, xmax, ymax), crs=profile['crs'])
+
+
+def _render(layers, fn_out, collections=False):
+    # draw the layers in the same way as the Week 2 script (or using single collections), and save the figure
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    from cartopy.feature import ShapelyFeature
+    from egm722.mapping import geometry_collection, project_geometries
+
+    myCRS = ccrs.UTM(29)
+    fig = plt.figure(figsize=(10, 10))
+    ax = plt.axes(projection=ccrs.Mercator())
+    xmin, ymin, xmax, ymax = layers[0].total_bounds
+    ax.set_extent([xmin, xmax, ymin, ymax], crs=myCRS)
+    for gdf, style in zip(layers, [dict(edgecolor='mediumblue', facecolor='mediumblue'),
+                                   dict(edgecolor='royalblue', facecolor='none', linewidth=0.2)]):
+        if collections:
+            geoms = project_geometries(gdf.geometry.values, myCRS, ax.projection)
+            ax.add_collection(geometry_collection(geoms, transform=ax.transData, **style), autolim=False)
+        else:
+            ax.add_feature(ShapelyFeature(gdf['geometry'], myCRS, **style))
+    fig.savefig(fn_out, dpi=100)
+    plt.close(fig)
+
+
+# each benchmark sets up its data (which isn't timed), and returns the function to time, the size of the input, and
+# the fraction of the input that the function processes (for loops that would take too long to run in full)
+def setup_read_file(scale, tmp_dir):
+    fn = os.path.join(tmp_dir, 'roads.shp')
+    roads = load_layer('roads', scale)
+    roads.to_file(fn)
+    return (lambda: gpd.read_file(fn)), len(roads), 1.
+
+
+def setup_to_crs(scale, tmp_dir):
+    roads = load_layer('roads', scale, crs='epsg:4326')
+    return (lambda: roads.to_crs(epsg=2157)), len(roads), 1.
+
+
+def setup_reproject(scale, tmp_dir):
+    from egm722.reproject import to_crs
+    roads = load_layer('roads', scale, crs='epsg:4326')
+    return (lambda: to_crs(roads, epsg=2157)), len(roads), 1.
+
+
+def setup_sjoin(scale, tmp_dir):
+    wards = load_layer('wards', scale, crs='epsg:2157')
+    points = random_points(10000 * scale, bounds=wards.total_bounds)
+    return (lambda: gpd.sjoin(points, wards, how='inner', **{SJOIN_PREDICATE: 'within'})), len(points), 1.
+
+
+def setup_partitioned_sjoin(scale, tmp_dir):
+    from egm722.parallel_join import partitioned_sjoin
+    wards = load_layer('wards', scale, crs='epsg:2157')
+    points = random_points(10000 * scale, bounds=wards.total_bounds)
+    return (lambda: partitioned_sjoin(wards, points, predicate='contains')), len(points), 1.
+
+
+def setup_clip(scale, tmp_dir):
+    roads = load_layer('roads', scale, crs='epsg:2157')
+    return (lambda: clip_loop(roads, random_zones(6, radius=40000.))), len(roads), 1.
+
+
+def setup_clip_by_zones(scale, tmp_dir):
+    from egm722.zones import clip_by_zones
+    roads = load_layer('roads', scale, crs='epsg:2157')
+    return (lambda: clip_by_zones(roads, random_zones(6, radius=40000.), 'CountyName')), len(roads), 1.
+
+
+def setup_length_loop(scale, tmp_dir):
+    roads = load_layer('roads', scale, crs='epsg:2157')
+    subset = roads.iloc[:MAX_LOOP].copy()
+    return (lambda: iterrows_lengths(subset)), len(roads), len(subset) / len(roads)
+
+
+def setup_add_measure(scale, tmp_dir):
+    from egm722.measures import add_measure
+    roads = load_layer('roads', scale, crs='epsg:2157')
+    return (lambda: add_measure(roads)), len(roads), 1.
+
+
+def setup_points_apply(scale, tmp_dir):
+    df = scale_table(pd.read_csv(os.path.join(REPO_ROOT, DATA_FILES['gps'])), GPS_BASE * scale)
+
+    def _points():
+        df['geometry'] = list(zip(df['lon'], df['lat']))
+        df['geometry'] = df['geometry'].apply(Point)
+        return gpd.GeoDataFrame(df, crs='epsg:4326')
+    return _points, len(df), 1.
+
+
+def setup_points_from_table(scale, tmp_dir):
+    from egm722.points import points_from_table
+    df = scale_table(pd.read_csv(os.path.join(REPO_ROOT, DATA_FILES['gps'])), GPS_BASE * scale)
+    return (lambda: points_from_table(df)), len(df), 1.
+
+
+def setup_zonal_stats(scale, tmp_dir):
+    from rasterstats import zonal_stats
+    landcover, profile = _landcover(scale)
+    zones = _raster_zones(profile)
+    return (lambda: zonal_stats(zones, landcover, affine=profile['transform'], categorical=True, nodata=0)), \
+        landcover.size, 1.
+
+
+def setup_zonal_stats_windowed(scale, tmp_dir):
+    from egm722.zonal import zonal_stats_windowed
+    landcover, profile = _landcover(scale)
+    fn = os.path.join(tmp_dir, 'landcover.tif')
+    with rio.open(fn, 'w', **profile) as dst:
+        dst.write(landcover, 1)
+    zones = _raster_zones(profile)
+    return (lambda: zonal_stats_windowed(zones, fn, nodata=0)), landcover.size, 1.
+
+
+def setup_count_unique(scale, tmp_dir):
+    landcover, _ = _landcover(scale)
+    return (lambda: count_unique(landcover)), landcover.size, 1.
+
+
+def setup_count_unique_bincount(scale, tmp_dir):
+    from egm722 import counts
+    landcover, _ = _landcover(scale)
+    return (lambda: counts.count_unique(landcover)), landcover.size, 1.
+
+
+def _image(scale):
+    # a 3-band floating-point image, made from the land cover raster plus some noise
+    landcover, _ = _landcover(scale)
+    rng = np.random.default_rng(0)
+    return np.stack([landcover + rng.random(landcover.shape, dtype=np.float32) for _ in range(3)])
+
+
+def setup_percentile_stretch(scale, tmp_dir):
+    img = _image(scale)
+    return (lambda: [percentile_stretch(img[b], 2, 98) for b in range(img.shape[0])]), img.size, 1.
+
+
+def setup_img_display(scale, tmp_dir):
+    img = _image(scale)
+    return (lambda: img_display(img, [0, 1, 2], dict(pmin=2, pmax=98))), img.size, 1.
+
+
+def setup_stretch_image(scale, tmp_dir):
+    from egm722.stretch import stretch_image
+    img = _image(scale)
+    return (lambda: stretch_image(img, [0, 1, 2], pmin=2, pmax=98)), img.size, 1.
+
+
+def setup_render(scale, tmp_dir):
+    layers = [load_layer('water', scale, crs='epsg:32629'), load_layer('rivers', scale, crs='epsg:32629')]
+    return (lambda: _render(layers, os.path.join(tmp_dir, 'map.png'))), sum(len(gdf) for gdf in layers), 1.
+
+
+def setup_render_collections(scale, tmp_dir):
+    layers = [load_layer('water', scale, crs='epsg:32629'), load_layer('rivers', scale, crs='epsg:32629')]
+    return (lambda: _render(layers, os.path.join(tmp_dir, 'map.png'), collections=True)), \
+        sum(len(gdf) for gdf in layers), 1.
+
+
+# the benchmarks, in the order they are run: the original practical version first, then the egm722 version
+CASES = {'read_file': setup_read_file,
+         'to_crs': setup_to_crs,
+         'reproject.to_crs': setup_reproject,
+         'sjoin': setup_sjoin,
+         'partitioned_sjoin': setup_partitioned_sjoin,
+         'clip': setup_clip,
+         'clip_by_zones': setup_clip_by_zones,
+         'length_loop': setup_length_loop,
+         'add_measure': setup_add_measure,
+         'points_apply': setup_points_apply,
+         'points_from_table': setup_points_from_table,
+         'zonal_stats': setup_zonal_stats,
+         'zonal_stats_windowed': setup_zonal_stats_windowed,
+         'count_unique': setup_count_unique,
+         'counts.count_unique': setup_count_unique_bincount,
+         'percentile_stretch': setup_percentile_stretch,
+         'img_display': setup_img_display,
+         'stretch_image': setup_stretch_image,
+         'render': setup_render,
+         'render_collections': setup_render_collections}
+
+
+def run_case(name, scale):
+    '''
+    Set up and time a single benchmark. This is run in a new process for each benchmark.
+
+    :param name: the name of the benchmark (a key of CASES)
+    :param scale: the factor to scale the datasets by
+
+    :returns result: a dict with the time (in seconds), input size, peak memory use, and the memory used by the
+        benchmark itself (on Linux; None elsewhere)
+    '''
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        func, size, fraction = CASES[name](scale, tmp_dir)
+        setup_rss = peak_rss()
+
+        # on Linux, reset the peak so that it only includes the benchmark, not the setup
+        can_reset = reset_peak()
+        start_rss = peak_rss()
+
+        tic = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - tic) / fraction
+        end_rss = peak_rss()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    used = (end_rss - start_rss) / 2 ** 20 if can_reset and end_rss is not None else None
+    peak = None if end_rss is None else max(setup_rss, end_rss) / 2 ** 20
+    return {'seconds': elapsed, 'size': int(size), 'extrapolated': fraction < 1,
+            'setup_rss_mb': None if setup_rss is None else setup_rss / 2 ** 20, 'peak_rss_mb': peak, 'used_mb': used}
+
+
+def _environment():
+    # the versions of python, the main libraries, and the repository, so that results can be compared over time
+    import shapely
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'geopandas': gpd.__version__,
+            'shapely': shapely.__version__, 'rasterio': rio.__version__}
+
+
+def load_history(fn):
+    if os.path.exists(fn):
+        with open(fn, 'r') as f:
+            return json.load(f)
+    return []
+
+
+def last_results(history, scale):
+    # the most recent results for each benchmark at the same scale
+    previous = {}
+    for run in history:
+        if run['scale'] == scale:
+            previous.update({name: result for name, result in run['results'].items() if 'error' not in result})
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10],
+                        help='the factors to scale the datasets by (100x is not run by default, as it needs more than '
+                             '10 GB of memory)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES), help='the benchmarks to run')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='the JSON file to add the results to')
+    parser.add_argument('--no-save', action='store_true', help="don't add the results to the history file")
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    environment = _environment()
+
+    # where possible, fork a new process for each benchmark, so that the peak memory only includes that benchmark
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if fork else None)
+
+    for scale in args.scale:
+        previous = last_results(history, scale)
+        results = {}
+        print('scale: {}x'.format(scale))
+        for name in args.cases:
+            # record a failing benchmark (e.g., a missing dependency, or running out of memory) and carry on
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_case, name, scale).result()
+            except Exception as e:
+                results[name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+                print('    {:<22} failed: {}'.format(name, results[name]['error']))
+                continue
+            results[name] = result
+
+            flag = ''
+            if name in previous and result['seconds'] > REGRESSION * previous[name]['seconds']:
+                flag = '  <-- {:.1f}x slower than the last run'.format(result['seconds'] / previous[name]['seconds'])
+            peak = '' if result['peak_rss_mb'] is None else '{:>8.0f} MB peak'.format(result['peak_rss_mb'])
+            used = '' if result['used_mb'] is None else '{:>8.0f} MB used'.format(result['used_mb'])
+            print('    {:<22} {:>10.3f} s{} {:>10} items {} {}{}'.format(
+                name, result['seconds'], '*' if result['extrapolated'] else ' ', result['size'], peak, used, flag))
+
+        history.append(dict(environment, scale=scale, time=time.strftime('%Y-%m-%dT%H:%M:%S'), results=results))
+
+    print('* estimated from a subset of the input')
+    if not args.no_save:
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=1)
+        print('results added to {}'.format(args.history))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+'''
+Synthetic datasets used by the benchmark scripts, so that they can be run at sizes much larger than the data files
+shipped with the practicals.
+'''
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import LineString, Point
+
+
+# the approximate extent of Northern Ireland in Irish Transverse Mercator (EPSG:2157)
+NI_BOUNDS_ITM = (565000., 812000., 720000., 980000.)
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the data files shipped with the practicals that the benchmarks are based on
+DATA_FILES = {'roads': 'Week3/data_files/NI_roads.shp',
+              'wards': 'Week3/data_files/NI_Wards.shp',
+              'rivers': 'Week2/data_files/Rivers.shp',
+              'water': 'Week2/data_files/Water.shp',
+              'landcover': 'Week5/data_files/LCM2015_Aggregate_100m.tif',
+              'gps': 'Week1/data_files/GPSPoints.txt'}
+
+
+def random_lines(n, vertices=10, step=50., bounds=NI_BOUNDS_ITM, crs='epsg:2157', seed=0):
+    '''
+    Create a GeoDataFrame of random-walk LineStrings that looks a bit like a road network.
+
+    :param n: the number of features to create
+    :param vertices: the number of vertices in each line
+    :param step: the standard deviation of the distance between vertices, in CRS units
+    :param bounds: (xmin, ymin, xmax, ymax) bounds for the starting points of each line
+    :param crs: the CRS to set for the output
+    :param seed: the seed for the random number generator
+
+    :returns lines: a GeoDataFrame with a 'Road_class' column and LineString geometries
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+
+    start = np.column_stack([rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)])
+    walks = start[:, None, :] + np.cumsum(rng.normal(0, step, (n, vertices, 2)), axis=1)
+
+    classes = np.array(['MOTORWAY', 'A_CLASS', 'B_CLASS', 'CLASS_III', 'UNCLASSIFIED'])
+
+    return gpd.GeoDataFrame({'Road_class': classes[rng.integers(0, len(classes), n)]},
+                            geometry=[LineString(coords) for coords in walks], crs=crs)
+
+
+def random_zones(n, vertices=2000, radius=20000., bounds=NI_BOUNDS_ITM, crs='epsg:2157', seed=0):
+    '''
+    Create a GeoDataFrame of (overlapping) circular zones with detailed boundaries, like counties or wards.
+
+    :param n: the number of zones to create
+    :param vertices: the approximate number of vertices in each zone boundary
+    :param radius: the radius of each zone, in CRS units
+    :param bounds: (xmin, ymin, xmax, ymax) bounds for the zone centers
+    :param crs: the CRS to set for the output
+    :param seed: the seed for the random number generator
+
+    :returns zones: a GeoDataFrame with a 'CountyName' column and Polygon geometries
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+
+    centers = [Point(x, y) for x, y in zip(rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n))]
+    return gpd.GeoDataFrame({'CountyName': ['ZONE{}'.format(i) for i in range(n)]},
+                            geometry=[pt.buffer(radius, resolution=max(1, vertices // 4)) for pt in centers],
+                            crs=crs)
+
+
+def random_points(n, bounds=NI_BOUNDS_ITM, crs='epsg:2157', seed=0):
+    '''
+    Create a GeoDataFrame of random points.
+
+    :param n: the number of points to create
+    :param bounds: (xmin, ymin, xmax, ymax) bounds for the points
+    :param crs: the CRS to set for the output
+    :param seed: the seed for the random number generator
+
+    :returns points: a GeoDataFrame with a 'Population' column and Point geometries
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+    return gpd.GeoDataFrame({'Population': rng.integers(1000, 8000, n)},
+                            geometry=gpd.points_from_xy(rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)),
+                            crs=crs)
+
+
+def scale_layer(gdf, scale, spread=0.01, seed=0):
+    '''
+    Make a layer (roughly) scale times larger, by adding copies of each feature shifted by a small random offset.
+
+    :param gdf: the GeoDataFrame to scale
+    :param scale: the number of copies of the layer to make
+    :param spread: the standard deviation of the offset of each copy, as a fraction of the width of the layer
+    :param seed: the seed for the random number generator
+
+    :returns scaled: a GeoDataFrame with len(gdf) * scale features
+    '''
+    if scale == 1:
+        return gdf.reset_index(drop=True)
+
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    offsets = rng.normal(0, spread * max(xmax - xmin, ymax - ymin), (scale - 1, 2))
+
+    copies = [gdf] + [gdf.assign(**{gdf.geometry.name: gdf.geometry.translate(dx, dy)}) for dx, dy in offsets]
+    return gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=gdf.crs)
+
+
+def scale_table(df, scale, x='lon', y='lat', spread=0.01, seed=0):
+    '''
+    Make a table of point coordinates (e.g., GPSPoints.txt) scale times larger, by adding jittered copies of each row.
+
+    :param df: the DataFrame to scale
+    :param scale: the number of copies of the table to make
+    :param x: the name of the x (longitude) column
+    :param y: the name of the y (latitude) column
+    :param spread: the standard deviation of the jitter, in the units of the coordinates
+    :param seed: the seed for the random number generator
+
+    :returns scaled: a DataFrame with len(df) * scale rows
+    '''
+    rng = np.random.default_rng(seed)
+    scaled = pd.concat([df] * scale, ignore_index=True)
+    if scale > 1:
+        scaled.loc[len(df):, x] += rng.normal(0, spread, len(scaled) - len(df))
+        scaled.loc[len(df):, y] += rng.normal(0, spread, len(scaled) - len(df))
+    return scaled
+
+
+def scale_raster(array, scale):
+    '''
+    Make a raster scale times larger, by tiling it in the row and column directions. The last column of tiles is
+    cut short so that the number of pixels is scale times the original (to within one column).
+
+    :param array: the 2D (or 3D, with bands first) array to scale
+    :param scale: the factor to scale the number of pixels by
+
+    :returns scaled: the tiled array
+    '''
+    rows = max(1, int(round(np.sqrt(scale))))
+    cols = int(np.ceil(scale / rows))
+    reps = (rows, cols) if array.ndim == 2 else (1, rows, cols)
+    width = int(round(scale * array.shape[-1] / rows))
+    return np.ascontiguousarray(np.tile(array, reps)[..., :width])
+
+
+def load_layer(name, scale=1, crs=None):
+    '''
+    Load one of the shipped datasets (see DATA_FILES) and scale it up. If the file is not present, a synthetic layer
+    with a similar number of features is used instead.
+
+    :param name: the name of the dataset (roads, wards, rivers, water)
+    :param scale: the factor to scale the number of features by
+    :param crs: if given, the layer is re-projected to this CRS
+
+    :returns gdf: the (scaled) GeoDataFrame
+    '''
+    fn = os.path.join(REPO_ROOT, DATA_FILES[name])
+    if os.path.exists(fn):
+        gdf = scale_layer(gpd.read_file(fn), scale)
+    elif name == 'wards':
+        gdf = random_zones(462 * scale, vertices=200, radius=3000.)
+    elif name == 'water':
+        gdf = random_zones(21 * scale, vertices=2000, radius=2000.)
+    else:
+        gdf = random_lines({'roads': 25000, 'rivers': 7000}[name] * scale, vertices=20)
+
+    return gdf if crs is None else gdf.to_crs(crs)
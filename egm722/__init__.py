@@ -0,0 +1,11 @@
+'''
+Helper functions for the EGM722 practicals.
+
+The modules in this package are imported by the weekly scripts and notebooks, which add the repository root to
+sys.path before importing (e.g., sys.path.append('..') from inside one of the Week folders).
+'''
+import os
+
+
+# the directory used to cache intermediate results (decoded rasters, spatial join tables, ...) between runs
+CACHE_ROOT = os.environ.get('EGM722_CACHE', os.path.join(os.path.expanduser('~'), '.egm722_cache'))
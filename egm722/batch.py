@@ -0,0 +1,313 @@
+'''
+Render the same map template for many extents or attributes, using a pool of processes.
+
+The Week 2 and Week 3 scripts each build one figure and save it with savefig('map.png', dpi=300). To make hundreds
+of maps from the same template (for example, one for each county, or one for each attribute of the wards),
+render_maps():
+
+- loads (and projects) each layer of the template once, in the parent process. Where processes are started with
+  fork, the workers share these layers with the parent; otherwise, each worker loads them once when it starts;
+- converts each layer into matplotlib paths once, so that each map only has to pick out the features that are
+  inside its extent;
+- draws each map on its own (non-pyplot) figure, and reports the total throughput in maps per minute.
+
+A template is a list of layers, each given as a dict. For example, the map from the Week 2 script is:
+
+    layers = [{'fn': 'data_files/NI_outline.shp', 'style': dict(edgecolor='k', facecolor='w')},
+              {'fn': 'data_files/Counties.shp', 'column': 'CountyName', 'legend_format': str.title,
+               'colors': ['firebrick', 'seagreen', 'royalblue', 'coral', 'violet', 'cornsilk'],
+               'style': dict(edgecolor='k', linewidth=1, alpha=0.25)},
+              {'fn': 'data_files/Water.shp', 'label': 'Lakes',
+               'style': dict(edgecolor='mediumblue', facecolor='mediumblue', linewidth=1)},
+              {'fn': 'data_files/Rivers.shp', 'label': 'Rivers', 'style': dict(edgecolor='royalblue', linewidth=0.2)},
+              {'fn': 'data_files/Towns.shp', 'label': 'Towns', 'labels': 'TOWN_NAME',
+               'style': dict(marker='s', color='0.5', ms=6)}]
+    template = MapTemplate(layers, crs=ccrs.UTM(29))
+
+The keys that each layer can have are:
+
+- 'fn': the filename of the layer, or 'data': a GeoDataFrame
+- 'epsg': if given, the layer is re-projected to this EPSG code when it is loaded
+- 'style': keyword arguments for the collection (or, for point layers, for ax.plot())
+- 'column': the column used to color the features. Text columns are drawn using 'colors' (a list, or a dict of
+  {category: color}); number columns are drawn using 'cmap', 'vmin' and 'vmax', with a colorbar.
+- 'label': the name of the layer in the legend. Categorical layers add one legend entry for each category, using
+  'legend_format' to format the names.
+- 'labels': (point layers only) a column of text labels to add using egm722.labels.add_labels()
+'''
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import cartopy.crs as ccrs
+import matplotlib.axes as maxes
+import matplotlib.colors as mcolors
+import matplotlib.cm as mcm
+import matplotlib.lines as mlines
+import matplotlib.patches as mpatches
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+from egm722.labels import add_labels
+from egm722.mapping import category_colors, category_handles, geometry_path, project_geometries
+from egm722.reproject import to_crs
+
+
+_TEMPLATE = None  # the template used by each worker process
+
+
+def scale_bar(ax, location=(0.92, 0.95), length=20):
+    '''
+    Add a scale bar (in km) to a map, in the same style as scale_bar() from the Week 2 script.
+
+    :param ax: the cartopy GeoAxes to add the scale bar to
+    :param location: the location of the right-hand end of the scale bar, as a fraction of the axes
+    :param length: the length of the scale bar, in km
+    '''
+    llx0, llx1, lly0, lly1 = ax.get_extent(ccrs.PlateCarree())
+    sbllx = (llx1 + llx0) / 2
+    sblly = lly0 + (lly1 - lly0) * location[1]
+
+    tmc = ccrs.TransverseMercator(sbllx, sblly)
+    x0, x1, y0, y1 = ax.get_extent(tmc)
+    sbx = x0 + (x1 - x0) * location[0]
+    sby = y0 + (y1 - y0) * location[1]
+
+    full, half = length * 1000, length * 500
+    ax.plot([sbx, sbx - full], [sby, sby], color='k', linewidth=9, transform=tmc)
+    ax.plot([sbx, sbx - half], [sby, sby], color='k', linewidth=6, transform=tmc)
+    ax.plot([sbx - half, sbx - full], [sby, sby], color='w', linewidth=6, transform=tmc)
+
+    offset = full * 0.225
+    ax.text(sbx, sby - offset, '{} km'.format(length), transform=tmc, fontsize=8)
+    ax.text(sbx - half - offset / 2, sby - offset, '{:g} km'.format(length / 2), transform=tmc, fontsize=8)
+    ax.text(sbx - full - offset, sby - offset, '0 km', transform=tmc, fontsize=8)
+
+
+class MapTemplate(object):
+    '''
+    The layers, styling, legend, gridlines and scale bar of a map, which can be rendered for different extents or
+    attributes.
+    '''
+
+    def __init__(self, layers, crs, projection=None, figsize=(10, 10), dpi=300, legend_args=None,
+                 gridline_args=None, scale_bar=True):
+        '''
+        :param layers: a list of dicts describing each layer, in drawing order (see the module documentation)
+        :param crs: the cartopy CRS of the layers (e.g., ccrs.UTM(29))
+        :param projection: the cartopy CRS of the map. If None, uses ccrs.Mercator(), as in the Week 2 script.
+        :param figsize: the size of the figure, in inches
+        :param dpi: the resolution of the saved maps
+        :param legend_args: keyword arguments to pass to ax.legend(). Set to False to leave out the legend.
+        :param gridline_args: keyword arguments to pass to ax.gridlines(). Set to False to leave out the gridlines.
+        :param scale_bar: whether to add a scale bar to the map
+        '''
+        self.layers = [dict(layer) for layer in layers]
+        self.crs = crs
+        self.projection = ccrs.Mercator() if projection is None else projection
+        self.figsize = figsize
+        self.dpi = dpi
+        self.legend_args = dict(title='Legend', title_fontsize=14, fontsize=12, loc='upper left', frameon=True,
+                                framealpha=1) if legend_args is None else legend_args
+        self.gridline_args = dict(draw_labels=True) if gridline_args is None else gridline_args
+        self.scale_bar = scale_bar
+        self._data = None
+
+    def __getstate__(self):
+        # don't send the loaded layers to other processes - they either share them (fork), or load them themselves
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def load(self):
+        '''
+        Load each layer, project it into the map projection, and convert each feature into a matplotlib path.
+
+        :returns data: a list with a dict for each layer, containing the GeoDataFrame, paths and bounds
+        '''
+        if self._data is not None:
+            return self._data
+
+        self._data = []
+        for layer in self.layers:
+            gdf = layer['data'] if 'data' in layer else gpd.read_file(layer['fn'])
+            if 'epsg' in layer:
+                gdf = to_crs(gdf, epsg=layer['epsg'])
+
+            geoms = project_geometries(gdf.geometry.values, self.crs, self.projection)
+            bounds = np.array([geom.bounds if geom is not None and not geom.is_empty else (np.nan,) * 4
+                               for geom in geoms], dtype=float).reshape(-1, 4)
+            is_point = len(gdf) > 0 and bool(gdf.geom_type.isin(['Point']).all())
+            paths = None if is_point else [geometry_path(geom) for geom in geoms]
+
+            self._data.append({'gdf': gdf, 'paths': paths, 'bounds': bounds, 'is_point': is_point})
+        return self._data
+
+    def full_extent(self):
+        '''
+        Get the extent of all of the layers, in the CRS of the layers.
+
+        :returns extent: the (xmin, xmax, ymin, ymax) of the layers
+        '''
+        bounds = np.array([data['gdf'].total_bounds for data in self.load()])
+        return bounds[:, 0].min(), bounds[:, 2].max(), bounds[:, 1].min(), bounds[:, 3].max()
+
+    def _visible(self, data, extent):
+        # the features of a layer whose bounds intersect the (projected) map extent
+        xmin, xmax, ymin, ymax = extent
+        bounds = data['bounds']
+        with np.errstate(invalid='ignore'):
+            return np.flatnonzero((bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) &
+                                  (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin))
+
+    def _add_layer(self, fig, ax, layer, data, column, extent):
+        # draw a single layer, and return the legend handles and labels for it
+        gdf = data['gdf']
+        style = dict(layer.get('style', {}))
+        visible = self._visible(data, extent)
+
+        if data['is_point']:
+            xy = self.projection.transform_points(self.crs, gdf.geometry.x.values, gdf.geometry.y.values)
+            handles = ax.plot(xy[visible, 0], xy[visible, 1], linestyle='none', **style)
+            if 'labels' in layer:
+                names = gdf[layer['labels']].iloc[visible].astype(str).str.title()
+                add_labels(ax, xy[visible, 0], xy[visible, 1], names, fontsize=8)
+            return handles, [layer.get('label', '')]
+
+        paths = [data['paths'][ii] for ii in visible]
+        style.setdefault('zorder', 1.5)
+        if column is None:
+            style.setdefault('facecolor', 'none')
+            ax.add_collection(PathCollection(paths, transform=ax.transData, **style), autolim=False)
+            if 'label' not in layer:
+                return [], []
+            if style['facecolor'] == 'none':
+                handle = mlines.Line2D([], [], color=style.get('edgecolor', 'k'))
+            else:
+                handle = mpatches.Rectangle((0, 0), 1, 1, facecolor=style['facecolor'],
+                                            edgecolor=style.get('edgecolor', 'k'), alpha=style.get('alpha'))
+            return [handle], [layer['label']]
+
+        values = gdf[column].values
+        if pd.api.types.is_numeric_dtype(gdf[column]):
+            norm = mcolors.Normalize(layer.get('vmin', np.nanmin(values)), layer.get('vmax', np.nanmax(values)))
+            mappable = mcm.ScalarMappable(norm=norm, cmap=layer.get('cmap', 'viridis'))
+            facecolors = mappable.to_rgba(values[visible])
+            ax.add_collection(PathCollection(paths, facecolors=facecolors, transform=ax.transData, **style),
+                              autolim=False)
+            # add a colorbar that stays in line with the map, in the same way as the Week 3 exercise script
+            cax = make_axes_locatable(ax).append_axes('right', size='5%', pad=0.1, axes_class=maxes.Axes)
+            fig.colorbar(mappable, cax=cax, label=layer.get('label', column))
+            return [], []
+
+        colors = layer.get('colors', ['tomato', 'lightgreen', 'olive', 'darkmagenta', 'skyblue', 'gold'])
+        color_map = colors if isinstance(colors, dict) else category_colors(values, colors)
+        facecolors = [color_map[category] for category in values[visible]]
+        style.setdefault('edgecolor', 'k')
+        ax.add_collection(PathCollection(paths, facecolors=facecolors, transform=ax.transData, **style), autolim=False)
+
+        legend_format = layer.get('legend_format', str)
+        return category_handles(color_map, edge=style['edgecolor'], alpha=style.get('alpha', 1)), \
+            [legend_format(str(name)) for name in color_map]
+
+    def render(self, fn_out, extent=None, column=None, title=None):
+        '''
+        Render the template to a file.
+
+        :param fn_out: the filename to save the map to
+        :param extent: the (xmin, xmax, ymin, ymax) of the map, in the CRS of the layers. If None, uses the extent of
+            all of the layers.
+        :param column: if given, replaces the 'column' of every layer that has one (e.g., to map a different attribute)
+        :param title: the title of the map
+
+        :returns fn_out: the filename of the saved map
+        '''
+        extent = self.full_extent() if extent is None else extent
+
+        fig = Figure(figsize=self.figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1, projection=self.projection)
+        ax.set_extent(extent, crs=self.crs)
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+
+        handles, labels = [], []
+        for layer, data in zip(self.layers, self.load()):
+            layer_column = layer.get('column')
+            if layer_column is not None and column is not None:
+                layer_column = column
+            layer_handles, layer_labels = self._add_layer(fig, ax, layer, data, layer_column, (x0, x1, y0, y1))
+            handles += list(layer_handles)
+            labels += layer_labels
+
+        if self.legend_args is not False and len(handles) > 0:
+            ax.legend(handles, labels, **self.legend_args)
+        if self.gridline_args is not False:
+            ax.gridlines(**self.gridline_args)
+        if self.scale_bar:
+            scale_bar(ax)
+        if title is not None:
+            ax.set_title(title)
+
+        ax.set_extent(extent, crs=self.crs)
+        fig.savefig(fn_out, bbox_inches='tight', dpi=self.dpi)
+        return fn_out
+
+
+def _init_worker(template):
+    global _TEMPLATE
+    if template is not None:
+        _TEMPLATE = template
+    _TEMPLATE.load()  # does nothing if the layers were already loaded before the process was forked
+
+
+def _render_job(job):
+    return _TEMPLATE.render(**job)
+
+
+def render_maps(template, jobs, out_dir='.', max_workers=None):
+    '''
+    Render a map template for a list of extents and/or attribute columns, using a pool of processes.
+
+    :param template: the MapTemplate to render
+    :param jobs: a list of dicts, each with a 'name' (used for the output filename), and optionally an 'extent',
+        'column' and 'title' (see MapTemplate.render())
+    :param out_dir: the directory to save the maps to
+    :param max_workers: the number of processes to use. If 1, the maps are rendered in this process.
+
+    :returns filenames, maps_per_minute: the filenames of the saved maps, and the total throughput
+    '''
+    global _TEMPLATE
+    os.makedirs(out_dir, exist_ok=True)
+
+    render_jobs = []
+    for job in jobs:
+        job = dict(job)
+        job['fn_out'] = os.path.join(out_dir, '{}.png'.format(job.pop('name')))
+        render_jobs.append(job)
+
+    tic = time.perf_counter()
+    template.load()  # load the layers once, before any workers are started
+    _TEMPLATE = template
+
+    if max_workers == 1:
+        filenames = [_render_job(job) for job in render_jobs]
+    else:
+        # with fork, the workers share the layers that have already been loaded; otherwise, each one loads them once
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context, initargs = multiprocessing.get_context('fork'), (None,)
+        else:
+            context, initargs = multiprocessing.get_context(), (template,)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            filenames = list(pool.map(_render_job, render_jobs))
+
+    elapsed = time.perf_counter() - tic
+    maps_per_minute = 60 * len(filenames) / elapsed if elapsed > 0 else float('inf')
+    print('Rendered {} maps in {:.1f} s ({:.1f} maps per minute)'.format(len(filenames), elapsed, maps_per_minute))
+
+    return filenames, maps_per_minute
@@ -0,0 +1,162 @@
+'''
+A catalog of the practical datasets, so that scripts can load layers by name rather than by absolute path:
+
+    from egm722 import catalog
+
+    counties = catalog.load('counties', epsg=32629)
+    roads_itm = catalog.load('roads', epsg=2157)
+
+    with rio.open(catalog.path('landcover')) as dataset:
+        ...
+
+Names are looked up relative to the repository root (or the EGM722_DATA environment variable, if it is set), so the
+scripts work wherever the repository is cloned.
+
+Loaded layers are kept in memory for the rest of the session, keyed by a hash of the file contents rather than the
+filename, so that identical copies of a file (e.g., the same shapefile in two Week folders) are only read once. Each
+re-projected version is kept as well, so scripts that are run one after another in the same session (e.g., using %run
+in a notebook) share one read per unique dataset. load() returns a copy of the stored layer, so changes made to it by
+a script don't affect the others.
+'''
+import os
+import hashlib
+import threading
+import geopandas as gpd
+from pyproj import CRS
+from egm722 import profiling
+from egm722.hashing import file_hash, hashed_files
+from egm722.reproject import to_crs
+
+
+DATA_ROOT = os.environ.get('EGM722_DATA', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# the file(s) for each dataset, relative to DATA_ROOT. If there is more than one, the first one that exists is used.
+DATASETS = {'outline': ['Week2/data_files/NI_outline.shp'],
+            'counties': ['Week2/data_files/Counties.shp', 'Week3/data_files/Counties.shp'],
+            'towns': ['Week2/data_files/Towns.shp'],
+            'water': ['Week2/data_files/Water.shp'],
+            'rivers': ['Week2/data_files/Rivers.shp'],
+            'roads': ['Week3/data_files/NI_roads.shp'],
+            'wards': ['Week3/data_files/NI_Wards.shp'],
+            'glaciers': ['Week1/data_files/Glaciers.shp'],
+            'gps': ['Week1/data_files/GPSPoints.txt'],
+            'landcover': ['Week5/data_files/LCM2015_Aggregate_100m.tif'],
+            'dem': ['Week5/data_files/NI_DEM.tif']}
+
+_layers = {}  # {(file hash, crs, read options): GeoDataFrame}
+_hashes = {}  # {((filename, size, modified time) of each file): file hash}
+_lock = threading.RLock()
+
+
+def register(name, *fns):
+    '''
+    Add a dataset to the catalog, or change the file(s) used for an existing dataset.
+
+    :param name: the name of the dataset
+    :param fns: one or more filenames, either absolute or relative to DATA_ROOT. The first one that exists is used.
+    '''
+    DATASETS[name] = list(fns)
+
+
+def path(name):
+    '''
+    Find the file for a dataset.
+
+    :param name: the name of the dataset (a key of DATASETS), or a filename
+
+    :returns fn: the absolute filename of the dataset
+    '''
+    if name not in DATASETS:
+        if os.path.exists(name):
+            return os.path.abspath(name)
+        raise KeyError('Unknown dataset {}. Available datasets are: {}'.format(name, ', '.join(sorted(DATASETS))))
+
+    candidates = [os.path.abspath(os.path.join(DATA_ROOT, fn)) for fn in DATASETS[name]]
+    for fn in candidates:
+        if os.path.exists(fn):
+            return fn
+    raise FileNotFoundError('No file found for dataset {}. Tried: {}'.format(name, ', '.join(candidates)))
+
+
+def content_hash(fn):
+    '''
+    Get the hash of a file's contents, only re-hashing the file if its size or modification time (or those of any
+    of its sidecar files, such as the .dbf of a shapefile) have changed.
+
+    :param fn: the filename
+
+    :returns digest: the hexadecimal SHA1 hash from egm722.hashing.file_hash()
+    '''
+    # editing only the attributes of a shapefile re-writes the .dbf, but not the .shp
+    stats = [(this_fn, os.stat(this_fn)) for this_fn in hashed_files(os.path.abspath(fn))]
+    key = tuple((this_fn, stat.st_size, stat.st_mtime_ns) for this_fn, stat in stats)
+    with _lock:
+        if key not in _hashes:
+            _hashes[key] = file_hash(fn)
+        return _hashes[key]
+
+
+def key(name, crs=None, epsg=None, **read_args):
+    '''
+    Get a key for the layer that load() returns for the same arguments, that changes whenever the file contents
+    change - for example, to use as a cache key (see egm722.join_cache.cached_sjoin()) without hashing the geometries.
+
+    :param name: the name of the dataset (a key of DATASETS), or a filename
+    :param crs: the CRS that the layer is re-projected to
+    :param epsg: the EPSG code of the CRS that the layer is re-projected to (used if crs is None)
+    :param read_args: additional keyword arguments passed to gpd.read_file()
+
+    :returns key: a hexadecimal SHA1 hash
+    '''
+    if crs is None and epsg is not None:
+        crs = 'epsg:{}'.format(epsg)
+    crs_key = None if crs is None else CRS.from_user_input(crs).to_wkt()
+    options = '{}|{}|{!r}'.format(content_hash(path(name)), crs_key, sorted(read_args.items()))
+    return hashlib.sha1(options.encode('utf-8')).hexdigest()
+
+
+def load(name, crs=None, epsg=None, copy=True, **read_args):
+    '''
+    Load a vector dataset by name, re-projected to a given CRS, re-using the copy in memory if the same file
+    contents have been loaded (and re-projected) before.
+
+    :param name: the name of the dataset (a key of DATASETS), or a filename
+    :param crs: the CRS to re-project the layer to. If crs and epsg are both None, the layer is not re-projected.
+    :param epsg: the EPSG code of the CRS to re-project the layer to (used if crs is None)
+    :param copy: return a copy of the stored layer. Only use copy=False if the layer will not be changed.
+    :param read_args: additional keyword arguments to pass to gpd.read_file()
+
+    :returns gdf: the GeoDataFrame
+    '''
+    fn = path(name)
+    digest = content_hash(fn)
+    options = repr(sorted(read_args.items()))
+
+    if crs is None and epsg is not None:
+        crs = 'epsg:{}'.format(epsg)
+    crs_key = None if crs is None else CRS.from_user_input(crs).to_wkt()
+
+    with _lock:
+        gdf = _layers.get((digest, crs_key, options))
+        if gdf is None:
+            gdf = _layers.get((digest, None, options))
+            if gdf is None:
+                with profiling.span('read_file') as this_span:
+                    gdf = gpd.read_file(fn, **read_args)
+                    this_span.count = len(gdf)
+                _layers[(digest, None, options)] = gdf
+            if crs_key is not None:
+                with profiling.span('to_crs', count=len(gdf)):
+                    gdf = to_crs(gdf, crs=crs)
+                _layers[(digest, crs_key, options)] = gdf
+
+    return gdf.copy() if copy else gdf
+
+
+def clear():
+    '''
+    Remove all of the stored layers from memory.
+    '''
+    with _lock:
+        _layers.clear()
+        _hashes.clear()
@@ -0,0 +1,264 @@
+'''
+Read and write GeoDataFrames as columnar GeoParquet (or Feather/Arrow) files.
+
+Shapefiles are written and read one record at a time, and limit field names to 10 characters. GeoParquet files store
+each column (including the geometry, as WKB) separately, in compressed blocks of rows called row groups. When writing
+with write_parquet(), we also store the bounding box of every feature (bbox_xmin, bbox_ymin, bbox_xmax, bbox_ymax
+columns), and of every row group (in the file metadata). read_parquet() uses these to skip whole row groups that are
+outside of a bounding box, or that can't match an attribute filter, before decoding any of the geometries.
+
+Filtering works best when nearby features are stored in the same row groups - for example, after sorting a layer
+spatially.
+'''
+import os
+import json
+import operator
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather
+import pyarrow.parquet as pq
+from pyproj import CRS
+
+
+BBOX_COLUMNS = ['bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax']
+ROW_GROUP_KEY = b'egm722:row_group_bboxes'
+ROW_GROUP_SIZE = 65536
+
+# the operators that can be used in attribute filters, and how they compare to the (min, max) statistics of a
+# row group: if the test returns False, no row in the row group can match.
+OPERATORS = {
+    '==': (operator.eq, lambda vmin, vmax, val: vmin <= val <= vmax),
+    '!=': (operator.ne, lambda vmin, vmax, val: not vmin == vmax == val),
+    '<': (operator.lt, lambda vmin, vmax, val: vmin < val),
+    '<=': (operator.le, lambda vmin, vmax, val: vmin <= val),
+    '>': (operator.gt, lambda vmin, vmax, val: vmax > val),
+    '>=': (operator.ge, lambda vmin, vmax, val: vmax >= val),
+    'in': (None, lambda vmin, vmax, val: any(vmin <= v <= vmax for v in val)),
+    'not in': (None, lambda vmin, vmax, val: True),
+}
+
+
+def _geo_metadata(gdf):
+    # the GeoParquet 'geo' metadata for the geometry column
+    geoms = gdf.geometry
+    crs = None if geoms.crs is None else json.loads(geoms.crs.to_json())
+    return {'version': '1.0.0',
+            'primary_column': geoms.name,
+            'columns': {geoms.name: {'encoding': 'WKB',
+                                     'geometry_types': sorted(set(geoms.geom_type.dropna())),
+                                     'crs': crs,
+                                     'bbox': [float(v) for v in geoms.total_bounds]}}}
+
+
+def to_arrow(gdf):
+    '''
+    Convert a GeoDataFrame to a pyarrow Table, with the geometry encoded as WKB and the bounding box of each feature
+    stored in the bbox_xmin, bbox_ymin, bbox_xmax, bbox_ymax columns.
+
+    :param gdf: the GeoDataFrame to convert
+
+    :returns table: the pyarrow Table
+    '''
+    geoms = gdf.geometry
+    df = pd.DataFrame(gdf.drop(columns=geoms.name))
+    df[geoms.name] = np.asarray(geoms.to_wkb(), dtype=object)
+    df[BBOX_COLUMNS] = geoms.bounds.to_numpy()
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(_geo_metadata(gdf)).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+
+def from_arrow(table):
+    '''
+    Convert a pyarrow Table written by to_arrow() (or any GeoParquet table with WKB geometries) to a GeoDataFrame.
+
+    :param table: the pyarrow Table
+
+    :returns gdf: the GeoDataFrame
+    '''
+    metadata = table.schema.metadata or {}
+    geo = json.loads(metadata[b'geo']) if b'geo' in metadata else None
+    geom_col = 'geometry' if geo is None else geo['primary_column']
+    crs = None if geo is None else geo['columns'][geom_col].get('crs')
+
+    df = table.to_pandas()
+    df = df.drop(columns=[col for col in BBOX_COLUMNS if col in df.columns])
+    df[geom_col] = gpd.GeoSeries.from_wkb(df[geom_col], crs=None if crs is None else CRS.from_json_dict(crs))
+    return gpd.GeoDataFrame(df, geometry=geom_col)
+
+
+def write_parquet(gdf, fn, row_group_size=ROW_GROUP_SIZE, compression='snappy'):
+    '''
+    Write a GeoDataFrame to a GeoParquet file, with per-feature and per-row group bounding boxes.
+
+    :param gdf: the GeoDataFrame to write
+    :param fn: the output filename
+    :param row_group_size: the number of rows in each row group
+    :param compression: the compression to use ('snappy', 'zstd', 'gzip', or None)
+    '''
+    table = to_arrow(gdf.reset_index(drop=True))
+
+    bounds = gdf.geometry.bounds.to_numpy()
+    row_groups = []
+    for start in range(0, max(len(gdf), 1), row_group_size):
+        rg = bounds[start:start + row_group_size]
+        row_groups.append([float(np.nanmin(rg[:, 0])), float(np.nanmin(rg[:, 1])),
+                           float(np.nanmax(rg[:, 2])), float(np.nanmax(rg[:, 3]))] if len(rg) else None)
+
+    metadata = dict(table.schema.metadata)
+    metadata[ROW_GROUP_KEY] = json.dumps(row_groups).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+
+    pq.write_table(table, fn, row_group_size=row_group_size, compression=compression)
+
+
+def write_feather(gdf, fn, compression='lz4'):
+    '''
+    Write a GeoDataFrame to a Feather (Arrow IPC) file, with WKB geometries and per-feature bounding boxes.
+
+    Feather files are very fast to read in full, but (unlike GeoParquet) can't skip blocks of rows when filtering.
+
+    :param gdf: the GeoDataFrame to write
+    :param fn: the output filename
+    :param compression: the compression to use ('lz4', 'zstd', or 'uncompressed')
+    '''
+    pa.feather.write_feather(to_arrow(gdf.reset_index(drop=True)), fn, compression=compression)
+
+
+def _bbox_mask(table, bbox):
+    # which rows of a table have a bounding box that intersects bbox
+    xmin, ymin, xmax, ymax = bbox
+    return pc.and_(pc.and_(pc.less_equal(table['bbox_xmin'], xmax), pc.greater_equal(table['bbox_xmax'], xmin)),
+                   pc.and_(pc.less_equal(table['bbox_ymin'], ymax), pc.greater_equal(table['bbox_ymax'], ymin)))
+
+
+def _filter_mask(table, filters):
+    # which rows of a table match all of the (column, op, value) filters
+    mask = None
+    for col, op, val in filters:
+        values = table[col].to_pandas()
+        if op == 'in':
+            this = values.isin(val).to_numpy()
+        elif op == 'not in':
+            this = ~values.isin(val).to_numpy()
+        else:
+            this = OPERATORS[op][0](values, val).to_numpy()
+        mask = this if mask is None else mask & this
+    return pa.array(mask)
+
+
+def _row_group_matches(metadata, ii, bbox, rg_bbox, filters, names):
+    # check the row group bounding box and column statistics to see whether any rows could match
+    if bbox is not None and rg_bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        rxmin, rymin, rxmax, rymax = rg_bbox
+        if rxmin > xmax or rxmax < xmin or rymin > ymax or rymax < ymin:
+            return False
+
+    row_group = metadata.row_group(ii)
+    for col, op, val in filters:
+        stats = row_group.column(names.index(col)).statistics
+        if stats is None or not stats.has_min_max:
+            continue
+        try:
+            if not OPERATORS[op][1](stats.min, stats.max, val):
+                return False
+        except TypeError:  # e.g., comparing a string column with a number
+            continue
+    return True
+
+
+def read_parquet(fn, bbox=None, columns=None, filters=None):
+    '''
+    Read a GeoParquet file written by write_parquet(), only decoding the row groups and rows that match a bounding box
+    and attribute filters.
+
+    :param fn: the filename to read
+    :param bbox: (xmin, ymin, xmax, ymax) - only read features whose bounding box intersects this box
+    :param columns: a list of (non-geometry) columns to read. If None, all columns are read.
+    :param filters: a list of (column, op, value) tuples, e.g. [('Road_class', '==', 'MOTORWAY')], that must all be
+        True for a feature to be read. op can be one of ==, !=, <, <=, >, >=, in, not in.
+
+    :returns gdf: the GeoDataFrame
+    '''
+    filters = [] if filters is None else list(filters)
+    for _, op, _ in filters:
+        if op not in OPERATORS:
+            raise ValueError('op must be one of {}'.format(', '.join(OPERATORS)))
+
+    pfile = pq.ParquetFile(fn)
+    schema = pfile.schema_arrow
+    geo = json.loads(schema.metadata[b'geo'])
+    names = schema.names
+
+    rg_bboxes = schema.metadata.get(ROW_GROUP_KEY)
+    rg_bboxes = json.loads(rg_bboxes) if rg_bboxes is not None else [None] * pfile.num_row_groups
+
+    keep = [ii for ii in range(pfile.num_row_groups)
+            if _row_group_matches(pfile.metadata, ii, bbox, rg_bboxes[ii], filters, names)]
+
+    # read the requested columns, plus anything we need to filter with
+    wanted = [col for col in names if col not in BBOX_COLUMNS and col != geo['primary_column']]
+    wanted = wanted if columns is None else list(columns)
+    extra = [col for col, _, _ in filters if col not in wanted]
+    if bbox is not None:
+        extra += BBOX_COLUMNS
+    read_cols = wanted + [geo['primary_column']] + [col for col in dict.fromkeys(extra) if col not in wanted]
+
+    table = pfile.read_row_groups(keep, columns=read_cols) if keep else schema.empty_table().select(read_cols)
+
+    if bbox is not None and table.num_rows > 0:
+        table = table.filter(_bbox_mask(table, bbox))
+    if filters and table.num_rows > 0:
+        table = table.filter(_filter_mask(table, filters))
+
+    table = table.select(wanted + [geo['primary_column']]).replace_schema_metadata(schema.metadata)
+    return from_arrow(table)
+
+
+def read_feather(fn, bbox=None, columns=None, filters=None):
+    '''
+    Read a Feather file written by write_feather(), filtering by bounding box and attributes.
+
+    :param fn: the filename to read
+    :param bbox: (xmin, ymin, xmax, ymax) - only keep features whose bounding box intersects this box
+    :param columns: a list of (non-geometry) columns to read. If None, all columns are read.
+    :param filters: a list of (column, op, value) tuples (see read_parquet)
+
+    :returns gdf: the GeoDataFrame
+    '''
+    filters = [] if filters is None else list(filters)
+    table = pa.feather.read_table(fn, memory_map=True)
+    geo = json.loads(table.schema.metadata[b'geo'])
+
+    if bbox is not None:
+        table = table.filter(_bbox_mask(table, bbox))
+    if filters:
+        table = table.filter(_filter_mask(table, filters))
+
+    if columns is not None:
+        table = table.select(list(columns) + [geo['primary_column']])
+    return from_arrow(table)
+
+
+def write_columnar(gdf, fn, **kwargs):
+    '''
+    Write a GeoDataFrame to a GeoParquet (.parquet) or Feather (.feather, .arrow) file, depending on the extension.
+    '''
+    if os.path.splitext(fn)[1].lower() == '.parquet':
+        return write_parquet(gdf, fn, **kwargs)
+    return write_feather(gdf, fn, **kwargs)
+
+
+def read_columnar(fn, bbox=None, columns=None, filters=None):
+    '''
+    Read a GeoParquet (.parquet) or Feather (.feather, .arrow) file, depending on the extension.
+    '''
+    if os.path.splitext(fn)[1].lower() == '.parquet':
+        return read_parquet(fn, bbox, columns, filters)
+    return read_feather(fn, bbox, columns, filters)
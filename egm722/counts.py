@@ -0,0 +1,114 @@
+'''
+Fast counting of the unique values (e.g., land cover classes) in a raster.
+
+The count_unique() function in the Week 5 practical scans the whole array once for every unique value:
+
+    for val in np.unique(array):
+        count_dict[str(val)] = np.count_nonzero(array == val)
+
+and each scan creates a new boolean array the same size as the raster. Here, integer rasters are counted in a single
+pass using np.bincount(), falling back to a sort-based count (np.unique) for floating-point or sparse values. The
+counts are returned as {value: count} dicts, which can be merged across raster blocks using merge_counts().
+'''
+import numpy as np
+
+
+CHUNK_SIZE = 2 ** 22  # the number of pixels to pass to np.bincount at a time
+MAX_SPARSITY = 4  # use np.unique if the range of values is more than this many times the number of pixels
+
+
+def _bincount(values, vmin, nbins):
+    # count integer values in chunks, so that the cast to np.intp (done by np.bincount) doesn't copy the whole array
+    counts = np.zeros(nbins, dtype=np.int64)
+    for start in range(0, values.size, CHUNK_SIZE):
+        chunk = values[start:start + CHUNK_SIZE].astype(np.int64)
+        if vmin != 0:
+            chunk -= vmin
+        counts += np.bincount(chunk, minlength=nbins)
+    return counts
+
+
+def value_counts(array, nodata=None):
+    '''
+    Count the number of times each unique value occurs in an array.
+
+    Integer (and boolean) arrays are counted in a single pass using np.bincount(); floating-point arrays, or integer
+    arrays whose values are spread over a range much larger than the number of pixels, are counted using np.unique().
+    NaN values are never counted.
+
+    :param array: the array of values to count
+    :param nodata: a value to ignore in the counting
+
+    :returns values, counts: arrays of the unique values (sorted) and the number of times each occurs
+    '''
+    values = np.asarray(array).ravel()
+    dtype = values.dtype  # bool arrays are counted as uint8, and converted back at the end
+    if values.size == 0:
+        return values[:0], np.zeros(0, dtype=np.int64)
+
+    if values.dtype == bool:
+        values = values.view(np.uint8)
+
+    if np.issubdtype(values.dtype, np.integer):
+        vmin, vmax = int(values.min()), int(values.max())
+        nbins = vmax - vmin + 1
+        if nbins <= MAX_SPARSITY * values.size + 256:
+            counts = _bincount(values, vmin, nbins)
+            uniq = np.flatnonzero(counts)
+            values, counts = (uniq + vmin).astype(dtype), counts[uniq]
+        else:
+            values, counts = np.unique(values, return_counts=True)
+    else:
+        values, counts = np.unique(values, return_counts=True)
+        isnum = ~np.isnan(values) if np.issubdtype(values.dtype, np.floating) else slice(None)
+        values, counts = values[isnum], counts[isnum]
+
+    if nodata is not None:
+        keep = values != nodata
+        values, counts = values[keep], counts[keep]
+
+    return values, counts
+
+
+def count_values(array, nodata=None):
+    '''
+    Count the number of times each unique value occurs in an array, using value_counts().
+
+    :param array: the array of values to count
+    :param nodata: a value to ignore in the counting
+
+    :returns counts: a dict of {value: count}, using python scalars as keys (like rasterstats)
+    '''
+    values, counts = value_counts(array, nodata)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def merge_counts(total, counts):
+    '''
+    Add the counts from one dict of {value: count} to another - for example, to combine the counts from different
+    blocks of a raster.
+
+    :param total: the dict to update (in place)
+    :param counts: the dict of counts to add to total
+
+    :returns total: the updated dict
+    '''
+    for value, count in counts.items():
+        total[value] = total.get(value, 0) + count
+    return total
+
+
+def count_unique(array, nodata=0):
+    '''
+    Count the unique elements of an array.
+
+    A faster replacement for count_unique() from the Week 5 practical, which gives the same output.
+
+    :param array: Input array
+    :param nodata: nodata value to ignore in the counting
+
+    :returns count_dict: a dictionary of unique values (as strings) and counts
+    '''
+    values, counts = value_counts(array, nodata)
+    # str() of the numpy scalars, rather than python floats, so that float32 values give the same keys as the original
+    return {str(val): count for val, count in zip(values, counts.tolist())}
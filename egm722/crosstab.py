@@ -0,0 +1,146 @@
+'''
+Cross-tabulate zones, classes and binned values from aligned rasters in a single pass.
+
+In the Week 5 practical, each question about the rasters is answered with a new boolean scan (and often a new copy)
+of the whole array:
+
+    county_antrim = county_mask == 1
+    antrim_and_down = np.logical_or(county_mask == 3, county_mask == 1)
+    broad_els = dem[landcover == 1]
+    conif_els = dem[landcover == 2]
+    broad_count, _ = np.histogram(broad_els, el_bins)
+
+crosstab() instead combines the zone, class and value bin of each pixel into a single integer index, and counts all
+of the combinations at once using np.bincount(). The result is a (zone x class x bin) table of pixel counts - for
+example, county x landcover x elevation bin - from which every per-class or per-county histogram can be taken by
+indexing or summing, without masking the DEM again.
+'''
+import numpy as np
+import pandas as pd
+from egm722.counts import CHUNK_SIZE
+
+
+def _num_labels(array, num):
+    # the number of labels (max value + 1) of an integer array of zones or classes
+    if num is not None:
+        return int(num)
+    return int(array.max()) + 1 if array.size > 0 else 1
+
+
+def bin_index(values, bins):
+    '''
+    Find the bin that each value falls into, using the same rules as np.histogram(): each bin includes its left edge,
+    and the last bin also includes its right edge.
+
+    :param values: an array of values (e.g., elevations)
+    :param bins: an array of (increasing) bin edges
+
+    :returns index: an integer array of the bin index of each value, or -1 for values outside of the bins (or NaN)
+    '''
+    bins = np.asarray(bins)
+    nbins = len(bins) - 1
+    values = np.asarray(values)
+    index = np.full(values.shape, -1, dtype=np.intp)
+
+    width = np.diff(bins)
+    if not np.allclose(width, width[0]):
+        index[...] = np.searchsorted(bins, values, side='right') - 1
+        index[values == bins[-1]] = nbins - 1
+        index[(index < 0) | (index >= nbins)] = -1
+        return index
+
+    # for evenly-spaced bins (e.g., np.arange(0, 600, 5)), calculate the index directly, in the same way as
+    # np.histogram(), and then correct for any rounding errors right at the bin edges
+    inside = (values >= bins[0]) & (values <= bins[-1])
+    inside_values = values[inside]
+    inside_index = ((inside_values - bins[0]) * (nbins / (bins[-1] - bins[0]))).astype(np.intp)
+    inside_index[inside_index == nbins] -= 1
+    inside_index[inside_values < bins[inside_index]] -= 1
+    inside_index[(inside_values >= bins[inside_index + 1]) & (inside_index != nbins - 1)] += 1
+    index[inside] = inside_index
+    return index
+
+
+def select_zones(zones, ids):
+    '''
+    Create a mask of the pixels that belong to any of a list of zones, using a single lookup rather than one
+    comparison for each zone (e.g., np.logical_or(county_mask == 3, county_mask == 1)).
+
+    :param zones: an integer array of zone labels (e.g., county_mask)
+    :param ids: a list of the zone labels to select
+
+    :returns mask: a boolean array, True where zones is one of ids
+    '''
+    zones = np.asarray(zones)
+    lookup = np.zeros(max(_num_labels(zones, None), int(np.max(ids)) + 1), dtype=bool)
+    lookup[np.asarray(ids)] = True
+    return lookup[zones]
+
+
+def crosstab(zones, classes, values=None, bins=None, n_zones=None, n_classes=None, out=None):
+    '''
+    Count the number of pixels for each combination of zone, class, and value bin, in a single pass over the arrays.
+
+    :param zones: an integer array of zone labels (e.g., county_mask), or None to treat all pixels as one zone
+    :param classes: an integer array of class labels (e.g., landcover), the same shape as zones
+    :param values: an array of values to bin (e.g., dem), the same shape as classes. If None, only counts
+        (zone, class) pairs.
+    :param bins: the bin edges for values, as used by np.histogram()
+    :param n_zones: the number of zone labels (max label + 1). If None, uses the maximum value of zones.
+    :param n_classes: the number of class labels (max label + 1), worked out in the same way as n_zones
+    :param out: an existing table to add the counts to (e.g., when counting a raster block by block)
+
+    :returns table: an integer array of shape (n_zones, n_classes, n_bins) with the number of pixels in each
+        combination. Values outside of the bins (or NaN) are not counted.
+    '''
+    classes = np.asarray(classes).ravel()
+    zones = None if zones is None else np.asarray(zones).ravel()
+    values = None if values is None else np.asarray(values).ravel()
+
+    nz = 1 if zones is None else _num_labels(zones, n_zones)
+    nc = _num_labels(classes, n_classes)
+
+    for labels, num in [(classes, nc), (zones, nz)]:
+        if labels is not None and labels.size > 0 and (labels.min() < 0 or labels.max() >= num):
+            raise ValueError('Zone and class labels must be integers from 0 to n_zones - 1 (or n_classes - 1).')
+    nb = 1 if values is None else len(bins) - 1
+    size = nz * nc * nb
+
+    counts = np.zeros(size, dtype=np.int64)
+    for start in range(0, classes.size, CHUNK_SIZE):
+        index = classes[start:start + CHUNK_SIZE].astype(np.int64)
+        if zones is not None:
+            index += zones[start:start + CHUNK_SIZE].astype(np.int64) * nc
+        if values is not None:
+            value_bin = bin_index(values[start:start + CHUNK_SIZE], bins)
+            index = index * nb + value_bin
+            index = index[value_bin >= 0]
+        counts += np.bincount(index, minlength=size)
+
+    table = counts.reshape(nz, nc, nb)
+    if out is not None:
+        out += table
+        return out
+    return table
+
+
+def table_to_frame(table, bins=None, zone_names=None, class_names=None, pixel_area=1.):
+    '''
+    Convert a crosstab() table into a DataFrame, with one row for each (zone, class) pair that has any pixels.
+
+    :param table: the (zone x class x bin) table from crosstab()
+    :param bins: the bin edges used in crosstab(), used to label the columns
+    :param zone_names: a dict of {zone label: name}. Zones that are not in the dict keep their label.
+    :param class_names: a dict of {class label: name}. Classes that are not in the dict keep their label.
+    :param pixel_area: the area of one pixel, to convert pixel counts into areas
+
+    :returns frame: a DataFrame indexed by (zone, class), with one column for each bin
+    '''
+    zone_names = {} if zone_names is None else zone_names
+    class_names = {} if class_names is None else class_names
+
+    zz, cc = np.nonzero(table.sum(axis=2))
+    index = pd.MultiIndex.from_arrays([[zone_names.get(z, z) for z in zz], [class_names.get(c, c) for c in cc]],
+                                      names=['zone', 'class'])
+    columns = None if bins is None else ['{}-{}'.format(lo, hi) for lo, hi in zip(bins[:-1], bins[1:])]
+    return pd.DataFrame(table[zz, cc] * pixel_area, index=index, columns=columns)
@@ -0,0 +1,111 @@
+'''
+Space-filling curve (Hilbert and Z-order) keys for the features of a layer.
+
+Sorting features by the position of their center along a space-filling curve puts features that are close together
+on the ground close together in the sorted order, so that any contiguous run of sorted features covers a small,
+compact area. This is used to split layers into spatially coherent chunks (egm722.parallel_join), and to write layers
+with spatially sorted blocks of records (egm722.spatial_sort).
+'''
+import numpy as np
+
+
+def grid_coords(x, y, bounds, order=16):
+    '''
+    Convert coordinates to integer cells of a 2**order x 2**order grid covering the given bounds.
+
+    :param x: an array of x coordinates
+    :param y: an array of y coordinates
+    :param bounds: the (xmin, ymin, xmax, ymax) bounds of the grid
+    :param order: the number of bits for each grid coordinate (at most 31)
+
+    :returns ix, iy: integer arrays of the grid column and row of each point
+    '''
+    xmin, ymin, xmax, ymax = bounds
+    ncells = 2 ** order
+    ix = (np.asarray(x, dtype=np.float64) - xmin) * (ncells / max(xmax - xmin, 1e-12))
+    iy = (np.asarray(y, dtype=np.float64) - ymin) * (ncells / max(ymax - ymin, 1e-12))
+    return np.clip(ix, 0, ncells - 1).astype(np.int64), np.clip(iy, 0, ncells - 1).astype(np.int64)
+
+
+def hilbert_distance(ix, iy, order=16):
+    '''
+    Find the distance along a Hilbert curve of each cell of a 2**order x 2**order grid.
+
+    :param ix: an integer array of grid columns (from 0 to 2**order - 1)
+    :param iy: an integer array of grid rows (from 0 to 2**order - 1)
+    :param order: the number of bits for each grid coordinate (at most 31)
+
+    :returns distance: an integer array of the position of each cell along the curve
+    '''
+    x = np.array(ix, dtype=np.int64)
+    y = np.array(iy, dtype=np.int64)
+    n = 2 ** order
+    distance = np.zeros(x.shape, dtype=np.int64)
+
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        distance += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+
+        # rotate the quadrant, so that the curve inside of it has the right orientation
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s //= 2
+
+    return distance
+
+
+def _spread_bits(values):
+    # put a 0 bit between each of the (lower 32) bits of each value
+    values = np.asarray(values, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_distance(ix, iy, order=16):
+    '''
+    Find the distance along a Z-order (Morton) curve of each cell of a 2**order x 2**order grid, by interleaving
+    the bits of the column and row.
+
+    :param ix: an integer array of grid columns (from 0 to 2**order - 1)
+    :param iy: an integer array of grid rows (from 0 to 2**order - 1)
+    :param order: the number of bits for each grid coordinate (at most 31)
+
+    :returns distance: an integer array of the position of each cell along the curve
+    '''
+    return (_spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))).astype(np.int64)
+
+
+def curve_key(gdf, curve='hilbert', order=16, bounds=None):
+    '''
+    Find the position along a space-filling curve of the center of each feature's bounding box (which, for
+    sorting, is close enough to the centroid, and much faster to find).
+
+    :param gdf: the GeoDataFrame (or GeoSeries) of features
+    :param curve: the curve to use, either 'hilbert' or 'morton' (Z-order)
+    :param order: the number of bits for each grid coordinate (at most 31)
+    :param bounds: the (xmin, ymin, xmax, ymax) bounds of the curve. If None, uses the total bounds of gdf.
+
+    :returns key: an integer array of the position of each feature along the curve. Empty geometries are given
+        the last position on the curve.
+    '''
+    if curve not in ('hilbert', 'morton'):
+        raise ValueError("curve must be one of 'hilbert', 'morton'")
+
+    geoms = gdf.geometry if hasattr(gdf, 'geometry') else gdf
+    feature_bounds = geoms.bounds.to_numpy()
+    bounds = geoms.total_bounds if bounds is None else bounds
+
+    empty = np.isnan(feature_bounds).any(axis=1)
+    x = np.where(empty, bounds[2], (feature_bounds[:, 0] + feature_bounds[:, 2]) / 2)
+    y = np.where(empty, bounds[3], (feature_bounds[:, 1] + feature_bounds[:, 3]) / 2)
+
+    ix, iy = grid_coords(x, y, bounds, order)
+    key = hilbert_distance(ix, iy, order) if curve == 'hilbert' else morton_distance(ix, iy, order)
+    key[empty] = 4 ** order
+    return key
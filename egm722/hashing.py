@@ -0,0 +1,89 @@
+'''
+Content hashes of vector layers, used to tell when a cached result needs to be re-calculated.
+'''
+import os
+import hashlib
+import pandas as pd
+
+
+def layer_hash(gdf, attributes=False):
+    '''
+    Calculate a hash of the geometries (and, optionally, attributes) of a GeoDataFrame.
+
+    The hash depends on the index, the CRS, and the geometry of each feature, so two layers with the same hash will
+    give the same result for any spatial operation.
+
+    :param gdf: the GeoDataFrame (or GeoSeries) to hash
+    :param attributes: also include the (non-geometry) attribute values in the hash
+
+    :returns digest: the hexadecimal SHA1 hash
+    '''
+    geoms = gdf.geometry if hasattr(gdf, 'geometry') else gdf
+
+    sha = hashlib.sha1()
+    sha.update(str(geoms.crs).encode('utf-8'))
+    sha.update(pd.util.hash_pandas_object(gdf.index, index=False).to_numpy().tobytes())
+    sha.update(b''.join(b'\x00' if wkb is None else wkb for wkb in geoms.to_wkb()))
+
+    if attributes and hasattr(gdf, 'columns'):
+        attrs = pd.DataFrame(gdf.drop(columns=geoms.name))
+        sha.update(','.join(map(str, attrs.columns)).encode('utf-8'))
+        sha.update(pd.util.hash_pandas_object(attrs, index=False).to_numpy().tobytes())
+
+    return sha.hexdigest()
+
+
+def feature_hashes(gdf, columns=None):
+    '''
+    Calculate a hash of each feature of a GeoDataFrame, so that we can tell which features have changed.
+
+    :param gdf: the GeoDataFrame (or GeoSeries) to hash
+    :param columns: a list of attribute columns to include in the hash of each feature
+
+    :returns digests: a list of the (binary) SHA1 hash of each feature
+    '''
+    geoms = gdf.geometry if hasattr(gdf, 'geometry') else gdf
+    columns = [] if columns is None else list(columns)
+    rows = gdf[columns].itertuples(index=False, name=None) if len(columns) > 0 else ((),) * len(geoms)
+
+    digests = []
+    for wkb, row in zip(geoms.to_wkb(), rows):
+        sha = hashlib.sha1(b'\x00' if wkb is None else wkb)
+        sha.update(repr(row).encode('utf-8'))
+        digests.append(sha.digest())
+    return digests
+
+
+SIDECAR_EXTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+def hashed_files(fn):
+    '''
+    List the files that file_hash() reads for a file: for shapefiles, the .shp file and the .shx, .dbf, .prj, and .cpg
+    files that go with it; otherwise, just the file itself.
+
+    :param fn: the filename
+
+    :returns fns: a list of the filenames that exist
+    '''
+    base, ext = os.path.splitext(fn)
+    return [base + sc for sc in SIDECAR_EXTS if os.path.exists(base + sc)] if ext.lower() == '.shp' else [fn]
+
+
+def file_hash(fn, block_size=2 ** 20):
+    '''
+    Calculate a hash of the contents of a file. For shapefiles, the .shx, .dbf, .prj, and .cpg files that go with the
+    .shp file are included.
+
+    :param fn: the filename to hash
+    :param block_size: the number of bytes to read at a time
+
+    :returns digest: the hexadecimal SHA1 hash
+    '''
+    sha = hashlib.sha1()
+    for this_fn in hashed_files(fn):
+        sha.update(os.path.splitext(this_fn)[1].encode('utf-8'))
+        with open(this_fn, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+    return sha.hexdigest()
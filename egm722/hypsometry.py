@@ -0,0 +1,113 @@
+'''
+Area-elevation distributions (hypsometry) for every land cover class, for DEMs that are too large to read at once.
+
+In the Week 5 practical, we read the whole DEM and land cover rasters into memory, and make a new copy of the DEM
+pixels for each class that we want a histogram for:
+
+    broad_els = dem[landcover == 1]
+    conif_els = dem[landcover == 2]
+    broad_count, _ = np.histogram(broad_els, el_bins)
+    broad_area = broad_count * 100 * 100
+
+area_elevation() instead reads the land cover raster, and the DEM resampled onto the same grid, one window at a time.
+For each window, the elevations of all of the classes are binned at once using egm722.crosstab. Because numpy
+releases the GIL for most of this work, the windows are processed in a pool of threads, and the counts are converted
+directly into areas in km2.
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import rasterio as rio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from egm722.crosstab import crosstab
+from egm722.zonal import block_windows
+
+
+class _AlignedReader(object):
+    # opens the DEM and class rasters once in each thread (rasterio datasets shouldn't be shared between threads), with
+    # the DEM warped onto the grid of the class raster if the two are not already aligned
+    def __init__(self, fn_dem, fn_classes, dem_band, class_band, resampling):
+        self.fn_dem, self.fn_classes = fn_dem, fn_classes
+        self.dem_band, self.class_band = dem_band, class_band
+        self.resampling = resampling
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def datasets(self):
+        if getattr(self._local, 'datasets', None) is None:
+            classes = rio.open(self.fn_classes)
+            dem = rio.open(self.fn_dem)
+            if (dem.crs, dem.transform, dem.shape) != (classes.crs, classes.transform, classes.shape):
+                dem = WarpedVRT(dem, crs=classes.crs, transform=classes.transform, width=classes.width,
+                                height=classes.height, resampling=self.resampling)
+            self._local.datasets = (dem, classes)
+            with self._lock:
+                self._handles.append((dem, classes))
+        return self._local.datasets
+
+    def read(self, window):
+        dem, classes = self.datasets()
+        elevation = dem.read(self.dem_band, window=window, masked=True)
+        labels = classes.read(self.class_band, window=window, masked=True)
+        # leave out nodata pixels by giving them an elevation of NaN, which is never counted
+        elevation = elevation.astype(np.float64).filled(np.nan)
+        elevation[np.ma.getmaskarray(labels)] = np.nan
+        return elevation, labels.filled(0)
+
+    def close(self):
+        for dem, classes in self._handles:
+            dem.close()
+            classes.close()
+
+
+def area_elevation(fn_dem, fn_classes, bins, n_classes=None, dem_band=1, class_band=1, block_size=1024,
+                   max_workers=None, resampling=Resampling.bilinear):
+    '''
+    Calculate the area-elevation distribution of every class in a (land cover) raster, reading the rasters one window
+    at a time in a pool of threads.
+
+    :param fn_dem: the filename of the DEM
+    :param fn_classes: the filename of the class (e.g., land cover) raster. If the DEM has a different grid, it is
+        resampled onto the grid of this raster.
+    :param bins: the elevation bin edges, as used by np.histogram() (e.g., np.arange(0, 600, 5))
+    :param n_classes: the number of class labels (max label + 1). If None, uses 256 for 8-bit rasters.
+    :param dem_band: the band of the DEM to use
+    :param class_band: the band of the class raster to use
+    :param block_size: the size (in pixels) of the square windows to read
+    :param max_workers: the number of threads to use. If 1, the windows are processed in the current thread.
+    :param resampling: the rasterio.enums.Resampling method used if the DEM has to be resampled
+
+    :returns areas: an array of shape (n_classes, n_bins), with the area (in km2) of each class in each elevation
+        bin - for example, areas[1] is the area-elevation distribution of class 1. Pixels where either raster is
+        nodata are not counted.
+    '''
+    with rio.open(fn_classes) as dataset:
+        if n_classes is None:
+            if dataset.dtypes[class_band - 1] != 'uint8':
+                raise ValueError('n_classes must be given for rasters that are not 8-bit.')
+            n_classes = 256
+        windows = block_windows(dataset.width, dataset.height, block_size)
+        # the area of one pixel in km2, assuming that the CRS units are meters
+        pixel_area = abs(dataset.transform.a * dataset.transform.e - dataset.transform.b * dataset.transform.d) / 1e6
+
+    reader = _AlignedReader(fn_dem, fn_classes, dem_band, class_band, resampling)
+    table = np.zeros((1, n_classes, len(bins) - 1), dtype=np.int64)
+
+    def _count(window):
+        elevation, labels = reader.read(window)
+        return crosstab(None, labels, elevation, bins, n_classes=n_classes)
+
+    try:
+        if max_workers == 1:
+            for counts in map(_count, windows):
+                table += counts
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for counts in pool.map(_count, windows):
+                    table += counts
+    finally:
+        reader.close()
+
+    return table[0] * pixel_area
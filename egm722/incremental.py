@@ -0,0 +1,126 @@
+'''
+Incremental zone summaries: sums of feature attributes by zone (e.g., ward population by county) that are updated,
+rather than re-calculated, when only a few features change.
+
+In the Week 3 exercise, the population of each county is found by joining the wards to the counties and summing,
+every time the script is run:
+
+    join = gpd.sjoin(counties, wards, how='inner', lsuffix='left', rsuffix='right')
+    join.groupby(['CountyName'])['Population'].sum()
+
+incremental_sum() gives the same totals, but stores the join (one row per (feature, zone) pair, with the values to
+sum), the totals, and a hash of the geometry and attributes of each feature. On the next run, it compares the hashes
+to find the features that have been added, removed, or changed since the last run; only these features are joined
+to the zones again, and only the totals of the zones that they are in (before or after) are re-calculated. If the
+zones themselves change, everything is re-calculated.
+'''
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from egm722 import CACHE_ROOT
+from egm722.hashing import feature_hashes, layer_hash
+from egm722.zones import query_pairs
+
+
+AGGREGATE_DIR = os.path.join(CACHE_ROOT, 'aggregates')
+
+
+def _state_file(zones, zone_field, columns, predicate, id_field, state_dir):
+    # the stored state depends on the zones and on what is being summed, but not on the features
+    key = hashlib.sha1('{}|{}|{!r}|{}|{}'.format(layer_hash(zones, attributes=True), zone_field, list(columns),
+                                                   predicate, id_field).encode('utf-8')).hexdigest()
+    return os.path.join(state_dir, key + '.pkl')
+
+
+def _join_features(zones, features, zone_field, columns, predicate):
+    # join a set of features to the zones, returning one row per (feature, zone) pair
+    feature_idx, zone_idx = query_pairs(zones.sindex, features.geometry, predicate=predicate)
+    rows = pd.DataFrame({'feature_id': features.index.to_numpy()[feature_idx],
+                         zone_field: zones[zone_field].to_numpy()[zone_idx]})
+    for col in columns:
+        rows[col] = features[col].to_numpy()[feature_idx]
+    return rows
+
+
+def _totals(join, zone_field, columns):
+    totals = join.groupby(zone_field)[list(columns)].sum()
+    totals['count'] = join.groupby(zone_field).size()
+    return totals
+
+
+def incremental_sum(zones, features, zone_field, columns, predicate='intersects', id_field=None,
+                    state_dir=AGGREGATE_DIR):
+    '''
+    Sum the attributes of the features in each zone (e.g., the population of the wards in each county), only
+    re-joining the features that have changed since the last time the same zones and columns were summed.
+
+    Features are matched between runs by their index (or id_field), and a feature is counted in every zone that it
+    matches. The predicate is tested as predicate(feature, zone), so the totals are those of
+    gpd.sjoin(features, zones, predicate=predicate): with predicate='within', a feature is counted in the zones that
+    it is within.
+
+    :param zones: a GeoDataFrame of the zones (e.g., counties)
+    :param features: a GeoDataFrame of the features to sum (e.g., wards), in the same CRS as zones
+    :param zone_field: the name of the zone attribute to group the totals by (e.g., 'CountyName')
+    :param columns: a list of the (numeric) feature attributes to sum (e.g., ['Population'])
+    :param predicate: the binary predicate used to match features to zones, tested as predicate(feature, zone)
+        (e.g., 'intersects', 'within')
+    :param id_field: the name of a column with a unique id for each feature (e.g., 'Ward Code'). If None, the index
+        of features is used.
+    :param state_dir: the directory to store the join, totals, and feature hashes in
+
+    :returns totals, changes: a DataFrame of the total of each column (and the number of features) in each zone, and
+        a dict with the number of features that were 'added', 'removed', 'modified', and 'unchanged' since the last run
+    '''
+    if not zones.crs == features.crs:
+        raise ValueError('zones and features must have the same CRS: {} != {}'.format(zones.crs, features.crs))
+    columns = list(columns)
+
+    features = features if id_field is None else features.set_index(id_field, drop=False)
+    if not features.index.is_unique:
+        raise ValueError('Each feature must have a unique id (index or id_field).')
+
+    hashes = pd.Series(feature_hashes(features, columns), index=features.index)
+    fn_state = _state_file(zones, zone_field, columns, predicate, id_field, state_dir)
+    state = pd.read_pickle(fn_state) if os.path.exists(fn_state) else None
+
+    if state is None:
+        changes = {'added': len(features), 'removed': 0, 'modified': 0, 'unchanged': 0}
+        join = _join_features(zones, features, zone_field, columns, predicate)
+        totals = _totals(join, zone_field, columns)
+    else:
+        old_hashes = state['hashes']
+        common = hashes.index.intersection(old_hashes.index)
+        same = hashes.loc[common].to_numpy() == old_hashes.loc[common].to_numpy()
+
+        added = hashes.index.difference(old_hashes.index)
+        removed = old_hashes.index.difference(hashes.index)
+        modified = common[~same]
+        changed = added.append(modified)
+        changes = {'added': len(added), 'removed': len(removed), 'modified': len(modified),
+                   'unchanged': int(same.sum())}
+
+        # drop the old rows of any removed or modified features, and join the added and modified features again
+        join = state['join']
+        stale = join['feature_id'].isin(removed.append(modified))
+        new_rows = _join_features(zones, features.loc[changed], zone_field, columns, predicate)
+
+        # only the zones that the changed features were in (before or after) need new totals
+        affected = pd.unique(np.concatenate([join.loc[stale, zone_field].to_numpy(),
+                                             new_rows[zone_field].to_numpy()]))
+        join = pd.concat([join[~stale], new_rows], ignore_index=True)
+
+        totals = state['totals'].drop(index=affected, errors='ignore')
+        new_totals = _totals(join[join[zone_field].isin(affected)], zone_field, columns)
+        totals = pd.concat([totals, new_totals]).sort_index()
+
+    if state is not None and changes['unchanged'] == len(features) and changes['removed'] == 0:
+        return totals, changes  # nothing has changed, so the stored state is still up to date
+
+    os.makedirs(state_dir, exist_ok=True)
+    fn_tmp = '{}.{}.tmp'.format(fn_state, os.getpid())
+    pd.to_pickle({'hashes': hashes, 'join': join, 'totals': totals}, fn_tmp)
+    os.replace(fn_tmp, fn_state)
+
+    return totals, changes
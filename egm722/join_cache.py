@@ -0,0 +1,146 @@
+'''
+A persistent spatial join, which stores the table of matching (left, right) feature pairs on disk.
+
+In the Week 3 practical and exercise, we join the same (unchanging) boundary layers again and again:
+
+    join = gpd.sjoin(counties, roads_itm, how='inner', lsuffix='left', rsuffix='right')
+
+Every call re-builds the spatial index and re-tests every candidate pair of geometries. cached_sjoin() gives the same
+rows as gpd.sjoin(), but the first time a pair of layers is joined it saves the positions of the matching pairs in
+the cache, keyed by a key for each layer and the predicate. After that, the join is assembled from the stored pairs,
+without any geometry tests.
+
+The keys have to change whenever a layer's geometries change. Hashing the geometries of both layers (with
+egm722.hashing.layer_hash()) on every call costs about as much as the join itself, so the keys are passed in by the
+caller. For layers loaded from the catalog, egm722.catalog.key() gives a hash of the source file(s) (only
+re-calculated when a file's size or modification time changes) and the CRS:
+
+    join = cached_sjoin(counties, roads_itm, left_key=catalog.key('counties', crs=counties.crs),
+                        right_key=catalog.key('roads', crs=roads_itm.crs))
+'''
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from egm722 import CACHE_ROOT
+from egm722.zones import query_pairs
+
+
+JOIN_DIR = os.path.join(CACHE_ROOT, 'joins')
+
+
+def join_pairs(left, right, predicate='intersects', cache_dir=JOIN_DIR, left_key=None, right_key=None):
+    '''
+    Find the positions of all pairs of features in two layers that satisfy a spatial predicate, using the cache
+    if possible.
+
+    :param left: the left GeoDataFrame
+    :param right: the right GeoDataFrame
+    :param predicate: the binary predicate to use (e.g., 'intersects', 'within', 'contains')
+    :param cache_dir: the directory to store the pair tables in. If None, the cache is not used.
+    :param left_key: a key that changes whenever the geometries of the left layer change (e.g., from
+        egm722.catalog.key() or egm722.hashing.layer_hash()). If either key is None, the cache is not used.
+    :param right_key: a key that changes whenever the geometries of the right layer change
+
+    :returns left_pos, right_pos: integer arrays of the (0-based) positions of each matching pair, sorted by
+        left_pos and then right_pos
+    '''
+    fn_cache = None
+    if cache_dir is not None and left_key is not None and right_key is not None:
+        # the number of features is part of the key as well, in case a layer has been filtered since it was loaded
+        key = hashlib.sha1('{}_{}_{}_{}_{}'.format(left_key, len(left), right_key, len(right),
+                                                   predicate).encode('utf-8')).hexdigest()
+        fn_cache = os.path.join(cache_dir, key + '.npz')
+        if os.path.exists(fn_cache):
+            with np.load(fn_cache) as pairs:
+                return pairs['left_pos'], pairs['right_pos']
+
+    # query the index of the right layer with every left geometry
+    left_pos, right_pos = query_pairs(right.sindex, left.geometry, predicate=predicate)
+    order = np.lexsort((right_pos, left_pos))
+    left_pos, right_pos = left_pos[order], right_pos[order]
+
+    if fn_cache is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        fn_tmp = '{}.{}.tmp.npz'.format(fn_cache[:-4], os.getpid())
+        np.savez(fn_tmp, left_pos=left_pos, right_pos=right_pos, predicate=predicate)
+        os.replace(fn_tmp, fn_cache)
+
+    return left_pos, right_pos
+
+
+def cached_sjoin(left, right, how='inner', predicate='intersects', lsuffix='left', rsuffix='right',
+                 cache_dir=JOIN_DIR, left_key=None, right_key=None):
+    '''
+    Spatially join two GeoDataFrames, like gpd.sjoin(), re-using the stored table of matching pairs if the two
+    layers have been joined before.
+
+    The output keeps the index and geometry of the left GeoDataFrame, with an index_<rsuffix> column giving the
+    index of the matching right feature. Columns with the same name in both layers are given the suffixes lsuffix
+    and rsuffix. The output has the same rows as gpd.sjoin(), but they are sorted by the position of the left
+    feature and then the right feature, which is not always the order that gpd.sjoin() returns them in (it changes
+    between versions of geopandas).
+
+    :param left: the left GeoDataFrame (e.g., counties)
+    :param right: the right GeoDataFrame (e.g., roads)
+    :param how: 'inner' (only keep left features with a match) or 'left' (keep all left features)
+    :param predicate: the binary predicate to use (e.g., 'intersects', 'within', 'contains')
+    :param lsuffix: the suffix to add to overlapping column names from the left layer
+    :param rsuffix: the suffix to add to overlapping column names from the right layer
+    :param cache_dir: the directory to store the pair tables in. If None, the cache is not used.
+    :param left_key: a key that changes whenever the geometries of the left layer change (e.g., from
+        egm722.catalog.key() or egm722.hashing.layer_hash()). If either key is None, the cache is not used.
+    :param right_key: a key that changes whenever the geometries of the right layer change
+
+    :returns join: the joined GeoDataFrame
+    '''
+    if how not in ('inner', 'left'):
+        raise ValueError("how must be one of 'inner', 'left'")
+    if not left.crs == right.crs:
+        raise ValueError('left and right must have the same CRS: {} != {}'.format(left.crs, right.crs))
+
+    left_pos, right_pos = join_pairs(left, right, predicate, cache_dir, left_key, right_key)
+    return join_from_pairs(left, right, left_pos, right_pos, how, lsuffix, rsuffix)
+
+
+def join_from_pairs(left, right, left_pos, right_pos, how='inner', lsuffix='left', rsuffix='right'):
+    '''
+    Assemble the output of a spatial join (in the same form as gpd.sjoin()) from the positions of the matching
+    pairs of features.
+
+    :param left: the left GeoDataFrame
+    :param right: the right GeoDataFrame
+    :param left_pos: an integer array of the (0-based) positions of the left feature of each pair, sorted by
+        left_pos and then right_pos (as returned by join_pairs())
+    :param right_pos: an integer array of the positions of the right feature of each pair
+    :param how: 'inner' (only keep left features with a match) or 'left' (keep all left features)
+    :param lsuffix: the suffix to add to overlapping column names from the left layer
+    :param rsuffix: the suffix to add to overlapping column names from the right layer
+
+    :returns join: the joined GeoDataFrame
+    '''
+    if how not in ('inner', 'left'):
+        raise ValueError("how must be one of 'inner', 'left'")
+
+    if how == 'left':
+        # add the left features that don't have a match, with right_pos = -1 (which becomes NaN below)
+        unmatched = np.setdiff1d(np.arange(len(left)), left_pos)
+        left_pos = np.concatenate([left_pos, unmatched])
+        right_pos = np.concatenate([right_pos, np.full(unmatched.size, -1)])
+        order = np.lexsort((right_pos, left_pos))
+        left_pos, right_pos = left_pos[order], right_pos[order]
+
+    index_right = 'index_{}'.format(rsuffix)
+    right_cols = [col for col in right.columns if col != right.geometry.name]
+    overlap = set(left.columns) & set(right_cols + [index_right])
+
+    join = left.iloc[left_pos].rename(columns={col: '{}_{}'.format(col, lsuffix) for col in overlap})
+
+    right_part = pd.DataFrame(right[right_cols]).reset_index(drop=True).reindex(right_pos)
+    right_part = right_part.rename(columns={col: '{}_{}'.format(col, rsuffix) for col in overlap})
+
+    join[index_right] = pd.Series(right.index).reindex(right_pos).to_numpy()
+    for col in right_part.columns:
+        join[col] = right_part[col].to_numpy()
+
+    return join
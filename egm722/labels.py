@@ -0,0 +1,177 @@
+'''
+Batched, collision-free text labels for large numbers of point features.
+
+In the Week 2 script, towns are labelled one at a time:
+
+    for i, row in towns.iterrows():
+        x, y = row.geometry.x, row.geometry.y
+        plt.text(x, y, row['TOWN_NAME'].title(), fontsize=8, transform=myCRS)
+
+which creates a separate Text artist (each with its own cartopy transform) for every town, and draws every label
+even when they overlap. add_labels() instead:
+
+- projects all of the anchor points into the map projection in a single call;
+- at draw time, converts the anchor points to screen coordinates in one go, and uses a grid index to drop any label
+  that would overlap a label that has already been placed (labels with a higher priority are placed first);
+- draws all of the remaining labels from a single artist, so that zooming in reveals more labels.
+'''
+import numpy as np
+import matplotlib.artist as martist
+from matplotlib.font_manager import FontProperties
+
+
+CHAR_WIDTH = 0.6  # the approximate width of a character, as a fraction of the font size
+
+
+def cull_labels(boxes, order=None, cell_size=None):
+    '''
+    Choose a set of non-overlapping boxes, placing them greedily in order and using a grid index to find collisions.
+
+    :param boxes: an (N, 4) array of (xmin, ymin, xmax, ymax) for each label
+    :param order: the order to place the labels in (e.g., by decreasing priority). If None, uses the input order.
+    :param cell_size: the size of each grid cell. If None, uses the median label width.
+
+    :returns keep: a boolean array, True for each label that can be placed without overlapping another
+    '''
+    boxes = np.asarray(boxes, dtype=float)
+    keep = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) == 0:
+        return keep
+
+    order = np.arange(len(boxes)) if order is None else np.asarray(order)
+    if cell_size is None:
+        cell_size = max(float(np.median(boxes[:, 2] - boxes[:, 0])), 1.)
+
+    cells = np.floor(boxes / cell_size).astype(np.int64)
+    grid = {}
+
+    for ii in order:
+        xmin, ymin, xmax, ymax = boxes[ii]
+        cx0, cy0, cx1, cy1 = cells[ii]
+
+        collision = False
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for jj in grid.get((cx, cy), ()):
+                    oxmin, oymin, oxmax, oymax = boxes[jj]
+                    if xmin < oxmax and xmax > oxmin and ymin < oymax and ymax > oymin:
+                        collision = True
+                        break
+                if collision:
+                    break
+            if collision:
+                break
+
+        if not collision:
+            keep[ii] = True
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    grid.setdefault((cx, cy), []).append(ii)
+
+    return keep
+
+
+class LabelCollection(martist.Artist):
+    '''
+    A single artist that draws many text labels, skipping any labels that would overlap.
+    '''
+
+    def __init__(self, xy, labels, priority=None, fontsize=8, color='k', offset=(2, 2), padding=1, **font_args):
+        '''
+        :param xy: an (N, 2) array of label anchor points, in data (map projection) coordinates
+        :param labels: a list of N strings
+        :param priority: an array of N values - labels with higher priority are placed first. If None, labels are
+            placed in order.
+        :param fontsize: the font size, in points
+        :param color: the text color
+        :param offset: the (x, y) offset of the text from the anchor point, in points
+        :param padding: extra space to leave around each label, in points
+        :param font_args: additional keyword arguments (e.g., family, weight) passed to FontProperties
+        '''
+        super().__init__()
+        self.xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.labels = [str(label) for label in labels]
+        self.nchars = np.array([len(label) for label in self.labels])
+        self.order = None if priority is None else np.argsort(-np.asarray(priority), kind='stable')
+        self.prop = FontProperties(size=fontsize, **font_args)
+        self.color = color
+        self.offset = offset
+        self.padding = padding
+        self.visible_labels = np.zeros(len(self.labels), dtype=bool)
+        self.set_zorder(3)  # the same default as a matplotlib Text, so that labels are drawn on top of the map
+
+    def _label_boxes(self, renderer):
+        # the screen (display) bounding box of each label, estimated from the number of characters
+        to_px = renderer.points_to_pixels(1.)
+        size = self.prop.get_size_in_points() * to_px
+        pad = self.padding * to_px
+
+        xy = self.axes.transData.transform(self.xy)
+        xy[:, 0] += self.offset[0] * to_px
+        xy[:, 1] += self.offset[1] * to_px
+
+        boxes = np.column_stack([xy[:, 0] - pad, xy[:, 1] - pad,
+                                 xy[:, 0] + self.nchars * size * CHAR_WIDTH + pad, xy[:, 1] + size + pad])
+        return xy, boxes
+
+    def draw(self, renderer):
+        if not self.get_visible() or len(self.labels) == 0:
+            return
+
+        xy, boxes = self._label_boxes(renderer)
+
+        # only consider labels that are (at least partly) inside the axes
+        ax_box = self.axes.bbox
+        inside = (boxes[:, 2] >= ax_box.x0) & (boxes[:, 0] <= ax_box.x1) & \
+                 (boxes[:, 3] >= ax_box.y0) & (boxes[:, 1] <= ax_box.y1) & np.isfinite(boxes).all(axis=1)
+
+        order = np.arange(len(boxes)) if self.order is None else self.order
+        order = order[inside[order]]
+
+        keep = np.zeros(len(boxes), dtype=bool)
+        keep[order] = cull_labels(boxes[order])
+        self.visible_labels = keep
+
+        renderer.open_group('labels', gid=self.get_gid())
+        gc = renderer.new_gc()
+        gc.set_foreground(self.color)
+        gc.set_alpha(self.get_alpha())
+        gc.set_clip_rectangle(ax_box)
+        # some renderers (e.g., Agg) measure y from the top of the canvas, rather than the bottom
+        height = renderer.get_canvas_width_height()[1] if renderer.flipy() else None
+        for ii in np.flatnonzero(keep):
+            y = xy[ii, 1] if height is None else height - xy[ii, 1]
+            renderer.draw_text(gc, xy[ii, 0], y, self.labels[ii], self.prop, 0)
+        gc.restore()
+        renderer.close_group('labels')
+
+        self.stale = False
+
+
+def add_labels(ax, x, y, labels, crs=None, priority=None, **label_args):
+    '''
+    Add collision-free text labels for a set of points to a map, using a single artist.
+
+    :param ax: the axes (or cartopy GeoAxes) to add the labels to
+    :param x: the x coordinates of the anchor points
+    :param y: the y coordinates of the anchor points
+    :param labels: the text of each label
+    :param crs: the cartopy CRS of x, y. If None, x, y are in the data coordinates of the axes.
+    :param priority: an array of values (e.g., population) - labels with higher priority are placed first
+    :param label_args: additional keyword arguments (fontsize, color, offset, ...) passed to LabelCollection
+
+    :returns labels: the LabelCollection artist
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if crs is not None and hasattr(ax, 'projection'):
+        # project all of the points into the map projection at once
+        xy = ax.projection.transform_points(crs, x, y)[:, :2]
+    else:
+        xy = np.column_stack([x, y])
+
+    collection = LabelCollection(xy, labels, priority, **label_args)
+    collection.set_clip_on(True)
+    ax.add_artist(collection)
+    return collection
@@ -0,0 +1,278 @@
+'''
+Lazy, filtered reading of shapefiles.
+
+The scripts in the practicals load whole layers with gpd.read_file(), then throw most of them away:
+
+    roads = gpd.read_file('data_files/NI_roads.shp')
+    roads[roads['Road_class'] == 'MOTORWAY']
+
+LazyLayer instead works out which records are needed before any geometries are decoded:
+
+- the bounding box of every record is read directly from the .shp file, using the record offsets stored in the .shx
+  index file (only 36 bytes per record, rather than every vertex);
+- attribute filters are tested using only the .dbf columns that they need;
+- only the matching records, and only the requested columns, are then decoded (using pyogrio or fiona).
+
+Some of the shapefiles also come with an ESRI .sbn/.sbx spatial index (e.g., Glaciers.sbn), but the format of these
+files is not published, and not every shapefile has one. The record bounding boxes from the .shp/.shx files give
+the same information (exactly, rather than binned), for every shapefile.
+'''
+import os
+import codecs
+import operator
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+
+POINT_TYPES = (1, 11, 21)  # Point, PointZ, PointM - these records have x, y in place of a bounding box
+NULL_TYPE = 0
+
+FILTER_OPS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt,
+              '>=': operator.ge}
+
+
+def _gather(buf, starts, nbytes, dtype):
+    # read nbytes from each of the start positions in a byte buffer, and view them as dtype
+    idx = starts[:, None] + np.arange(nbytes)
+    return np.ascontiguousarray(buf[idx]).view(dtype)
+
+
+def record_bounds(fn_shp):
+    '''
+    Read the bounding box of every record in a shapefile, without reading any of the vertices.
+
+    :param fn_shp: the filename of the .shp file (the .shx file must be in the same folder)
+
+    :returns bounds: an (N, 4) array of (xmin, ymin, xmax, ymax) for each record, with NaN for null geometries
+    '''
+    base = os.path.splitext(fn_shp)[0]
+    shx = np.fromfile(base + '.shx', dtype='>i4', offset=100).reshape(-1, 2)
+    starts = shx[:, 0].astype(np.int64) * 2 + 8  # offsets are in 16-bit words, and the record header is 8 bytes
+
+    shp = np.memmap(fn_shp, dtype=np.uint8, mode='r')
+    shape_types = _gather(shp, starts, 4, '<i4').ravel()
+
+    bounds = np.full((len(starts), 4), np.nan)
+    is_point = np.isin(shape_types, POINT_TYPES)
+    has_bbox = ~is_point & (shape_types != NULL_TYPE)
+
+    if is_point.any():
+        xy = _gather(shp, starts[is_point] + 4, 16, '<f8')
+        bounds[is_point] = np.hstack([xy, xy])
+    if has_bbox.any():
+        bounds[has_bbox] = _gather(shp, starts[has_bbox] + 4, 32, '<f8')
+
+    return bounds
+
+
+def dbf_fields(fn_dbf):
+    '''
+    Read the field descriptions from the header of a .dbf file.
+
+    :param fn_dbf: the filename of the .dbf file
+
+    :returns nrecords, header_len, record_len, fields: the number of records, the length of the header and of each
+        record (in bytes), and a dict of {name: (type, offset, length)} for each field
+    '''
+    with open(fn_dbf, 'rb') as f:
+        header = f.read(32)
+        nrecords = int(np.frombuffer(header, '<u4', 1, 4)[0])
+        header_len, record_len = [int(v) for v in np.frombuffer(header, '<u2', 2, 8)]
+        descriptors = f.read(header_len - 32)
+
+    fields = {}
+    offset = 1  # the first byte of each record is the deletion flag
+    for start in range(0, len(descriptors) - 31, 32):
+        desc = descriptors[start:start + 32]
+        if desc[0] == 0x0D:  # the end of the field descriptors
+            break
+        name = desc[:11].split(b'\x00')[0].decode('ascii', errors='replace')
+        ftype, length = chr(desc[11]), desc[16]
+        fields[name] = (ftype, offset, length)
+        offset += length
+
+    return nrecords, header_len, record_len, fields
+
+
+def _cpg_encoding(cpg):
+    # translate the contents of a .cpg file (e.g., 'UTF-8', 'ISO 88591', '1252') into a python encoding name
+    cpg = cpg.strip()
+    candidates = [cpg, cpg.replace(' ', '-'), 'cp' + cpg]
+    if cpg.upper().replace(' ', '').startswith('ISO8859'):
+        candidates.insert(0, 'iso8859-' + cpg.upper().replace(' ', '')[7:].lstrip('-_'))
+    for name in candidates:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return 'latin-1'
+
+
+def read_dbf_columns(fn_dbf, columns, encoding=None):
+    '''
+    Read only the given columns of a .dbf file.
+
+    :param fn_dbf: the filename of the .dbf file
+    :param columns: the names of the columns to read
+    :param encoding: the text encoding of the file. If None, uses the .cpg file (if there is one), or latin-1.
+
+    :returns df: a DataFrame with the requested columns, one row per record
+    '''
+    if encoding is None:
+        fn_cpg = os.path.splitext(fn_dbf)[0] + '.cpg'
+        encoding = 'latin-1'
+        if os.path.exists(fn_cpg):
+            with open(fn_cpg) as f:
+                encoding = _cpg_encoding(f.read())
+
+    nrecords, header_len, record_len, fields = dbf_fields(fn_dbf)
+    records = np.memmap(fn_dbf, dtype=np.uint8, mode='r', offset=header_len, shape=(nrecords, record_len))
+
+    data = {}
+    for col in columns:
+        if col not in fields:
+            raise KeyError('{} is not a field in {}'.format(col, fn_dbf))
+        ftype, offset, length = fields[col]
+        raw = np.ascontiguousarray(records[:, offset:offset + length]).view('S{}'.format(length)).ravel()
+        text = pd.Series(raw).str.decode(encoding, errors='replace').str.strip()
+        if ftype in 'NFO':
+            data[col] = pd.to_numeric(text, errors='coerce')
+        elif ftype == 'D':
+            data[col] = pd.to_datetime(text, format='%Y%m%d', errors='coerce')
+        elif ftype == 'L':
+            data[col] = text.str.upper().isin(['T', 'Y']).where(text.str.upper().isin(['T', 'Y', 'F', 'N']))
+        else:
+            data[col] = text
+
+    return pd.DataFrame(data)
+
+
+def _read_records(fn, fids, columns):
+    # decode only the given records and columns, using pyogrio if it is available, otherwise fiona
+    try:
+        import pyogrio
+        gdf = pyogrio.read_dataframe(fn, fids=fids, columns=columns)
+    except ImportError:
+        import fiona
+        with fiona.open(fn) as src:
+            features = [src[int(fid)] for fid in fids]
+            crs = src.crs_wkt
+        gdf = gpd.GeoDataFrame.from_features(features, crs=crs or None)
+        if columns is not None:
+            gdf = gdf[list(columns) + ['geometry']]
+    gdf.index = pd.Index(fids, name=None)
+    return gdf
+
+
+class LazyLayer(object):
+    '''
+    A shapefile that is only read when needed, and only as much as needed.
+
+    Example:
+
+        roads = LazyLayer('data_files/NI_roads.shp')
+        motorways = roads.read(columns=['Road_class'], filters=[('Road_class', '==', 'MOTORWAY')])
+    '''
+
+    def __init__(self, fn, encoding=None):
+        '''
+        :param fn: the filename of the shapefile (.shp)
+        :param encoding: the text encoding of the .dbf file. If None, uses the .cpg file (if present).
+        '''
+        self.fn = fn
+        self.encoding = encoding
+        self._bounds = None
+
+    def __len__(self):
+        return dbf_fields(self.dbf)[0]
+
+    @property
+    def dbf(self):
+        return os.path.splitext(self.fn)[0] + '.dbf'
+
+    @property
+    def columns(self):
+        '''The names of the attribute columns.'''
+        return list(dbf_fields(self.dbf)[3])
+
+    @property
+    def bounds(self):
+        '''An (N, 4) array of the bounding box of each record (read once, then kept).'''
+        if self._bounds is None:
+            self._bounds = record_bounds(self.fn)
+        return self._bounds
+
+    def attributes(self, columns):
+        '''
+        Read some of the attribute columns, without reading any geometries.
+
+        :param columns: a list of column names
+
+        :returns df: a DataFrame with the requested columns
+        '''
+        return read_dbf_columns(self.dbf, columns, self.encoding)
+
+    def select(self, bbox=None, mask=None, filters=None):
+        '''
+        Find the records that match a bounding box/mask and attribute filters.
+
+        :param bbox: (xmin, ymin, xmax, ymax) - select records whose bounding box intersects this box
+        :param mask: a shapely geometry - select records whose bounding box intersects the bounds of the mask
+        :param filters: a list of (column, op, value) tuples, e.g. [('Road_class', '==', 'MOTORWAY')], that must all
+            be True. op can be one of ==, !=, <, <=, >, >=, in, not in.
+
+        :returns fids: an array of the (0-based) record numbers that match
+        '''
+        keep = np.ones(len(self), dtype=bool)
+
+        for bounds in [bbox, None if mask is None else mask.bounds]:
+            if bounds is None:
+                continue
+            xmin, ymin, xmax, ymax = bounds
+            rec = self.bounds
+            with np.errstate(invalid='ignore'):
+                keep &= (rec[:, 0] <= xmax) & (rec[:, 2] >= xmin) & (rec[:, 1] <= ymax) & (rec[:, 3] >= ymin)
+
+        if filters:
+            attrs = self.attributes(list(dict.fromkeys(col for col, _, _ in filters)))
+            for col, op, val in filters:
+                if op == 'in':
+                    keep &= attrs[col].isin(val).to_numpy()
+                elif op == 'not in':
+                    keep &= ~attrs[col].isin(val).to_numpy()
+                elif op in FILTER_OPS:
+                    keep &= FILTER_OPS[op](attrs[col], val).to_numpy()
+                else:
+                    raise ValueError('op must be one of {}, in, not in'.format(', '.join(FILTER_OPS)))
+
+        return np.flatnonzero(keep)
+
+    def read(self, bbox=None, mask=None, columns=None, filters=None):
+        '''
+        Read the records that match a bounding box/mask and attribute filters, decoding only the requested columns.
+
+        :param bbox: (xmin, ymin, xmax, ymax) - read records whose bounding box intersects this box
+        :param mask: a shapely geometry - read records whose geometry intersects the mask
+        :param columns: a list of the attribute columns to read. If None, all columns are read.
+        :param filters: a list of (column, op, value) tuples (see select())
+
+        :returns gdf: the GeoDataFrame of matching records, indexed by record number
+        '''
+        fids = self.select(bbox, mask, filters)
+        gdf = _read_records(self.fn, fids, columns)
+
+        if mask is not None and len(gdf) > 0:
+            gdf = gdf[gdf.intersects(mask)]
+        if bbox is not None and len(gdf) > 0:
+            gdf = gdf[gdf.intersects(box(*bbox))]
+
+        return gdf
+
+
+def read_file(fn, bbox=None, mask=None, columns=None, filters=None):
+    '''
+    Read a shapefile, decoding only the records and columns that are needed - see LazyLayer.read().
+    '''
+    return LazyLayer(fn).read(bbox, mask, columns, filters)
@@ -0,0 +1,174 @@
+'''
+Drawing vector layers on a map with a single artist per layer.
+
+In the Week 2 practical, each county is added to the map as a separate feature:
+
+    for i, name in enumerate(county_names):
+        feat = ShapelyFeature(counties['geometry'][counties['CountyName'] == name], myCRS,
+                              edgecolor='k', facecolor=county_colors[i], linewidth=1, alpha=0.25)
+        ax.add_feature(feat)
+
+which filters the GeoDataFrame again for each category and adds one artist per category. add_categorical() instead
+projects all of the geometries at once, and draws them using a single PatchCollection, with the face color of each
+feature looked up from a category -> color map. category_handles() then creates the same legend handles as
+generate_handles(), using the same map.
+'''
+import numpy as np
+import matplotlib.patches as mpatches
+from matplotlib.collections import PatchCollection
+from matplotlib.path import Path
+
+try:
+    from shapely import get_coordinates, set_coordinates  # shapely >= 2.0
+except ImportError:
+    get_coordinates = set_coordinates = None
+
+
+def category_colors(categories, colors, sort=True):
+    '''
+    Create a category -> color map, re-using colors (in order) if there are more categories than colors.
+
+    :param categories: the category of each feature (e.g., counties['CountyName'])
+    :param colors: a list of colors
+    :param sort: whether to sort the unique categories before assigning colors
+
+    :returns color_map: a dict of {category: color}
+    '''
+    names = list(dict.fromkeys(categories))  # the unique categories, in the order they first appear
+    if sort:
+        names.sort()
+    return {name: colors[i % len(colors)] for i, name in enumerate(names)}
+
+
+def category_handles(color_map, edge='k', alpha=1):
+    '''
+    Create legend handles for a category -> color map, in the same way as generate_handles().
+
+    :param color_map: a dict of {category: color}
+    :param edge: the edge color of the handles
+    :param alpha: the transparency of the handles
+
+    :returns handles: a list of Rectangle handles, one for each category
+    '''
+    return [mpatches.Rectangle((0, 0), 1, 1, facecolor=color, edgecolor=edge, alpha=alpha)
+            for color in color_map.values()]
+
+
+def project_geometries(geoms, src_crs, projection):
+    '''
+    Project geometries into a map projection, transforming all of the coordinates in a single call.
+
+    Unlike cartopy's project_geometry(), geometries are not cut at the edge of the projection's domain, so this is
+    only suitable for regional maps (like the ones in the practicals).
+
+    :param geoms: an array (or GeoSeries) of shapely geometries
+    :param src_crs: the cartopy CRS of the geometries
+    :param projection: the cartopy CRS to project the geometries into (e.g., ax.projection)
+
+    :returns projected: a numpy array of the projected geometries
+    '''
+    values = np.asarray(geoms, dtype=object)
+    if src_crs is None or src_crs == projection:
+        return values
+
+    if get_coordinates is not None:
+        coords = get_coordinates(values)
+        coords = projection.transform_points(src_crs, coords[:, 0], coords[:, 1])[:, :2]
+        return set_coordinates(values.copy(), coords)
+
+    return np.array([None if geom is None else projection.project_geometry(geom, src_crs) for geom in values],
+                    dtype=object)
+
+
+def _ring_parts(ring):
+    xy = np.asarray(ring.coords)[:, :2]
+    codes = np.full(len(xy), Path.LINETO, dtype=Path.code_type)
+    codes[0] = Path.MOVETO
+    codes[-1] = Path.CLOSEPOLY
+    return xy, codes
+
+
+def _line_parts(line):
+    xy = np.asarray(line.coords)[:, :2]
+    codes = np.full(len(xy), Path.LINETO, dtype=Path.code_type)
+    codes[0] = Path.MOVETO
+    return xy, codes
+
+
+def _geometry_parts(geom):
+    # yield the (vertices, codes) for each ring or line in a geometry
+    if geom is None or geom.is_empty:
+        return
+    if geom.geom_type == 'Polygon':
+        yield _ring_parts(geom.exterior)
+        for interior in geom.interiors:
+            yield _ring_parts(interior)
+    elif geom.geom_type == 'LinearRing':
+        yield _ring_parts(geom)
+    elif geom.geom_type == 'LineString':
+        yield _line_parts(geom)
+    elif geom.geom_type in ['MultiPolygon', 'MultiLineString', 'GeometryCollection']:
+        for part in geom.geoms:
+            yield from _geometry_parts(part)
+
+
+def geometry_path(geom):
+    '''
+    Convert a (Multi)Polygon or (Multi)LineString into a single matplotlib Path.
+
+    :param geom: the shapely geometry to convert
+
+    :returns path: the matplotlib Path
+    '''
+    parts = list(_geometry_parts(geom))
+    if len(parts) == 0:
+        return Path(np.empty((0, 2)))
+    vertices = np.concatenate([xy for xy, _ in parts])
+    codes = np.concatenate([codes for _, codes in parts])
+    return Path(vertices, codes)
+
+
+def geometry_collection(geoms, **collection_args):
+    '''
+    Create a single PatchCollection from an array of (already projected) geometries.
+
+    :param geoms: an array of shapely geometries
+    :param collection_args: keyword arguments (facecolors, edgecolor, transform, ...) passed to PatchCollection
+
+    :returns collection: the PatchCollection
+    '''
+    collection_args.setdefault('zorder', 1.5)  # the same default as cartopy's features, so that the order is the same
+    return PatchCollection([mpatches.PathPatch(geometry_path(geom)) for geom in geoms], **collection_args)
+
+
+def add_categorical(ax, gdf, column, colors, crs=None, sort=True, **collection_args):
+    '''
+    Add a layer to a map as a single PatchCollection, coloring each feature by its category.
+
+    :param ax: the axes (or cartopy GeoAxes) to add the layer to
+    :param gdf: the GeoDataFrame to draw
+    :param column: the name of the column that gives the category of each feature
+    :param colors: either a list of colors (assigned to the sorted categories in order), or a dict of
+        {category: color}
+    :param crs: the cartopy CRS of the GeoDataFrame. If None, the geometries are in the data coordinates of the axes.
+    :param sort: whether to sort the categories before assigning colors (if colors is a list)
+    :param collection_args: additional keyword arguments (edgecolor, linewidth, alpha, ...) passed to PatchCollection
+
+    :returns collection, color_map: the PatchCollection, and the dict of {category: color} that was used
+    '''
+    if isinstance(colors, dict):
+        color_map = colors
+    else:
+        color_map = category_colors(gdf[column], colors, sort=sort)
+
+    projection = getattr(ax, 'projection', None)
+    geoms = project_geometries(gdf.geometry.values, crs, projection) if projection is not None \
+        else np.asarray(gdf.geometry.values, dtype=object)
+
+    facecolors = [color_map[category] for category in gdf[column]]
+
+    collection_args.setdefault('edgecolor', 'k')
+    collection = geometry_collection(geoms, facecolors=facecolors, transform=ax.transData, **collection_args)
+    ax.add_collection(collection, autolim=False)
+
+    return collection, color_map
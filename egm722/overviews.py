@@ -0,0 +1,246 @@
+'''
+Display large rasters at the resolution of the screen, rather than at full resolution.
+
+img_display() from the Week 4 assignment always stretches the full-resolution image and passes it to ax.imshow(),
+even though a 10-inch figure can only show a few thousand pixels across. OverviewDisplay instead reads only the part
+of the raster that is visible in the axes, at (about) the resolution of the axes on the screen or page:
+
+- if the GeoTIFF has internal/external overviews, GDAL picks the best overview level when we ask rasterio to read a
+  smaller output shape;
+- otherwise, a pyramid of decimated copies of the raster (2x, 4x, 8x, ...) is built the first time the raster is
+  displayed, and cached on disk for later use.
+
+When the axes are zoomed or panned, the visible window is read again, at the matching level.
+
+The axes data coordinates must be in the same CRS as the raster (for a cartopy GeoAxes, use a projection that matches
+the raster CRS).
+'''
+import os
+import numpy as np
+import rasterio as rio
+import rasterio.windows
+from rasterio.enums import Resampling
+from egm722 import CACHE_ROOT
+from egm722.raster_cache import cache_key
+from egm722.stretch import band_limits, stretch_tile
+
+
+PYRAMID_DIR = os.path.join(CACHE_ROOT, 'pyramids')
+PYRAMID_FACTORS = (2, 4, 8, 16, 32, 64)
+BLOCK_SIZE = 256  # the block size of the pyramid levels, and the number of rows to build at a time
+
+
+def _build_level(fn_prev, fn_level, profile, shape, resampling):
+    # decimate fn_prev to the given (rows, columns), reading and writing one row of blocks at a time
+    height, width = max(1, shape[0]), max(1, shape[1])
+    transform = profile['transform']
+    level_profile = dict(profile, driver='GTiff', width=width, height=height, tiled=True,
+                         blockxsize=BLOCK_SIZE, blockysize=BLOCK_SIZE, compress=None,
+                         transform=transform * transform.scale(profile['width'] / width, profile['height'] / height))
+
+    with rio.open(fn_prev) as prev:
+        yscale = prev.height / height
+
+        fn_tmp = '{}.{}.tmp'.format(fn_level, os.getpid())
+        with rio.open(fn_tmp, 'w', **level_profile) as dst:
+            for row in range(0, height, BLOCK_SIZE):
+                nrows = min(BLOCK_SIZE, height - row)
+                # the (fractional) rows of the previous level that cover this row of blocks
+                src_window = rio.windows.Window(0, row * yscale, prev.width, nrows * yscale)
+                data = prev.read(window=src_window, out_shape=(prev.count, nrows, width), resampling=resampling)
+                dst.write(data, window=rio.windows.Window(0, row, width, nrows))
+    os.replace(fn_tmp, fn_level)
+
+
+def build_pyramid(fn_raster, factors=PYRAMID_FACTORS, resampling=Resampling.average, cache_dir=PYRAMID_DIR):
+    '''
+    Build (or find in the cache) decimated copies of a raster.
+
+    Each level is built from the previous one, one row of 256 x 256 blocks at a time (so that only a strip of each
+    level is held in memory), and written as an uncompressed, tiled GeoTIFF in cache_dir. Levels smaller than 256
+    pixels in both directions are not built.
+
+    :param fn_raster: the filename of the raster
+    :param factors: the decimation factors to build, in increasing order
+    :param resampling: the rasterio.enums.Resampling method to use
+    :param cache_dir: the directory to store the pyramid levels in
+
+    :returns levels: a list of (factor, filename) tuples, starting with (1, fn_raster)
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    levels = [(1, fn_raster)]
+
+    with rio.open(fn_raster) as dataset:
+        profile = dataset.profile
+        width, height = dataset.width, dataset.height
+
+    for factor in factors:
+        if width // factor < 256 and height // factor < 256:
+            break
+        fn_level = os.path.join(cache_dir, cache_key(fn_raster, 'pyramid{}'.format(factor)) + '.tif')
+        if not os.path.exists(fn_level):
+            _build_level(levels[-1][1], fn_level, profile, (height // factor, width // factor), resampling)
+        levels.append((factor, fn_level))
+
+    return levels
+
+
+def axes_resolution(ax):
+    '''
+    Get the size of one screen (or output) pixel of an axes, in data units.
+
+    :param ax: the matplotlib axes
+
+    :returns xres, yres: the size of one pixel in the x and y directions
+    '''
+    ax.apply_aspect()  # make sure the axes position reflects any fixed aspect ratio (e.g., from imshow)
+    x0, x1 = ax.get_xlim()
+    y0, y1 = ax.get_ylim()
+    bbox = ax.get_window_extent()  # in display pixels, which takes the figure dpi into account
+    return abs(x1 - x0) / max(bbox.width, 1), abs(y1 - y0) / max(bbox.height, 1)
+
+
+def choose_level(levels, native_res, target_res):
+    '''
+    Choose the coarsest level whose resolution is still at least as fine as the target resolution.
+
+    :param levels: a list of (factor, filename) tuples, in increasing order of factor
+    :param native_res: the pixel size of the full-resolution raster
+    :param target_res: the pixel size we want to display at
+
+    :returns factor, filename: the chosen level
+    '''
+    best = levels[0]
+    for factor, fn_level in levels:
+        if native_res * factor <= target_res:
+            best = (factor, fn_level)
+    return best
+
+
+def _pixel_window(window, dataset):
+    # expand a window to whole pixels, and make sure it is inside the dataset
+    col0, row0 = int(np.floor(window.col_off)), int(np.floor(window.row_off))
+    col1 = int(np.ceil(window.col_off + window.width))
+    row1 = int(np.ceil(window.row_off + window.height))
+    col0, row0, col1, row1 = max(col0, 0), max(row0, 0), min(col1, dataset.width), min(row1, dataset.height)
+    return rio.windows.Window(col0, row0, max(col1 - col0, 1), max(row1 - row0, 1))
+
+
+class OverviewDisplay(object):
+    '''
+    A raster displayed in a matplotlib axes that is re-read at the right resolution when the axes are zoomed or
+    panned.
+    '''
+
+    def __init__(self, fn_raster, ax, bands, stretch_args=None, resampling=Resampling.average, **imshow_args):
+        '''
+        :param fn_raster: the filename of the raster to display
+        :param ax: the matplotlib axes to display the raster in
+        :param bands: a list of the (0-based) band indices to display, as in img_display (e.g., [3, 2, 1])
+        :param stretch_args: a dict with the pmin, pmax percentiles to use for the stretch. The stretch is
+            calculated once, from a coarse level of the raster, so that colors don't change when zooming.
+        :param resampling: the rasterio.enums.Resampling method used when building or reading levels
+        :param imshow_args: additional keyword arguments to pass to ax.imshow()
+        '''
+        self.fn_raster = fn_raster
+        self.ax = ax
+        self.bands = list(bands)
+        self.resampling = resampling
+        self.imshow_args = imshow_args
+        self._last = None
+
+        with rio.open(fn_raster) as dataset:
+            self.bounds = dataset.bounds
+            self.native_res = max(abs(dataset.res[0]), abs(dataset.res[1]))
+            has_overviews = len(dataset.overviews(1)) > 0
+
+        # if the file has its own overviews, GDAL will use them for us when we read a smaller shape
+        self.levels = [(1, fn_raster)] if has_overviews else build_pyramid(fn_raster, resampling=resampling)
+
+        # calculate the stretch from the coarsest level, so that it is consistent for every zoom level
+        stretch_args = {} if stretch_args is None else stretch_args
+        with rio.open(self.levels[-1][1]) as coarse:
+            coarse_img = coarse.read([b + 1 for b in self.bands], out_shape=self._overview_shape(coarse),
+                                     resampling=resampling)
+        self.limits = band_limits(coarse_img, range(len(self.bands)), **stretch_args)
+
+        # if the axes limits haven't been set yet, zoom to the full raster
+        if ax.get_autoscale_on():
+            xmin, ymin, xmax, ymax = self.bounds
+            ax.set_xlim(xmin, xmax, emit=False)
+            ax.set_ylim(ymin, ymax, emit=False)
+
+        self.handle = None
+        self.update()
+        self._cids = [ax.callbacks.connect('xlim_changed', self.update),
+                      ax.callbacks.connect('ylim_changed', self.update)]
+
+    def _overview_shape(self, dataset, max_size=1024):
+        # the shape to read the whole of a dataset at, no more than max_size pixels across
+        factor = max(1, int(np.ceil(max(dataset.width, dataset.height) / max_size)))
+        return len(self.bands), max(1, dataset.height // factor), max(1, dataset.width // factor)
+
+    def update(self, ax=None):
+        '''
+        Read the visible part of the raster at the resolution of the axes, and update the displayed image.
+        '''
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        xmin, ymin, xmax, ymax = self.bounds
+        x0, x1, y0, y1 = max(x0, xmin), min(x1, xmax), max(y0, ymin), min(y1, ymax)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        xres, yres = axes_resolution(self.ax)
+        factor, fn_level = choose_level(self.levels, self.native_res, min(xres, yres))
+
+        with rio.open(fn_level) as dataset:
+            window = _pixel_window(rio.windows.from_bounds(x0, y0, x1, y1, dataset.transform), dataset)
+
+            # only read at the resolution of the axes - if the file has overviews, GDAL will use them
+            width = max(1, min(int(window.width), int(np.ceil((x1 - x0) / xres))))
+            height = max(1, min(int(window.height), int(np.ceil((y1 - y0) / yres))))
+
+            key = (fn_level, window.flatten(), width, height)
+            if key == self._last:
+                return
+            self._last = key
+
+            data = dataset.read([b + 1 for b in self.bands], window=window, out_shape=(len(self.bands), height, width),
+                                resampling=self.resampling)
+            left, bottom, right, top = rio.windows.bounds(window, dataset.transform)
+
+        dispimg = stretch_tile(data, range(len(self.bands)), self.limits)
+        extent = [left, right, bottom, top]
+
+        if self.handle is None:
+            self.handle = self.ax.imshow(dispimg, extent=extent, **self.imshow_args)
+        else:
+            self.handle.set_data(dispimg)
+            self.handle.set_extent(extent)
+        self.ax.figure.canvas.draw_idle()
+
+    def disconnect(self):
+        '''
+        Stop updating the image when the axes are zoomed or panned.
+        '''
+        for cid in self._cids:
+            self.ax.callbacks.disconnect(cid)
+        self._cids = []
+
+
+def img_display(fn_raster, ax, bands, stretch_args=None, **imshow_args):
+    '''
+    Display a raster at the resolution of the axes, re-reading it when the axes are zoomed or panned.
+
+    Like img_display() from the Week 4 assignment, but takes the filename of the raster instead of the image array.
+
+    :param fn_raster: the filename of the raster to display
+    :param ax: the matplotlib axes to display the raster in
+    :param bands: a list of the (0-based) band indices to display
+    :param stretch_args: a dict of keyword arguments (pmin, pmax) used to calculate the stretch
+    :param imshow_args: additional keyword arguments to pass to ax.imshow()
+
+    :returns handle, ax: the OverviewDisplay, and the axes
+    '''
+    return OverviewDisplay(fn_raster, ax, bands, stretch_args, **imshow_args), ax
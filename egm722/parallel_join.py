@@ -0,0 +1,152 @@
+'''
+A spatial join that is split into spatially coherent chunks and run in a pool of processes.
+
+In the Week 3 practical, the spatial join runs on a single core:
+
+    join = gpd.sjoin(counties, roads_itm, how='inner', lsuffix='left', rsuffix='right')
+
+For very large right-hand layers (millions of GPS points or road segments joined against NI_Wards), partitioned_sjoin()
+instead:
+
+- sorts the features of the right layer along a Hilbert (or Z-order) curve, and splits them into contiguous chunks,
+  so that each chunk covers a small, compact area;
+- shares both layers, and the bounds of each left feature (calculated once), with a pool of worker processes (where
+  processes are started with fork, the workers use the parent's copy; otherwise, each worker is sent a copy once,
+  when it starts);
+- in each worker, builds a spatial index of one chunk and queries it with only the left features that overlap the
+  chunk, returning the positions of the matching pairs;
+- merges the pairs from all of the chunks and sorts them, so that the output is the same as a single join (and the
+  same from one run to the next), whatever order the chunks finish in.
+
+The output is the same as egm722.join_cache.cached_sjoin() (and gpd.sjoin()).
+'''
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import geopandas as gpd
+from egm722.curves import curve_key
+from egm722.join_cache import join_from_pairs
+from egm722.zones import query_pairs
+
+
+_LEFT = None  # the left and right layers used by each worker process
+_RIGHT = None
+_LEFT_BOUNDS = None  # the (xmin, ymin, xmax, ymax) bounds of each left feature, calculated once by the parent
+
+
+def partition(gdf, n_chunks, curve='hilbert'):
+    '''
+    Split the features of a layer into spatially coherent chunks, using the order of the features along a
+    space-filling curve.
+
+    :param gdf: the GeoDataFrame to split
+    :param n_chunks: the number of chunks to split the features into
+    :param curve: the curve to sort the features along, either 'hilbert' or 'morton' (Z-order)
+
+    :returns chunks: a list of integer arrays, giving the (0-based) positions of the features in each chunk
+    '''
+    n_chunks = max(1, min(n_chunks, len(gdf)))
+    if n_chunks == 1:  # the order of the features within a single chunk doesn't matter, so there is no need to sort
+        return [np.arange(len(gdf))] if len(gdf) > 0 else []
+    order = np.argsort(curve_key(gdf, curve=curve), kind='stable')
+    return [chunk for chunk in np.array_split(order, n_chunks) if chunk.size > 0]
+
+
+def _init_worker(left, right, left_bounds):
+    global _LEFT, _RIGHT, _LEFT_BOUNDS
+    if left is not None:
+        _LEFT, _RIGHT, _LEFT_BOUNDS = left, right, left_bounds
+
+
+def _chunk_pairs(args):
+    # join one chunk of the right layer against the left layer, returning the positions of the matching pairs
+    right_pos, predicate = args
+    if right_pos.size == len(_RIGHT):  # a single chunk: use the whole layer (and its spatial index, if it has one)
+        chunk = _RIGHT.geometry
+    else:
+        chunk = gpd.GeoSeries(_RIGHT.geometry.values[right_pos], crs=_RIGHT.crs)
+
+    # only query the chunk with the left features that overlap it
+    xmin, ymin, xmax, ymax = chunk.total_bounds
+    left_bounds = _LEFT_BOUNDS
+    candidates = np.flatnonzero((left_bounds[:, 0] <= xmax) & (left_bounds[:, 2] >= xmin) &
+                                (left_bounds[:, 1] <= ymax) & (left_bounds[:, 3] >= ymin))
+
+    left_idx, chunk_idx = query_pairs(chunk.sindex, _LEFT.geometry.values[candidates], predicate=predicate)
+    return candidates[left_idx], right_pos[chunk_idx]
+
+
+def partitioned_pairs(left, right, predicate='intersects', n_chunks=None, max_workers=None, curve='hilbert'):
+    '''
+    Find the positions of all pairs of features in two layers that satisfy a spatial predicate, splitting the right
+    layer into chunks that are joined in a pool of processes.
+
+    :param left: the left GeoDataFrame (e.g., wards)
+    :param right: the right GeoDataFrame (e.g., GPS points or roads)
+    :param predicate: the binary predicate to use (e.g., 'intersects', 'within', 'contains')
+    :param n_chunks: the number of chunks to split the right layer into. By default, uses 4 chunks per worker (or a
+        single chunk, if max_workers is 1).
+    :param max_workers: the number of processes to use. If 1, the chunks are joined in this process.
+    :param curve: the curve used to split the right layer, either 'hilbert' or 'morton' (Z-order)
+
+    :returns left_pos, right_pos: integer arrays of the (0-based) positions of each matching pair, sorted by
+        left_pos and then right_pos
+    '''
+    global _LEFT, _RIGHT, _LEFT_BOUNDS
+    workers = max_workers or os.cpu_count() or 1
+    if n_chunks is None:
+        n_chunks = 4 * workers if workers > 1 else 1
+    jobs = [(chunk, predicate) for chunk in partition(right, n_chunks, curve)]
+
+    _LEFT, _RIGHT, _LEFT_BOUNDS = left, right, left.geometry.bounds.to_numpy()
+    try:
+        if workers == 1:
+            results = [_chunk_pairs(job) for job in jobs]
+        else:
+            # with fork, the workers share the layers with this process; otherwise, each one is sent a copy once
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context, initargs = multiprocessing.get_context('fork'), (None, None, None)
+            else:
+                context, initargs = multiprocessing.get_context(), (left, right, _LEFT_BOUNDS)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=initargs) as pool:
+                results = list(pool.map(_chunk_pairs, jobs))
+    finally:
+        _LEFT = _RIGHT = _LEFT_BOUNDS = None
+
+    if len(results) == 0:
+        return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+
+    left_pos = np.concatenate([pairs[0] for pairs in results]).astype(np.intp)
+    right_pos = np.concatenate([pairs[1] for pairs in results]).astype(np.intp)
+    order = np.lexsort((right_pos, left_pos))
+    return left_pos[order], right_pos[order]
+
+
+def partitioned_sjoin(left, right, how='inner', predicate='intersects', lsuffix='left', rsuffix='right',
+                      n_chunks=None, max_workers=None, curve='hilbert'):
+    '''
+    Spatially join two GeoDataFrames, like gpd.sjoin(), splitting the right layer into spatially coherent chunks
+    that are joined against the left layer in a pool of processes.
+
+    :param left: the left GeoDataFrame (e.g., wards)
+    :param right: the right GeoDataFrame (e.g., GPS points or roads)
+    :param how: 'inner' (only keep left features with a match) or 'left' (keep all left features)
+    :param predicate: the binary predicate to use (e.g., 'intersects', 'within', 'contains')
+    :param lsuffix: the suffix to add to overlapping column names from the left layer
+    :param rsuffix: the suffix to add to overlapping column names from the right layer
+    :param n_chunks: the number of chunks to split the right layer into. By default, uses 4 chunks per worker (or a
+        single chunk, if max_workers is 1).
+    :param max_workers: the number of processes to use. If 1, the chunks are joined in this process.
+    :param curve: the curve used to split the right layer, either 'hilbert' or 'morton' (Z-order)
+
+    :returns join: the joined GeoDataFrame
+    '''
+    if how not in ('inner', 'left'):
+        raise ValueError("how must be one of 'inner', 'left'")
+    if not left.crs == right.crs:
+        raise ValueError('left and right must have the same CRS: {} != {}'.format(left.crs, right.crs))
+
+    left_pos, right_pos = partitioned_pairs(left, right, predicate, n_chunks, max_workers, curve)
+    return join_from_pairs(left, right, left_pos, right_pos, how, lsuffix, rsuffix)
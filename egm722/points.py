@@ -0,0 +1,105 @@
+'''
+Bulk creation of point GeoDataFrames from tables of coordinates (e.g., GPS fixes).
+
+In the Week 1 practical, we create the points for each row of a CSV file like this:
+
+    df['geometry'] = list(zip(df['lon'], df['lat']))
+    df['geometry'] = df['geometry'].apply(Point)
+
+which creates a tuple and a Point for every row, one at a time. Here, the points are created in one go from the
+arrays of coordinates using gpd.points_from_xy(), and large files can be read and written a chunk at a time, so that
+memory use stays the same no matter how large the file is.
+'''
+import pandas as pd
+import geopandas as gpd
+
+
+def points_from_table(df, x='lon', y='lat', z=None, crs='epsg:4326', drop=True):
+    '''
+    Create a point GeoDataFrame from a DataFrame with coordinate columns.
+
+    :param df: the DataFrame
+    :param x: the name of the x (longitude) column
+    :param y: the name of the y (latitude) column
+    :param z: the name of the z (elevation) column, if any
+    :param crs: the CRS of the coordinates
+    :param drop: remove the coordinate columns from the output
+
+    :returns gdf: the point GeoDataFrame
+    '''
+    geometry = gpd.points_from_xy(df[x], df[y], None if z is None else df[z], crs=crs)
+
+    if drop:
+        df = df.drop(columns=[col for col in (x, y, z) if col is not None])
+
+    return gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
+
+
+def iter_points(fn, x='lon', y='lat', z=None, crs='epsg:4326', drop=True, chunksize=100000, **read_args):
+    '''
+    Read a CSV file of coordinates a chunk at a time, creating a point GeoDataFrame for each chunk.
+
+    :param fn: the filename of the CSV file
+    :param x: the name of the x (longitude) column
+    :param y: the name of the y (latitude) column
+    :param z: the name of the z (elevation) column, if any
+    :param crs: the CRS of the coordinates
+    :param drop: remove the coordinate columns from the output
+    :param chunksize: the number of rows to read at a time
+    :param read_args: additional keyword arguments to pass to pd.read_csv()
+
+    :returns chunks: a generator of point GeoDataFrames
+    '''
+    for chunk in pd.read_csv(fn, chunksize=chunksize, **read_args):
+        yield points_from_table(chunk, x, y, z, crs, drop)
+
+
+def read_points(fn, x='lon', y='lat', z=None, crs='epsg:4326', drop=True, **read_args):
+    '''
+    Read a CSV file of coordinates (like GPSPoints.txt) into a point GeoDataFrame.
+
+    :param fn: the filename of the CSV file
+    :param x: the name of the x (longitude) column
+    :param y: the name of the y (latitude) column
+    :param z: the name of the z (elevation) column, if any
+    :param crs: the CRS of the coordinates
+    :param drop: remove the coordinate columns from the output
+    :param read_args: additional keyword arguments to pass to pd.read_csv()
+
+    :returns gdf: the point GeoDataFrame
+    '''
+    return points_from_table(pd.read_csv(fn, **read_args), x, y, z, crs, drop)
+
+
+def ingest_points(fn, out_fn, x='lon', y='lat', z=None, crs='epsg:4326', drop=True, chunksize=100000,
+                  driver=None, **read_args):
+    '''
+    Convert a (large) CSV file of coordinates into a vector file (e.g., a shapefile or GeoPackage), a chunk at a
+    time.
+
+    Only one chunk is held in memory at a time: each chunk is converted to points and appended to the output file.
+
+    :param fn: the filename of the CSV file
+    :param out_fn: the filename of the output vector file. If it exists, it is overwritten.
+    :param x: the name of the x (longitude) column
+    :param y: the name of the y (latitude) column
+    :param z: the name of the z (elevation) column, if any
+    :param crs: the CRS of the coordinates
+    :param drop: remove the coordinate columns from the output
+    :param chunksize: the number of rows to read at a time
+    :param driver: the OGR driver to use for the output file. If None, it is guessed from the file extension.
+    :param read_args: additional keyword arguments to pass to pd.read_csv()
+
+    :returns count: the number of points written
+    '''
+    write_args = {} if driver is None else {'driver': driver}
+    count = 0
+    mode = 'w'
+    for chunk in iter_points(fn, x, y, z, crs, drop, chunksize, **read_args):
+        if len(chunk) == 0:
+            continue
+        chunk.to_file(out_fn, mode=mode, **write_args)
+        mode = 'a'  # after the first chunk, append to the file
+        count += len(chunk)
+
+    return count
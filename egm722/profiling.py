@@ -0,0 +1,309 @@
+'''
+Named timing spans for the stages of the practical scripts (read_file, to_crs, sjoin, clip, groupby, add_feature,
+savefig, ...), so that we can see where the time in a run goes.
+
+Each span records the wall time, the CPU time, the peak memory (resident set size) of the process while it was open,
+and the number of features or pixels it handled:
+
+    from egm722 import profiling
+
+    roads = profiling.timed('read_file', gpd.read_file, 'data_files/NI_roads.shp')
+
+    with profiling.span('savefig'):
+        myFig.savefig('map.png')
+
+    profiling.report()
+
+Profiling is off unless profiling.enable() is called, or the EGM722_PROFILE environment variable is set (e.g.,
+EGM722_PROFILE=trace.json, which also sets the name of the trace file that report() writes). When it is off, span()
+returns a shared do-nothing context manager, timed() simply calls the function, and report() does nothing, so the
+spans can be left in the scripts.
+
+report() prints a summary table, and writes the spans to a Chrome trace file (JSON) that can be opened in
+chrome://tracing or https://ui.perfetto.dev to see the spans on a timeline.
+'''
+import os
+import sys
+import json
+import time
+import threading
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss():
+    '''
+    Get the peak resident set size (memory use) of the current process.
+
+    On Linux, this is the peak since the last call to reset_peak(); elsewhere, it is the peak since the process
+    started.
+
+    :returns peak: the peak resident set size in bytes, or None if it can't be found
+    '''
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, kB on Linux
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+
+def reset_peak():
+    '''
+    Reset the peak resident set size of the current process to its current value, so that peak_rss() only includes
+    what happens after this call. This only works on Linux; elsewhere, the peak is the highest value since the process
+    started.
+
+    :returns reset: True if the peak was reset, False otherwise
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _count(result):
+    # the number of features (rows) or pixels in the result of a timed function
+    if hasattr(result, 'size') and not hasattr(result, 'columns') and not callable(result.size):
+        return int(result.size)
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+class _NullSpan(object):
+    # the span returned when profiling is off: setting count or args on it does nothing
+    count = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    '''
+    A single named span. Use profiling.span() to create one, rather than creating it directly.
+
+    The count (number of features or pixels) can be set inside the with block, once it is known:
+
+        with profiling.span('sjoin') as s:
+            join = gpd.sjoin(counties, roads_itm)
+            s.count = len(join)
+    '''
+    def __init__(self, profiler, name, count=None, **args):
+        self.profiler = profiler
+        self.name = name
+        self.count = count
+        self.args = args
+        self.peak = None
+
+    def __enter__(self):
+        stack = self.profiler.stack()
+        if len(stack) > 0:
+            # the peak is reset for each span, so keep the peak so far of the span that this one is inside of
+            stack[-1]._update_peak(peak_rss())
+        stack.append(self)
+        reset_peak()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def _update_peak(self, peak):
+        if peak is not None:
+            self.peak = peak if self.peak is None else max(self.peak, peak)
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        self._update_peak(peak_rss())
+
+        stack = self.profiler.stack()
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1]._update_peak(self.peak)
+
+        self.profiler.record({'name': self.name, 'start': self._wall - self.profiler.start, 'wall': wall,
+                              'cpu': cpu, 'peak_mb': None if self.peak is None else self.peak / 2 ** 20,
+                              'count': self.count, 'depth': len(stack), 'thread': threading.get_ident(),
+                              'args': self.args})
+        return False
+
+
+class Profiler(object):
+    '''
+    Collects the spans recorded in a run. The module-level functions (span(), timed(), report()) use a single shared
+    Profiler.
+    '''
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def stack(self):
+        # the spans that are currently open in this thread
+        if getattr(self._local, 'stack', None) is None:
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+        self.start = time.perf_counter()
+
+    def summary(self):
+        '''
+        Summarize the spans by name: the number of calls, total wall and CPU time, the highest peak memory, and the
+        total count. Spans are listed in the order that they were first opened.
+
+        :returns text: the summary table, as a string
+        '''
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span['name'], {'calls': 0, 'wall': 0., 'cpu': 0., 'peak_mb': None,
+                                                     'count': None, 'first': span['start']})
+            total['calls'] += 1
+            total['wall'] += span['wall']
+            total['cpu'] += span['cpu']
+            total['first'] = min(total['first'], span['start'])
+            if span['peak_mb'] is not None:
+                total['peak_mb'] = max(total['peak_mb'] or 0, span['peak_mb'])
+            if span['count'] is not None:
+                total['count'] = (total['count'] or 0) + span['count']
+
+        # the share of the time is taken from the outermost spans, so that nested spans aren't counted twice
+        profiled = sum(span['wall'] for span in self.spans if span['depth'] == 0) or 1.
+
+        lines = ['{:<20} {:>6} {:>10} {:>10} {:>7} {:>10} {:>12}'.format('span', 'calls', 'wall (s)', 'cpu (s)',
+                                                                         '% wall', 'peak (MB)', 'count')]
+        for name, total in sorted(totals.items(), key=lambda item: item[1]['first']):
+            lines.append('{:<20} {:>6} {:>10.3f} {:>10.3f} {:>7.1f} {:>10} {:>12}'.format(
+                name, total['calls'], total['wall'], total['cpu'], 100 * total['wall'] / profiled,
+                '-' if total['peak_mb'] is None else '{:.0f}'.format(total['peak_mb']),
+                '-' if total['count'] is None else total['count']))
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        '''
+        Convert the spans into Chrome trace events (complete events, with times in microseconds).
+
+        :returns events: a list of trace event dicts
+        '''
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            args = dict(span['args'], cpu_s=span['cpu'], peak_mb=span['peak_mb'], count=span['count'])
+            events.append({'name': span['name'], 'ph': 'X', 'ts': span['start'] * 1e6, 'dur': span['wall'] * 1e6,
+                           'pid': pid, 'tid': span['thread'], 'args': args})
+        return events
+
+    def write_trace(self, fn):
+        '''
+        Write the spans to a Chrome trace (JSON) file.
+
+        :param fn: the filename to write to
+        '''
+        with open(fn, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+PROFILER = Profiler(enabled='EGM722_PROFILE' in os.environ)
+
+
+def enable():
+    '''
+    Start recording spans.
+    '''
+    PROFILER.enabled = True
+
+
+def disable():
+    '''
+    Stop recording spans. Spans that have already been recorded are kept.
+    '''
+    PROFILER.enabled = False
+
+
+def span(name, count=None, **args):
+    '''
+    Create a named span, to use in a with statement around one stage of a script.
+
+    :param name: the name of the stage (e.g., 'sjoin')
+    :param count: the number of features or pixels handled in the stage, if already known
+    :param args: any other values to record with the span (shown in the trace viewer)
+
+    :returns span: a Span, or a do-nothing context manager if profiling is off
+    '''
+    if not PROFILER.enabled:
+        return _NULL_SPAN
+    return Span(PROFILER, name, count, **args)
+
+
+def timed(name, func, *args, **kwargs):
+    '''
+    Call a function inside a named span, using the length (or size, for arrays) of the result as the span count.
+
+    :param name: the name of the stage (e.g., 'read_file')
+    :param func: the function to call
+    :param args: the positional arguments to call func with
+    :param kwargs: the keyword arguments to call func with
+
+    :returns result: the output of func(*args, **kwargs)
+    '''
+    if not PROFILER.enabled:
+        return func(*args, **kwargs)
+    with Span(PROFILER, name) as this_span:
+        result = func(*args, **kwargs)
+        this_span.count = _count(result)
+    return result
+
+
+def report(trace_fn=None, out=sys.stdout):
+    '''
+    Print a summary of the recorded spans, and write them to a Chrome trace file. Does nothing if profiling is off.
+
+    :param trace_fn: the name of the trace file to write. If None, uses the value of the EGM722_PROFILE environment
+        variable (if it is a filename), or doesn't write a trace file.
+    :param out: the file object to print the summary to
+    '''
+    if not PROFILER.enabled:
+        return
+    print(PROFILER.summary(), file=out)
+
+    if trace_fn is None and os.environ.get('EGM722_PROFILE', '').lower().endswith('.json'):
+        trace_fn = os.environ['EGM722_PROFILE']
+    if trace_fn is not None:
+        PROFILER.write_trace(trace_fn)
+        print('trace written to {}'.format(trace_fn), file=out)
@@ -0,0 +1,235 @@
+'''
+A memory-mapped, on-disk cache of decoded raster bands.
+
+Each of the practicals opens and decodes the same GeoTIFFs (NI_DEM.tif, LCM2015_Aggregate_100m.tif, NI_Mosaic.tif)
+every time it is run. The first time a band is read through this module, it is decoded once and written to an
+uncompressed .npy file in the cache directory; after that, reading the band simply maps the cached file into memory.
+
+The cache is keyed by the file path, modification time, and band number, so it is refreshed automatically if the
+raster changes. Once the cache grows beyond its size limit, the least recently used bands are removed.
+
+To use it, change the import at the top of a script from:
+
+    import rasterio as rio
+
+to:
+
+    from egm722 import raster_cache as rio
+
+and existing code like this will read from the cache:
+
+    with rio.open('data_files/NI_Mosaic.tif') as dataset:
+        img = dataset.read()
+        xmin, ymin, xmax, ymax = dataset.bounds
+
+Only rio.open() is replaced; the rasterio submodules used in the practicals (rio.features, rio.windows, rio.transform,
+rio.mask, rio.warp) are the same as rasterio's, so code like rio.features.rasterize(...) works unchanged.
+'''
+import os
+import hashlib
+import numpy as np
+import rasterio
+import rasterio.windows
+from rasterio import features, mask, transform, warp, windows  # re-exported, so this module can stand in for rasterio
+from egm722 import CACHE_ROOT
+
+
+CACHE_DIR = os.environ.get('EGM722_RASTER_CACHE', os.path.join(CACHE_ROOT, 'rasters'))
+MAX_CACHE_BYTES = int(float(os.environ.get('EGM722_RASTER_CACHE_SIZE', 4e9)))  # 4 GB by default
+ROWS_PER_BLOCK = 512  # the number of rows to decode at a time when filling the cache
+
+
+def cache_key(fn_raster, band):
+    '''
+    Get the cache key for a raster band, based on the absolute file path, the modification time and size of the file,
+    and the band number.
+
+    :param fn_raster: the filename of the raster
+    :param band: the (1-based) band number
+
+    :returns key: a string that identifies this version of the band
+    '''
+    stat = os.stat(fn_raster)
+    ident = '{}|{}|{}|{}'.format(os.path.abspath(fn_raster), stat.st_mtime_ns, stat.st_size, band)
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+
+def cached_files(cache_dir=CACHE_DIR):
+    '''
+    List the files in the cache, from least to most recently used.
+
+    :param cache_dir: the cache directory
+
+    :returns files: a list of (filename, size in bytes) tuples
+    '''
+    if not os.path.isdir(cache_dir):
+        return []
+    files = [os.path.join(cache_dir, fn) for fn in os.listdir(cache_dir) if fn.endswith('.npy')]
+    files.sort(key=os.path.getmtime)
+    return [(fn, os.path.getsize(fn)) for fn in files]
+
+
+def evict(max_bytes=MAX_CACHE_BYTES, cache_dir=CACHE_DIR, keep=()):
+    '''
+    Remove the least recently used files from the cache, until the total size is below max_bytes.
+
+    :param max_bytes: the maximum size of the cache, in bytes
+    :param cache_dir: the cache directory
+    :param keep: a list of filenames that should not be removed (e.g., the file that has just been added)
+
+    :returns removed: a list of the files that were removed
+    '''
+    files = cached_files(cache_dir)
+    total = sum(size for _, size in files)
+    removed = []
+    for fn, size in files:
+        if total <= max_bytes:
+            break
+        if fn in keep:
+            continue
+        try:
+            os.remove(fn)
+        except OSError:  # on Windows, a file that is still mapped by another array can't be removed
+            continue
+        total -= size
+        removed.append(fn)
+    return removed
+
+
+def _fill_cache(dataset, band, fn_cache):
+    # decode the band a block of rows at a time, writing into a memory-mapped .npy file, so that we never need to
+    # hold the whole decoded band in memory. We write to a temporary file first so that an interrupted write can't
+    # leave a broken file in the cache.
+    fn_tmp = '{}.{}.tmp'.format(fn_cache, os.getpid())
+    out = np.lib.format.open_memmap(fn_tmp, mode='w+', dtype=dataset.dtypes[band - 1],
+                                    shape=(dataset.height, dataset.width))
+    for row in range(0, dataset.height, ROWS_PER_BLOCK):
+        nrows = min(ROWS_PER_BLOCK, dataset.height - row)
+        out[row:row + nrows] = dataset.read(band, window=rasterio.windows.Window(0, row, dataset.width, nrows))
+    out.flush()
+    del out
+    os.replace(fn_tmp, fn_cache)
+
+
+def load_band(fn_raster, band=1, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, dataset=None):
+    '''
+    Load a single raster band as a memory-mapped array, decoding it into the cache first if needed.
+
+    The array is mapped copy-on-write: it can be modified like a normal array, but changes are not written back to
+    the cache.
+
+    :param fn_raster: the filename of the raster
+    :param band: the (1-based) band number to load
+    :param cache_dir: the cache directory
+    :param max_bytes: the maximum size of the cache, in bytes
+    :param dataset: an already-open rasterio dataset for fn_raster, used to fill the cache
+
+    :returns band: a numpy.memmap with shape (rows, columns)
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    fn_cache = os.path.join(cache_dir, cache_key(fn_raster, band) + '.npy')
+
+    if os.path.exists(fn_cache):
+        os.utime(fn_cache)  # mark the file as recently used
+    else:
+        if dataset is None:
+            with rasterio.open(fn_raster) as dataset:
+                _fill_cache(dataset, band, fn_cache)
+        else:
+            _fill_cache(dataset, band, fn_cache)
+        evict(max_bytes, cache_dir, keep=[fn_cache])
+
+    return np.load(fn_cache, mmap_mode='c')
+
+
+class CachedDataset(object):
+    '''
+    A read-only rasterio dataset whose read() method loads bands from the cache.
+
+    Apart from read(), all of the attributes and methods (bounds, crs, transform, nodata, ...) are those of the
+    underlying rasterio dataset.
+    '''
+
+    def __init__(self, fn_raster, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, **kwargs):
+        self.name = fn_raster
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._dataset = rasterio.open(fn_raster, **kwargs)  # only reads the header, not the pixel values
+
+    def __getattr__(self, attr):
+        return getattr(self._dataset, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return '<cached {!r}>'.format(self._dataset)
+
+    def close(self):
+        self._dataset.close()
+
+    def read_band(self, band):
+        '''
+        Load a single band from the cache as a memory-mapped array.
+
+        :param band: the (1-based) band number
+
+        :returns band: a numpy.memmap with shape (rows, columns)
+        '''
+        return load_band(self.name, band, self.cache_dir, self.max_bytes, dataset=self._dataset)
+
+    def read(self, indexes=None, window=None, masked=False, **kwargs):
+        '''
+        Read band(s) from the cache, in the same way as rasterio's DatasetReader.read().
+
+        :param indexes: a band number (returns a 2d array), or a list of band numbers (returns a 3d array). If None,
+            reads all bands.
+        :param window: a rasterio.windows.Window, or ((row_start, row_stop), (col_start, col_stop)) tuple, to read
+        :param masked: return a masked array, with nodata values masked
+        :param kwargs: any other keyword arguments (e.g., out_shape, resampling) are passed to rasterio's read(),
+            bypassing the cache.
+
+        :returns arr: the array of values
+        '''
+        if kwargs:
+            return self._dataset.read(indexes, window=window, masked=masked, **kwargs)
+
+        bands = list(range(1, self.count + 1)) if indexes is None else indexes
+        single = isinstance(bands, int)
+
+        if window is not None:
+            if not isinstance(window, rasterio.windows.Window):
+                window = rasterio.windows.Window.from_slices(*window)
+            rows, cols = window.round_offsets().round_lengths().toslices()
+        else:
+            rows, cols = slice(None), slice(None)
+
+        if single:
+            arr = self.read_band(bands)[rows, cols]
+        else:
+            arr = np.stack([self.read_band(b)[rows, cols] for b in bands])
+
+        if masked:
+            nodata = self.nodata
+            mask = np.isnan(arr) if nodata is not None and np.isnan(nodata) else arr == nodata
+            arr = np.ma.masked_array(arr, mask=mask if nodata is not None else False)
+
+        return arr
+
+
+def open(fn_raster, mode='r', **kwargs):
+    '''
+    Open a raster for reading through the cache - a drop-in replacement for rasterio.open() for reading.
+
+    :param fn_raster: the filename of the raster to open
+    :param mode: the mode to open the file in. Only 'r' (read) is cached; any other mode uses rasterio.open().
+    :param kwargs: additional keyword arguments (e.g., cache_dir, max_bytes) passed to CachedDataset
+
+    :returns dataset: a CachedDataset (mode='r') or rasterio dataset
+    '''
+    if mode != 'r':
+        return rasterio.open(fn_raster, mode, **kwargs)
+    return CachedDataset(fn_raster, **kwargs)
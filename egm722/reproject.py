@@ -0,0 +1,209 @@
+'''
+Faster re-projection of vector layers that we re-project again and again.
+
+The practicals re-project the same layers every time they are run - counties.to_crs(epsg=32629),
+roads.to_crs(epsg=2157), and so on - and each call to to_crs() creates a new pyproj Transformer. This module:
+
+- keeps a least-recently-used cache of Transformer objects for each (source, target) CRS pair, in each thread, that
+  lasts between calls;
+- transforms all of the coordinates of a layer as a single flat array, split into chunks that are transformed in
+  parallel threads for large layers (with shapely >= 2.0; otherwise, one geometry at a time). The threads are kept
+  between calls, so each one only has to create its Transformers once;
+- stores re-projected layers on disk, keyed by a hash of the source file and the target CRS, so that
+  read_reprojected() only has to re-project a file the first time.
+'''
+import os
+import atexit
+import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely.ops
+from pyproj import CRS, Transformer
+from egm722 import CACHE_ROOT
+from egm722.hashing import file_hash
+
+try:
+    from shapely import get_coordinates, set_coordinates  # shapely >= 2.0
+except ImportError:
+    get_coordinates = set_coordinates = None
+
+
+REPROJECT_DIR = os.path.join(CACHE_ROOT, 'reprojected')
+CHUNK_SIZE = 2 ** 18  # the number of coordinates to transform in each chunk
+MAX_TRANSFORMERS = 32  # the number of Transformers to keep in each thread, least recently used first out
+
+_local = threading.local()
+_pools = {}  # the thread pools used to transform large layers, by number of workers
+_pools_lock = threading.Lock()
+
+
+def _crs_key(crs):
+    # a hashable, unambiguous representation of a CRS
+    return CRS.from_user_input(crs).to_wkt()
+
+
+def get_transformer(src_crs, dst_crs):
+    '''
+    Get a pyproj Transformer between two CRSs, re-using a cached Transformer if one has been created before (in the
+    same thread).
+
+    :param src_crs: the source CRS (anything accepted by pyproj.CRS.from_user_input, e.g. 'epsg:4326')
+    :param dst_crs: the target CRS
+
+    :returns transformer: an (x, y) ordered pyproj.Transformer
+    '''
+    return _thread_transformer(_crs_key(src_crs), _crs_key(dst_crs))
+
+
+def _new_transformer(src_wkt, dst_wkt):
+    return Transformer.from_crs(CRS.from_wkt(src_wkt), CRS.from_wkt(dst_wkt), always_xy=True)
+
+
+def _thread_transformer(src_wkt, dst_wkt):
+    # each thread gets its own LRU cache of Transformers, as older versions of pyproj are not thread-safe
+    cached = getattr(_local, 'transformer', None)
+    if cached is None:
+        cached = _local.transformer = functools.lru_cache(maxsize=MAX_TRANSFORMERS)(_new_transformer)
+    return cached(src_wkt, dst_wkt)
+
+
+def _get_pool(max_workers):
+    # the pool (and so the Transformers cached in its threads) is kept for the next call
+    with _pools_lock:
+        if max_workers not in _pools:
+            _pools[max_workers] = ThreadPoolExecutor(max_workers=max_workers)
+        return _pools[max_workers]
+
+
+def _shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+
+atexit.register(_shutdown_pools)
+
+
+def transform_coords(coords, src_crs, dst_crs, chunk_size=CHUNK_SIZE, max_workers=None):
+    '''
+    Transform an (N, 2) or (N, 3) array of coordinates, in parallel chunks for large arrays.
+
+    :param coords: the array of coordinates to transform (modified in place)
+    :param src_crs: the source CRS
+    :param dst_crs: the target CRS
+    :param chunk_size: the number of coordinates in each chunk
+    :param max_workers: the number of threads to use
+
+    :returns coords: the transformed coordinates
+    '''
+    src_wkt, dst_wkt = _crs_key(src_crs), _crs_key(dst_crs)
+
+    def _transform(start):
+        chunk = coords[start:start + chunk_size]
+        transformer = _thread_transformer(src_wkt, dst_wkt)
+        if chunk.shape[1] == 3:
+            chunk[:, 0], chunk[:, 1], chunk[:, 2] = transformer.transform(chunk[:, 0], chunk[:, 1], chunk[:, 2])
+        else:
+            chunk[:, 0], chunk[:, 1] = transformer.transform(chunk[:, 0], chunk[:, 1])
+
+    starts = range(0, len(coords), chunk_size)
+    if len(starts) <= 1 or max_workers == 1:
+        for start in starts:
+            _transform(start)
+    else:
+        list(_get_pool(max_workers).map(_transform, starts))
+
+    return coords
+
+
+def reproject_geometry(geoms, crs=None, epsg=None, chunk_size=CHUNK_SIZE, max_workers=None):
+    '''
+    Re-project a GeoSeries, using a cached Transformer and (with shapely >= 2.0) a single flat coordinate array.
+
+    :param geoms: the GeoSeries to re-project. It must have a CRS set.
+    :param crs: the target CRS
+    :param epsg: the EPSG code of the target CRS (used if crs is None)
+    :param chunk_size: the number of coordinates in each chunk
+    :param max_workers: the number of threads to use
+
+    :returns reprojected: the re-projected GeoSeries
+    '''
+    if geoms.crs is None:
+        raise ValueError('Cannot transform naive geometries. Please set a crs on the object first.')
+    if crs is None and epsg is None:
+        raise ValueError('Must pass either crs or epsg.')
+    dst_crs = CRS.from_user_input(crs if crs is not None else 'epsg:{}'.format(epsg))
+
+    if geoms.crs == dst_crs:
+        return geoms.copy()
+
+    values = np.asarray(geoms.values, dtype=object)
+    if get_coordinates is not None:
+        new_geoms = values.copy()
+        has_z = geoms.has_z.to_numpy()
+        # 2D and 3D geometries are transformed separately, so that 2D geometries don't get a NaN z coordinate
+        for subset, include_z in [(has_z, True), (~has_z, False)]:
+            if subset.any():
+                coords = get_coordinates(values[subset], include_z=include_z)
+                coords = transform_coords(coords, geoms.crs, dst_crs, chunk_size, max_workers)
+                new_geoms[subset] = set_coordinates(values[subset], coords)
+    else:
+        transformer = get_transformer(geoms.crs, dst_crs)
+        new_geoms = [None if geom is None else shapely.ops.transform(transformer.transform, geom) for geom in values]
+
+    return gpd.GeoSeries(new_geoms, index=geoms.index, crs=dst_crs, name=geoms.name)
+
+
+def to_crs(gdf, crs=None, epsg=None, chunk_size=CHUNK_SIZE, max_workers=None):
+    '''
+    Re-project a GeoDataFrame - a faster version of gdf.to_crs(crs=None, epsg=None).
+
+    :param gdf: the GeoDataFrame to re-project
+    :param crs: the target CRS
+    :param epsg: the EPSG code of the target CRS (used if crs is None)
+    :param chunk_size: the number of coordinates in each chunk
+    :param max_workers: the number of threads to use
+
+    :returns reprojected: a re-projected copy of the GeoDataFrame
+    '''
+    geoms = reproject_geometry(gdf.geometry, crs, epsg, chunk_size, max_workers)
+    out = gdf.copy()
+    out[gdf.geometry.name] = geoms
+    return out.set_crs(geoms.crs, allow_override=True)
+
+
+def read_reprojected(fn, crs=None, epsg=None, cache_dir=REPROJECT_DIR, **kwargs):
+    '''
+    Read a vector file and re-project it, re-using a stored copy if the same file has been re-projected to the same
+    CRS before.
+
+    :param fn: the filename of the vector layer (e.g., a shapefile)
+    :param crs: the target CRS
+    :param epsg: the EPSG code of the target CRS (used if crs is None)
+    :param cache_dir: the directory to store the re-projected layers in
+    :param kwargs: additional keyword arguments to pass to gpd.read_file()
+
+    :returns gdf: the re-projected GeoDataFrame
+    '''
+    dst_crs = CRS.from_user_input(crs if crs is not None else 'epsg:{}'.format(epsg))
+    # different read options give a different layer, so they are part of the key as well
+    options = hashlib.sha1('{}|{!r}'.format(dst_crs.to_wkt(), sorted(kwargs.items())).encode('utf-8')).hexdigest()
+    key = '{}_{}_{}'.format(file_hash(fn), dst_crs.to_epsg(), options)
+    fn_cache = os.path.join(cache_dir, key + '.pkl')
+
+    if os.path.exists(fn_cache):
+        return pd.read_pickle(fn_cache)
+
+    gdf = to_crs(gpd.read_file(fn, **kwargs), crs=dst_crs)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fn_tmp = '{}.{}.tmp'.format(fn_cache, os.getpid())
+    gdf.to_pickle(fn_tmp)
+    os.replace(fn_tmp, fn_cache)
+
+    return gdf
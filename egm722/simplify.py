@@ -0,0 +1,199 @@
+'''
+Draw vector layers at a level of detail that matches the map scale.
+
+In the Week 2 practical, Rivers.shp and Water.shp are drawn at full resolution:
+
+    river_feat = ShapelyFeature(rivers['geometry'], myCRS, edgecolor='royalblue', linewidth=0.2)
+
+even though most of their vertices are much closer together than one pixel on a 10-inch map. This module works in
+the same way as the raster pyramids in egm722.overviews:
+
+- build_levels() simplifies the layer at a few tolerances (using the topology-preserving Douglas-Peucker algorithm,
+  so that simplified polygons stay valid), and stores each level on disk, keyed by a hash of the source file;
+- a ScaleAwareLayer chooses the coarsest level whose tolerance is still smaller than one output pixel each time the
+  map is drawn. Because this happens at draw time, the output dpi passed to savefig() is taken into account, and
+  zooming in switches to a more detailed level.
+'''
+import os
+import matplotlib.artist as martist
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from egm722 import CACHE_ROOT
+from egm722.hashing import file_hash
+from egm722.mapping import geometry_collection, project_geometries
+
+
+SIMPLIFY_DIR = os.path.join(CACHE_ROOT, 'simplified')
+TOLERANCES = (5., 25., 100., 500.)  # in the units of the layer CRS (usually meters)
+
+
+def build_levels(fn, tolerances=TOLERANCES, cache_dir=SIMPLIFY_DIR, **read_args):
+    '''
+    Build (or find in the cache) simplified copies of the geometries in a vector layer.
+
+    :param fn: the filename of the vector layer (e.g., a shapefile)
+    :param tolerances: the simplification tolerances to use, in the units of the layer CRS, in increasing order
+    :param cache_dir: the directory to store the simplified layers in
+    :param read_args: additional keyword arguments to pass to gpd.read_file()
+
+    :returns levels: a list of (tolerance, filename) tuples, starting with (0, fn)
+    '''
+    levels = [(0., fn)]
+    key = file_hash(fn)
+    geoms = None
+
+    for tolerance in sorted(tolerances):
+        fn_level = os.path.join(cache_dir, '{}_{:g}.pkl'.format(key, tolerance))
+        if not os.path.exists(fn_level):
+            if geoms is None:
+                geoms = gpd.read_file(fn, **read_args).geometry
+            simplified = geoms.simplify(tolerance, preserve_topology=True)
+            simplified = simplified[~(simplified.isna() | simplified.is_empty)]
+
+            os.makedirs(cache_dir, exist_ok=True)
+            fn_tmp = '{}.{}.tmp'.format(fn_level, os.getpid())
+            simplified.to_pickle(fn_tmp)
+            os.replace(fn_tmp, fn_level)
+        levels.append((tolerance, fn_level))
+
+    return levels
+
+
+def load_level(fn_level, **read_args):
+    '''
+    Load the geometries for one level of a layer.
+
+    :param fn_level: the filename of the level - either the original layer, or a stored simplified level
+    :param read_args: additional keyword arguments to pass to gpd.read_file() (for the original layer)
+
+    :returns geoms: a GeoSeries of the geometries
+    '''
+    if fn_level.endswith('.pkl'):
+        return pd.read_pickle(fn_level)
+    return gpd.read_file(fn_level, **read_args).geometry
+
+
+def choose_tolerance(levels, pixel_size, fraction=0.5):
+    '''
+    Choose the coarsest level whose tolerance is no larger than a fraction of one output pixel.
+
+    :param levels: a list of (tolerance, filename) tuples, in increasing order of tolerance
+    :param pixel_size: the size of one output pixel, in the units of the layer CRS
+    :param fraction: the largest tolerance to use, as a fraction of one pixel
+
+    :returns tolerance, filename: the chosen level
+    '''
+    best = levels[0]
+    for tolerance, fn_level in levels:
+        if tolerance <= pixel_size * fraction:
+            best = (tolerance, fn_level)
+    return best
+
+
+class ScaleAwareLayer(martist.Artist):
+    '''
+    A vector layer that is drawn using the simplified level that best matches the current map scale.
+    '''
+
+    def __init__(self, fn, crs=None, tolerances=TOLERANCES, fraction=0.5, cache_dir=SIMPLIFY_DIR, read_args=None,
+                 **collection_args):
+        '''
+        :param fn: the filename of the vector layer
+        :param crs: the cartopy CRS of the layer. If None, the layer is in the data coordinates of the axes.
+        :param tolerances: the simplification tolerances to use, in the units of the layer CRS
+        :param fraction: the largest tolerance to use, as a fraction of one output pixel
+        :param cache_dir: the directory to store the simplified layers in
+        :param read_args: a dict of additional keyword arguments to pass to gpd.read_file()
+        :param collection_args: keyword arguments (facecolor, edgecolor, linewidth, ...) passed to PatchCollection
+        '''
+        super().__init__()
+        self.crs = crs
+        self.fraction = fraction
+        self.read_args = {} if read_args is None else read_args
+        self.levels = build_levels(fn, tolerances, cache_dir, **self.read_args)
+        self.collection_args = collection_args
+        self.set_zorder(collection_args.get('zorder', 1.5))
+        self.tolerance = None
+        self._collections = {}
+
+    def pixel_size(self):
+        '''
+        Get the size of one output pixel, in the units of the layer CRS.
+
+        :returns pixel_size: the larger of the pixel width and height
+        '''
+        if self.crs is not None and hasattr(self.axes, 'get_extent'):
+            x0, x1, y0, y1 = self.axes.get_extent(self.crs)
+        else:
+            (x0, x1), (y0, y1) = self.axes.get_xlim(), self.axes.get_ylim()
+        bbox = self.axes.bbox  # in output pixels - while saving, this uses the dpi passed to savefig()
+        return max(abs(x1 - x0) / max(bbox.width, 1), abs(y1 - y0) / max(bbox.height, 1))
+
+    def get_collection(self, tolerance, fn_level):
+        '''
+        Get the PatchCollection for one level, projecting and converting the geometries the first time it is used.
+
+        :param tolerance: the tolerance of the level
+        :param fn_level: the filename of the level
+
+        :returns collection: the PatchCollection
+        '''
+        if tolerance not in self._collections:
+            geoms = load_level(fn_level, **self.read_args).values
+            projection = getattr(self.axes, 'projection', None)
+            if projection is not None:
+                geoms = project_geometries(geoms, self.crs, projection)
+            collection = geometry_collection(geoms, transform=self.axes.transData, **self.collection_args)
+            collection.set_figure(self.figure)
+            collection.set_clip_path(self.axes.patch)
+            self._collections[tolerance] = collection
+        return self._collections[tolerance]
+
+    def num_features(self, tolerance=None):
+        '''
+        Get the number of features that are drawn at a given level.
+
+        :param tolerance: the tolerance of the level. If None, uses the level that was drawn last (or the coarsest
+            level, if the layer hasn't been drawn yet), so that the full-resolution layer isn't read.
+
+        :returns count: the number of (non-empty) features
+        '''
+        tolerance = self.tolerance if tolerance is None else tolerance
+        fn_level = self.levels[-1][1] if tolerance is None else dict(self.levels)[tolerance]
+        return len(load_level(fn_level, **self.read_args))
+
+    def num_vertices(self, tolerance=None):
+        '''
+        Get the number of vertices that are drawn at a given level.
+
+        :param tolerance: the tolerance of the level. If None, uses the level that was drawn last.
+
+        :returns count: the total number of path vertices
+        '''
+        tolerance = self.tolerance if tolerance is None else tolerance
+        fn_level = dict(self.levels)[tolerance]
+        return int(np.sum([len(path.vertices) for path in self.get_collection(tolerance, fn_level).get_paths()]))
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        self.tolerance, fn_level = choose_tolerance(self.levels, self.pixel_size(), self.fraction)
+        self.get_collection(self.tolerance, fn_level).draw(renderer)
+        self.stale = False
+
+
+def add_scaled_layer(ax, fn, crs=None, **layer_args):
+    '''
+    Add a vector layer to a map, drawn at the level of detail that matches the map scale.
+
+    :param ax: the axes (or cartopy GeoAxes) to add the layer to
+    :param fn: the filename of the vector layer
+    :param crs: the cartopy CRS of the layer
+    :param layer_args: additional keyword arguments passed to ScaleAwareLayer (e.g., tolerances, edgecolor, linewidth)
+
+    :returns layer: the ScaleAwareLayer artist
+    '''
+    layer = ScaleAwareLayer(fn, crs=crs, **layer_args)
+    ax.add_artist(layer)
+    return layer
@@ -0,0 +1,189 @@
+'''
+Re-write vector layers with their features sorted along a space-filling curve, and read them back one block at a time.
+
+The records in the practical layers (NI_roads.shp, Rivers.shp, Water.shp, ...) are stored in whatever order they were
+digitized, so features that are next to each other on the map are scattered throughout the file. Reading, clipping,
+or drawing a small area means touching records from every part of the file.
+
+write_sorted() sorts the features by the position of the center of their bounding box along a Hilbert (or Z-order)
+curve, so that nearby features are stored next to each other, and records the bounding box of each block of
+block_size records:
+
+- for GeoParquet files, each block is a row group, and the block bounding boxes are stored in the file metadata (see
+  egm722.columnar), so read_parquet() can skip whole row groups;
+- for other formats (e.g., shapefiles), the block bounding boxes are stored in a <filename>.blocks.json file next to
+  the layer, and read_blocks() reads only the runs of records in the blocks that intersect a bounding box.
+
+From the command line:
+
+    python -m egm722.spatial_sort Week3/data_files/NI_roads.shp NI_roads_sorted.shp --curve hilbert
+'''
+import os
+import json
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+from egm722.columnar import read_parquet, write_parquet
+from egm722.curves import curve_key
+from egm722.lazy import _read_records
+
+
+BLOCK_SIZE = 1024  # the number of records in each block
+BLOCKS_EXT = '.blocks.json'
+
+
+def spatial_sort(gdf, curve='hilbert', order=16):
+    '''
+    Sort the features of a layer along a space-filling curve.
+
+    :param gdf: the GeoDataFrame to sort
+    :param curve: the curve to sort the features along, either 'hilbert' or 'morton' (Z-order)
+    :param order: the number of bits for each grid coordinate of the curve
+
+    :returns sorted_gdf: the sorted GeoDataFrame (with the original index)
+    '''
+    return gdf.iloc[np.argsort(curve_key(gdf, curve=curve, order=order), kind='stable')]
+
+
+def block_bounds(gdf, block_size=BLOCK_SIZE):
+    '''
+    Find the bounding box of each block of block_size features.
+
+    :param gdf: the GeoDataFrame (or GeoSeries)
+    :param block_size: the number of features in each block
+
+    :returns bounds: an (n_blocks, 4) array of (xmin, ymin, xmax, ymax) for each block, with NaN for blocks that only
+        have empty geometries
+    '''
+    bounds = gdf.geometry.bounds.to_numpy() if hasattr(gdf, 'geometry') else gdf.bounds.to_numpy()
+    blocks = np.full((int(np.ceil(len(bounds) / block_size)), 4), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # blocks with only empty geometries
+        for ii, start in enumerate(range(0, len(bounds), block_size)):
+            block = bounds[start:start + block_size]
+            blocks[ii] = np.nanmin(block[:, :2], axis=0).tolist() + np.nanmax(block[:, 2:], axis=0).tolist()
+    return blocks
+
+
+def write_sorted(gdf, fn_out, curve='hilbert', block_size=BLOCK_SIZE, **write_args):
+    '''
+    Sort a layer along a space-filling curve, write it to a file, and record the bounding box of each block of
+    records.
+
+    :param gdf: the GeoDataFrame to write
+    :param fn_out: the output filename. GeoParquet (.parquet) files store one block per row group; for any other
+        format, the block bounding boxes are written to fn_out + '.blocks.json'.
+    :param curve: the curve to sort the features along, either 'hilbert' or 'morton' (Z-order)
+    :param block_size: the number of records in each block
+    :param write_args: additional keyword arguments to pass to GeoDataFrame.to_file()
+
+    :returns bounds: an (n_blocks, 4) array of the bounding box of each block
+    '''
+    sorted_gdf = spatial_sort(gdf, curve=curve).reset_index(drop=True)
+    bounds = block_bounds(sorted_gdf, block_size)
+
+    if os.path.splitext(fn_out)[1].lower() == '.parquet':
+        write_parquet(sorted_gdf, fn_out, row_group_size=block_size)
+        return bounds
+
+    sorted_gdf.to_file(fn_out, **write_args)
+    with open(fn_out + BLOCKS_EXT, 'w') as f:
+        json.dump({'curve': curve, 'block_size': block_size, 'count': len(sorted_gdf),
+                   'bounds': [None if np.isnan(b).any() else b.tolist() for b in bounds]}, f)
+    return bounds
+
+
+def sort_file(fn_in, fn_out, curve='hilbert', block_size=BLOCK_SIZE, **write_args):
+    '''
+    Read a vector file, and write a copy sorted along a space-filling curve (see write_sorted()).
+
+    :param fn_in: the filename of the layer to sort
+    :param fn_out: the output filename
+    :param curve: the curve to sort the features along, either 'hilbert' or 'morton' (Z-order)
+    :param block_size: the number of records in each block
+    :param write_args: additional keyword arguments to pass to GeoDataFrame.to_file()
+
+    :returns bounds: an (n_blocks, 4) array of the bounding box of each block
+    '''
+    return write_sorted(gpd.read_file(fn_in), fn_out, curve, block_size, **write_args)
+
+
+def block_runs(blocks, bbox):
+    '''
+    Find the runs of consecutive blocks of records that intersect a bounding box.
+
+    :param blocks: the block index written by write_sorted() (the contents of the .blocks.json file)
+    :param bbox: (xmin, ymin, xmax, ymax) - the bounding box to test
+
+    :returns runs: a list of the (start, stop) record numbers of each run of blocks
+    '''
+    xmin, ymin, xmax, ymax = bbox
+    match = np.array([b is not None and b[0] <= xmax and b[2] >= xmin and b[1] <= ymax and b[3] >= ymin
+                      for b in blocks['bounds']], dtype=bool)
+
+    edges = np.diff(np.concatenate([[0], match.astype(np.int8), [0]]))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    size = blocks['block_size']
+    return [(start * size, min(stop * size, blocks['count'])) for start, stop in zip(starts, stops)]
+
+
+def read_blocks(fn, bbox=None, mask=None, columns=None):
+    '''
+    Read the features of a layer written by write_sorted() that intersect a bounding box or mask, only reading the
+    blocks of records whose bounding box intersects it.
+
+    :param fn: the filename of the sorted layer
+    :param bbox: (xmin, ymin, xmax, ymax) - read features that intersect this box
+    :param mask: a shapely geometry - read features that intersect the mask
+    :param columns: a list of the attribute columns to keep. If None, all columns are kept.
+
+    :returns gdf: the GeoDataFrame of matching features, indexed by record number
+    '''
+    if bbox is None and mask is not None:
+        bbox = mask.bounds
+
+    if os.path.splitext(fn)[1].lower() == '.parquet':
+        gdf = read_parquet(fn, bbox=bbox, columns=columns)
+    elif bbox is None or not os.path.exists(fn + BLOCKS_EXT):
+        gdf = gpd.read_file(fn, bbox=bbox)
+    else:
+        with open(fn + BLOCKS_EXT, 'r') as f:
+            blocks = json.load(f)
+        runs = block_runs(blocks, bbox)
+        if os.path.splitext(fn)[1].lower() == '.shp':
+            # shapefile record numbers are the same as the (0-based) fids, so all of the runs are read at once
+            fids = np.concatenate([np.arange(start, stop) for start, stop in runs] + [np.array([], dtype=int)])
+            gdf = _read_records(fn, fids, columns)
+        else:
+            parts = []
+            for start, stop in runs:
+                part = gpd.read_file(fn, rows=slice(start, stop))
+                part.index = pd.RangeIndex(start, start + len(part))
+                parts.append(part)
+            gdf = pd.concat(parts) if parts else gpd.read_file(fn, rows=slice(0, 0))
+
+    if columns is not None:
+        gdf = gdf[list(columns) + [gdf.geometry.name]]
+    if len(gdf) > 0 and (bbox is not None or mask is not None):
+        gdf = gdf[gdf.intersects(box(*bbox) if mask is None else mask)]
+    return gdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-write a vector layer sorted along a space-filling curve, and '
+                                                 'record the bounding box of each block of records.')
+    parser.add_argument('fn_in', help='the layer to sort')
+    parser.add_argument('fn_out', help='the output filename (.parquet files store one block per row group)')
+    parser.add_argument('--curve', choices=['hilbert', 'morton'], default='hilbert', help='the curve to sort along')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='the number of records in each block')
+    args = parser.parse_args()
+
+    bounds = sort_file(args.fn_in, args.fn_out, args.curve, args.block_size)
+    print('wrote {} blocks of {} records to {}'.format(len(bounds), args.block_size, args.fn_out))
+
+
+if __name__ == '__main__':
+    main()
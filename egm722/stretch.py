@@ -0,0 +1,224 @@
+'''
+Memory-efficient percentile stretching of (large) multi-band images for display.
+
+percentile_stretch() and img_display() from the Week 4 assignment calculate each percentile by sorting the whole
+band, and create several full-size floating-point copies of the image along the way. Here:
+
+- percentiles are calculated from a histogram of each band, which is built a chunk at a time: exactly (using
+  np.bincount) for integer images, and using a fine histogram between the band minimum and maximum for
+  floating-point images;
+- the stretch is applied a tile at a time, writing directly into a uint8 (rows, columns, bands) output image, so that
+  the peak memory use is about the size of that output image;
+- bands (and tiles) are processed concurrently in a thread pool - numpy releases the GIL for the heavy lifting.
+'''
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from egm722.counts import value_counts
+
+
+CHUNK_ROWS = 1024  # the number of rows of a band to process at a time
+FLOAT_BINS = 2 ** 16  # the number of histogram bins used to estimate percentiles for floating-point images
+
+
+def _check_percentiles(pmin, pmax):
+    # here, we make sure that pmin < pmax, and that they are between 0, 100
+    if not 0 <= pmin < pmax <= 100:
+        raise ValueError('0 <= pmin < pmax <= 100')
+
+
+def _row_chunks(nrows, chunk_rows=CHUNK_ROWS):
+    return [slice(row, min(row + chunk_rows, nrows)) for row in range(0, nrows, chunk_rows)]
+
+
+def _interp_rank(values, cumcount, rank):
+    # find the value at a fractional rank (0-based) in the sorted data, given the sorted unique values and cumulative
+    # counts - this gives the same result as np.percentile's default (linear) interpolation
+    lo, hi = int(np.floor(rank)), int(np.ceil(rank))
+    vlo = values[np.searchsorted(cumcount, lo, side='right')]
+    vhi = values[np.searchsorted(cumcount, hi, side='right')]
+    return vlo + (vhi - vlo) * (rank - lo)
+
+
+def band_percentiles(band, percentiles, nodata=None):
+    '''
+    Calculate percentiles of a single band from a histogram, without sorting or copying the band.
+
+    For integer bands, the result is the same as np.percentile(); for floating-point bands, it is accurate to within
+    1/65536 of the range of the data. NaN values are ignored.
+
+    :param band: a 2d array of values
+    :param percentiles: a list of percentiles (0-100) to calculate
+    :param nodata: a value to ignore when calculating the percentiles
+
+    :returns values: a list of the values at each percentile
+    '''
+    chunks = _row_chunks(band.shape[0])
+
+    if np.issubdtype(band.dtype, np.integer) or band.dtype == bool:
+        totals = {}
+        for rows in chunks:
+            for val, count in zip(*value_counts(band[rows], nodata)):
+                totals[val] = totals.get(val, 0) + count
+        values = np.array(sorted(totals))
+        counts = np.array([totals[v] for v in values])
+    else:
+        def _valid(rows):
+            return band[rows] if nodata is None else band[rows][band[rows] != nodata]
+
+        vmin, vmax = np.inf, -np.inf
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # chunks that are all NaN
+            for rows in chunks:
+                chunk = _valid(rows)
+                if chunk.size == 0:
+                    continue
+                lo, hi = np.nanmin(chunk), np.nanmax(chunk)
+                if not (np.isfinite(lo) and np.isfinite(hi)):  # only look for the finite values if we have to
+                    finite = chunk[np.isfinite(chunk)]
+                    lo, hi = (finite.min(), finite.max()) if finite.size > 0 else (np.inf, -np.inf)
+                vmin, vmax = min(vmin, lo), max(vmax, hi)
+        if vmin > vmax:
+            raise ValueError('band has no valid values')
+
+        counts = np.zeros(FLOAT_BINS, dtype=np.int64)
+        for rows in chunks:
+            chunk = _valid(rows)
+            # with equal-width bins given as (number, range), np.histogram() computes the bin of each value directly,
+            # rather than searching the bin edges. NaN values are outside of the range, so they are not counted.
+            counts += np.histogram(chunk, FLOAT_BINS, range=(vmin, vmax))[0]
+        edges = np.linspace(vmin, vmax, FLOAT_BINS + 1)
+        values = (edges[:-1] + edges[1:]) / 2
+        values[0], values[-1] = vmin, vmax
+
+    cumcount = np.cumsum(counts)
+    if cumcount.size == 0 or cumcount[-1] == 0:
+        raise ValueError('band has no valid values')
+
+    return [_interp_rank(values, cumcount, p / 100 * (cumcount[-1] - 1)) for p in percentiles]
+
+
+def band_limits(img, bands=None, pmin=0., pmax=100., max_workers=None, nodata=None):
+    '''
+    Calculate the (pmin, pmax) percentile values of each band of an image, processing the bands concurrently.
+
+    :param img: a 3d array with shape (bands, rows, columns)
+    :param bands: a list of the (0-based) band indices to use. If None, uses all bands.
+    :param pmin: the lower percentile (0-100)
+    :param pmax: the upper percentile (0-100)
+    :param max_workers: the number of threads to use
+    :param nodata: the nodata value of the image, which is left out of the percentiles
+
+    :returns limits: a list of (minval, maxval) tuples, one for each band
+    '''
+    _check_percentiles(pmin, pmax)
+    bands = range(img.shape[0]) if bands is None else bands
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return [tuple(lims) for lims in pool.map(lambda b: band_percentiles(img[b], [pmin, pmax], nodata), bands)]
+
+
+def stretch_tile(img, bands, limits, rows=slice(None), cols=slice(None), out=None, nodata=None):
+    '''
+    Apply a linear stretch to a tile of an image, giving a display-ready uint8 (rows, columns, bands) array.
+
+    Values at or below minval are set to 0, and values at or above maxval are set to 255. If a band is constant
+    (maxval <= minval), or a pixel is nodata, it is set to 0.
+
+    :param img: a 3d array with shape (bands, rows, columns)
+    :param bands: a list of the (0-based) band indices to use
+    :param limits: a list of (minval, maxval) tuples, one for each band in bands
+    :param rows: a slice giving the rows of the tile
+    :param cols: a slice giving the columns of the tile
+    :param out: an optional uint8 array to write the output to
+    :param nodata: the nodata value of the image
+
+    :returns out: the stretched tile
+    '''
+    tile = None  # the only floating-point array, the size of a single band of the tile, is re-used for each band
+    for ii, (b, (minval, maxval)) in enumerate(zip(bands, limits)):
+        band = img[b, rows, cols]
+        if tile is None:
+            tile = np.empty(band.shape, dtype=np.float32)
+        if out is None:
+            out = np.empty(band.shape + (len(bands),), dtype=np.uint8)
+        if maxval <= minval:  # there is nothing to stretch
+            out[..., ii] = 0
+            continue
+
+        np.subtract(band, float(minval), out=tile, dtype=np.float32, casting='unsafe')
+        tile *= 255 / (maxval - minval)
+        # fmax/fmin clip to 0, 255 and set NaN values to 0 in the same pass, as they return the non-NaN argument
+        np.fmax(tile, 0, out=tile)
+        np.fmin(tile, 255, out=tile)
+        np.rint(tile, out=tile)
+        if nodata is not None:
+            tile[band == nodata] = 0
+        out[..., ii] = tile
+    return out
+
+
+def stretched_tiles(img, bands, limits, tile_size=1024, nodata=None):
+    '''
+    Generate display-ready uint8 tiles of an image, one at a time.
+
+    :param img: a 3d array with shape (bands, rows, columns)
+    :param bands: a list of the (0-based) band indices to use
+    :param limits: a list of (minval, maxval) tuples, one for each band in bands (see band_limits)
+    :param tile_size: the size of each (square) tile, in pixels
+    :param nodata: the nodata value of the image
+
+    :returns tiles: a generator of (rows, cols, tile) tuples, where rows and cols are the slices of the image that
+        the uint8 tile covers
+    '''
+    _, nrows, ncols = img.shape
+    for rows in _row_chunks(nrows, tile_size):
+        for cols in _row_chunks(ncols, tile_size):
+            yield rows, cols, stretch_tile(img, bands, limits, rows, cols, nodata=nodata)
+
+
+def stretch_image(img, bands, pmin=0., pmax=100., tile_size=1024, max_workers=None, nodata=None):
+    '''
+    Percentile stretch the selected bands of an image into a single uint8 (rows, columns, bands) array for display.
+
+    :param img: a 3d array with shape (bands, rows, columns)
+    :param bands: a list of the (0-based) band indices to use (e.g., [3, 2, 1])
+    :param pmin: the lower percentile (0-100)
+    :param pmax: the upper percentile (0-100)
+    :param tile_size: the size of the tiles to process at a time, in pixels
+    :param max_workers: the number of threads to use
+    :param nodata: the nodata value of the image. Nodata pixels are left out of the percentiles, and set to 0.
+
+    :returns dispimg: the stretched uint8 image
+    '''
+    if not img.ndim == 3:
+        raise ValueError('Image must have three dimensions (band, row, column)')
+
+    limits = band_limits(img, bands, pmin, pmax, max_workers, nodata)
+    _, nrows, ncols = img.shape
+    dispimg = np.empty((nrows, ncols, len(bands)), dtype=np.uint8)
+
+    tiles = [(rows, cols) for rows in _row_chunks(nrows, tile_size) for cols in _row_chunks(ncols, tile_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda rc: stretch_tile(img, bands, limits, rc[0], rc[1], out=dispimg[rc[0], rc[1]],
+                                              nodata=nodata), tiles))
+
+    return dispimg
+
+
+def img_display(img, ax, bands, stretch_args=None, **imshow_args):
+    '''
+    Display an image using a percentile stretch - a memory-efficient version of img_display() from the Week 4
+    assignment, with the same arguments.
+
+    :param img: a 3d array with shape (bands, rows, columns)
+    :param ax: the matplotlib axes to display the image in
+    :param bands: a list of the (0-based) band indices to display
+    :param stretch_args: a dict of keyword arguments (pmin, pmax, nodata) to pass to stretch_image
+    :param imshow_args: additional keyword arguments to pass to ax.imshow()
+
+    :returns handle, ax: the AxesImage and the axes
+    '''
+    stretch_args = {} if stretch_args is None else stretch_args
+    handle = ax.imshow(stretch_image(img, bands, **stretch_args), **imshow_args)
+    return handle, ax
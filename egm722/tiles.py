@@ -0,0 +1,400 @@
+'''
+Render vector layers as web-map (XYZ) tiles, in parallel, and only re-render the tiles that have changed.
+
+Instead of making one large PNG of the Northern Ireland basemap, generate_tiles() renders the layers as 256 x 256
+pixel tiles in the Web Mercator (EPSG:3857) projection, for a range of zoom levels:
+
+- each layer is re-projected once, and a spatial index is used to find the features in every tile of a zoom level
+  in a single query. Each tile only draws its own features, clipped to (just outside) the tile;
+- tiles with no features are skipped, and tiles are rendered in a pool of processes;
+- the output is either an MBTiles (SQLite) file, or a directory of z/x/y.png files;
+- a hash of the features (and styling, including the color that each feature is drawn in) that go into each tile is
+  stored with the tiles, so that running generate_tiles() again only re-renders tiles where the source features have
+  changed.
+
+Layers use the same dicts as egm722.batch.MapTemplate, e.g.:
+
+    layers = [{'fn': 'data_files/NI_outline.shp', 'style': dict(edgecolor='k', facecolor='w')},
+              {'fn': 'data_files/Counties.shp', 'column': 'CountyName',
+               'colors': ['firebrick', 'seagreen', 'royalblue', 'coral', 'violet', 'cornsilk'],
+               'style': dict(edgecolor='k', linewidth=1, alpha=0.25)},
+              {'fn': 'data_files/Water.shp', 'style': dict(edgecolor='mediumblue', facecolor='mediumblue')},
+              {'fn': 'data_files/Rivers.shp', 'style': dict(edgecolor='royalblue', linewidth=0.2)},
+              {'fn': 'data_files/Towns.shp', 'style': dict(marker='s', color='0.5', ms=6)}]
+    summary = generate_tiles(TileSet(layers), zooms=range(6, 13), out='ni_basemap.mbtiles')
+    print('Rendered {rendered} tiles ({unchanged} unchanged, {removed} removed)'.format(**summary))
+
+Text labels are not drawn, as they would be cut off at the edges of the tiles.
+'''
+import io
+import os
+import json
+import math
+import sqlite3
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import box
+from shapely.ops import clip_by_rect
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from egm722.hashing import feature_hashes
+from egm722.mapping import category_colors, geometry_path
+from egm722.reproject import to_crs
+from egm722.zones import query_pairs
+
+
+ORIGIN = 20037508.342789244  # half of the width of the Web Mercator world, in meters
+TILE_SIZE = 256
+PAD_PIXELS = 8  # select and clip features this many pixels outside of each tile, so that edges match up
+
+_TILESET = None  # the tileset used by each worker process
+
+
+def tile_bounds(z, x, y):
+    '''
+    Get the Web Mercator bounds of an XYZ tile.
+
+    :param z: the zoom level
+    :param x: the tile column
+    :param y: the tile row, counted from the top (north)
+
+    :returns bounds: the (xmin, ymin, xmax, ymax) of the tile, in EPSG:3857 meters
+    '''
+    size = 2 * ORIGIN / 2 ** z
+    return -ORIGIN + x * size, ORIGIN - (y + 1) * size, -ORIGIN + (x + 1) * size, ORIGIN - y * size
+
+
+def tiles_for_bounds(bounds, z):
+    '''
+    Get the XYZ tiles that cover an area at a given zoom level.
+
+    :param bounds: the (xmin, ymin, xmax, ymax) of the area, in EPSG:3857 meters
+    :param z: the zoom level
+
+    :returns tiles: a list of (x, y) tuples
+    '''
+    size = 2 * ORIGIN / 2 ** z
+    xmin, ymin, xmax, ymax = bounds
+    x0, x1 = int(math.floor((xmin + ORIGIN) / size)), int(math.floor((xmax + ORIGIN) / size))
+    y0, y1 = int(math.floor((ORIGIN - ymax) / size)), int(math.floor((ORIGIN - ymin) / size))
+    n = 2 ** z - 1
+    return [(x, y) for x in range(max(x0, 0), min(x1, n) + 1) for y in range(max(y0, 0), min(y1, n) + 1)]
+
+
+class TileSet(object):
+    '''
+    A set of layers, with their styling, that can be rendered as XYZ tiles.
+    '''
+
+    def __init__(self, layers, tile_size=TILE_SIZE):
+        '''
+        :param layers: a list of dicts describing each layer, in drawing order (see egm722.batch)
+        :param tile_size: the width and height of each tile, in pixels
+        '''
+        self.layers = [dict(layer) for layer in layers]
+        self.tile_size = tile_size
+        self._data = None
+
+    def __getstate__(self):
+        # don't send the loaded layers to other processes - they either share them (fork), or load them themselves
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def load(self):
+        '''
+        Load each layer, re-project it to Web Mercator, and calculate a hash of each feature.
+
+        :returns data: a list with a dict for each layer
+        '''
+        if self._data is not None:
+            return self._data
+
+        self._data = []
+        for layer in self.layers:
+            gdf = layer['data'] if 'data' in layer else gpd.read_file(layer['fn'])
+            gdf = to_crs(gdf, epsg=3857).reset_index(drop=True)
+            gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)].reset_index(drop=True)
+
+            columns = [layer['column']] if 'column' in layer else None
+            colors = None
+            if 'column' in layer:
+                colors = layer.get('colors', ['tomato', 'lightgreen', 'olive', 'darkmagenta', 'skyblue', 'gold'])
+                colors = colors if isinstance(colors, dict) else category_colors(gdf[layer['column']], colors)
+
+            # the styling of a layer is part of the hash of every feature, so that changing it re-renders the tiles
+            style = json.dumps({key: value for key, value in layer.items() if key not in ['fn', 'data']},
+                               sort_keys=True, default=str).encode('utf-8')
+            # so is the color that each feature is drawn in, as adding or removing a category can change the colors
+            # of the other categories
+            if colors is None:
+                feature_colors = [b''] * len(gdf)
+            else:
+                feature_colors = [str(colors[value]).encode('utf-8') for value in gdf[layer['column']]]
+            hashes = [hashlib.sha1(style + color + digest).digest()
+                      for digest, color in zip(feature_hashes(gdf, columns), feature_colors)]
+
+            is_point = len(gdf) > 0 and bool(gdf.geom_type.isin(['Point']).all())
+            self._data.append({'gdf': gdf, 'hashes': hashes, 'colors': colors, 'is_point': is_point})
+        return self._data
+
+    def bounds(self):
+        '''
+        Get the Web Mercator bounds of all of the layers.
+
+        :returns bounds: the (xmin, ymin, xmax, ymax) of the layers
+        '''
+        bounds = np.array([data['gdf'].total_bounds for data in self.load() if len(data['gdf']) > 0])
+        return bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+
+    def zoom_features(self, z, tiles=None):
+        '''
+        Find the features of each layer that are in each tile of a zoom level, using one spatial index query per layer.
+
+        :param z: the zoom level
+        :param tiles: a list of (x, y) tiles. If None, uses all of the tiles that cover the layers.
+
+        :returns features: a dict of {(x, y): [array of feature positions for each layer]}, only including tiles with
+            at least one feature
+        '''
+        tiles = tiles_for_bounds(self.bounds(), z) if tiles is None else tiles
+        pad = PAD_PIXELS * 2 * ORIGIN / 2 ** z / self.tile_size
+
+        boxes = []
+        for x, y in tiles:
+            xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+            boxes.append(box(xmin - pad, ymin - pad, xmax + pad, ymax + pad))
+        boxes = gpd.GeoSeries(boxes, crs='epsg:3857')
+
+        features = {}
+        for ii, data in enumerate(self.load()):
+            if len(data['gdf']) == 0:
+                continue
+            tile_idx, feat_idx = query_pairs(data['gdf'].sindex, boxes, predicate='intersects')
+            if len(tile_idx) == 0:
+                continue
+            order = np.lexsort((feat_idx, tile_idx))
+            tile_idx, feat_idx = tile_idx[order], feat_idx[order]
+
+            # split the sorted features into one group for each tile
+            starts = np.r_[0, np.flatnonzero(np.diff(tile_idx)) + 1]
+            for tile, tile_feats in zip(tile_idx[starts], np.split(feat_idx, starts[1:])):
+                features.setdefault(tiles[tile], [np.empty(0, dtype=int)] * len(self.layers))[ii] = tile_feats
+        return features
+
+    def tile_hash(self, feature_lists):
+        '''
+        Calculate the hash of a tile, from the hashes of the features that are drawn in it.
+
+        :param feature_lists: a list with the array of feature positions in the tile for each layer
+
+        :returns digest: the hexadecimal SHA1 hash
+        '''
+        sha = hashlib.sha1(str(self.tile_size).encode('utf-8'))
+        for data, feats in zip(self.load(), feature_lists):
+            sha.update(b'|')
+            sha.update(b''.join(data['hashes'][ff] for ff in feats))
+        return sha.hexdigest()
+
+    def render_tile(self, z, x, y, feature_lists):
+        '''
+        Render a single tile as a PNG image.
+
+        :param z: the zoom level
+        :param x: the tile column
+        :param y: the tile row
+        :param feature_lists: a list with the array of feature positions in the tile for each layer
+
+        :returns png: the PNG image, as bytes
+        '''
+        xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+        pad = PAD_PIXELS * (xmax - xmin) / self.tile_size
+
+        # at 72 dpi, one point is one pixel, so line widths and marker sizes are the same as on a printed map
+        fig = Figure(figsize=(self.tile_size / 72, self.tile_size / 72), dpi=72)
+        FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
+
+        for layer, data, feats in zip(self.layers, self.load(), feature_lists):
+            if len(feats) == 0:
+                continue
+            gdf = data['gdf'].iloc[feats]
+            style = dict(layer.get('style', {}))
+            if data['is_point']:
+                ax.plot(gdf.geometry.x, gdf.geometry.y, linestyle='none', **style)
+                continue
+
+            paths = [geometry_path(clip_by_rect(geom, xmin - pad, ymin - pad, xmax + pad, ymax + pad))
+                     for geom in gdf.geometry]
+            if data['colors'] is not None:
+                style['facecolors'] = [data['colors'][value] for value in gdf[layer['column']]]
+                style.setdefault('edgecolor', 'k')
+            else:
+                style.setdefault('facecolor', 'none')
+            ax.add_collection(PathCollection(paths, transform=ax.transData, **style), autolim=False)
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=72, transparent=True)
+        return buffer.getvalue()
+
+
+class MBTilesWriter(object):
+    '''
+    Write tiles to an MBTiles (SQLite) file, along with the hash of each tile.
+    '''
+
+    def __init__(self, fn, name='egm722'):
+        self.conn = sqlite3.connect(fn)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, '
+                          'tile_row INTEGER, tile_data BLOB)')
+        self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tile_hashes (zoom_level INTEGER, tile_column INTEGER, '
+                          'tile_row INTEGER, hash TEXT, PRIMARY KEY (zoom_level, tile_column, tile_row))')
+        self.conn.execute('DELETE FROM metadata')
+        self.conn.executemany('INSERT INTO metadata VALUES (?, ?)', [('name', name), ('format', 'png'),
+                                                                     ('type', 'baselayer'), ('version', '1.1')])
+
+    @staticmethod
+    def _row(z, y):
+        return 2 ** z - 1 - y  # MBTiles counts rows from the bottom (south), like TMS
+
+    def hashes(self, z):
+        rows = self.conn.execute('SELECT tile_column, tile_row, hash FROM tile_hashes WHERE zoom_level = ?', (z,))
+        return {(x, self._row(z, row)): digest for x, row, digest in rows}
+
+    def write(self, z, x, y, png, digest):
+        self.conn.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', (z, x, self._row(z, y), png))
+        self.conn.execute('INSERT OR REPLACE INTO tile_hashes VALUES (?, ?, ?, ?)', (z, x, self._row(z, y), digest))
+
+    def delete(self, z, x, y):
+        for table in ['tiles', 'tile_hashes']:
+            self.conn.execute('DELETE FROM {} WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'.format(table),
+                              (z, x, self._row(z, y)))
+
+    def close(self, bounds=None, zooms=None):
+        if zooms is not None:
+            self.conn.executemany('INSERT INTO metadata VALUES (?, ?)', [('minzoom', str(min(zooms))),
+                                                                         ('maxzoom', str(max(zooms)))])
+        if bounds is not None:
+            self.conn.execute('INSERT INTO metadata VALUES (?, ?)', ('bounds', ','.join(map(str, bounds))))
+        self.conn.commit()
+        self.conn.close()
+
+
+class DirectoryWriter(object):
+    '''
+    Write tiles to a directory of z/x/y.png files, with the hash of each tile stored in hashes.json.
+    '''
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.fn_hashes = os.path.join(out_dir, 'hashes.json')
+        self._hashes = {}
+        if os.path.exists(self.fn_hashes):
+            with open(self.fn_hashes, 'r') as f:
+                self._hashes = json.load(f)
+
+    def _fn(self, z, x, y):
+        return os.path.join(self.out_dir, str(z), str(x), '{}.png'.format(y))
+
+    def hashes(self, z):
+        prefix = '{}/'.format(z)
+        return {tuple(int(v) for v in key.split('/')[1:]): digest
+                for key, digest in self._hashes.items() if key.startswith(prefix)}
+
+    def write(self, z, x, y, png, digest):
+        fn = self._fn(z, x, y)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, 'wb') as f:
+            f.write(png)
+        self._hashes['{}/{}/{}'.format(z, x, y)] = digest
+
+    def delete(self, z, x, y):
+        if os.path.exists(self._fn(z, x, y)):
+            os.remove(self._fn(z, x, y))
+        self._hashes.pop('{}/{}/{}'.format(z, x, y), None)
+
+    def close(self, bounds=None, zooms=None):
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(self.fn_hashes, 'w') as f:
+            json.dump(self._hashes, f)
+
+
+def _init_worker(tileset):
+    global _TILESET
+    if tileset is not None:
+        _TILESET = tileset
+    _TILESET.load()  # does nothing if the layers were already loaded before the process was forked
+
+
+def _render_job(job):
+    z, x, y, feature_lists = job
+    return _TILESET.render_tile(z, x, y, feature_lists)
+
+
+def generate_tiles(tileset, zooms, out, max_workers=None):
+    '''
+    Render a tileset for a range of zoom levels, only re-rendering tiles whose source features have changed.
+
+    :param tileset: the TileSet to render
+    :param zooms: a list (or range) of zoom levels to render
+    :param out: the output filename. If it ends with .mbtiles, the tiles are written to an MBTiles file; otherwise,
+        out is a directory that the z/x/y.png tiles are written to.
+    :param max_workers: the number of processes to use. If 1, the tiles are rendered in this process.
+
+    :returns summary: a dict with the number of tiles that were rendered, unchanged (skipped), and removed
+    '''
+    global _TILESET
+    writer = MBTilesWriter(out) if out.endswith('.mbtiles') else DirectoryWriter(out)
+
+    tileset.load()  # load the layers once, before any workers are started
+    _TILESET = tileset
+    summary = {'rendered': 0, 'unchanged': 0, 'removed': 0}
+
+    pool = None
+    if max_workers != 1:
+        # with fork, the workers share the layers that have already been loaded; otherwise, each one loads them once
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context, initargs = multiprocessing.get_context('fork'), (None,)
+        else:
+            context, initargs = multiprocessing.get_context(), (tileset,)
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                   initargs=initargs)
+
+    try:
+        for z in zooms:
+            old_hashes = writer.hashes(z)
+            jobs, digests = [], []
+            for (x, y), feature_lists in tileset.zoom_features(z).items():
+                digest = tileset.tile_hash(feature_lists)
+                if old_hashes.pop((x, y), None) == digest:
+                    summary['unchanged'] += 1
+                    continue
+                jobs.append((z, x, y, feature_lists))
+                digests.append(digest)
+
+            # any tiles left over from the last run no longer have any features
+            for x, y in old_hashes:
+                writer.delete(z, x, y)
+                summary['removed'] += 1
+
+            results = map(_render_job, jobs) if pool is None else pool.map(_render_job, jobs, chunksize=16)
+            for (_, x, y, _), digest, png in zip(jobs, digests, results):
+                writer.write(z, x, y, png, digest)
+                summary['rendered'] += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        lonlat = gpd.GeoSeries([box(*tileset.bounds())], crs='epsg:3857').to_crs('epsg:4326').total_bounds
+        writer.close(lonlat, list(zooms))
+
+    return summary
@@ -0,0 +1,124 @@
+'''
+Windowed (block-by-block) categorical zonal statistics for rasters that are too large to read into memory.
+
+In the Week 5 practical, we read the whole land cover raster into memory and use rasterstats:
+
+    landcover = dataset.read(1)
+    county_stats = zonal_stats(counties, landcover, affine=affine_tfm, categorical=True, nodata=0)
+
+zonal_stats_windowed() gives the same list of {pixel value: count} dicts, but only ever reads one block of the raster
+at a time. For each block, we only rasterize the zones whose bounding box intersects the block, and the blocks can be
+shared out over a pool of processes.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio as rio
+import rasterio.features
+import rasterio.windows
+from shapely.geometry import box
+from egm722.zones import query_pairs
+from egm722.counts import count_values, merge_counts
+
+
+def block_windows(width, height, block_size=1024):
+    '''
+    Split a raster of a given size into square windows.
+
+    :param width: the width (number of columns) of the raster
+    :param height: the height (number of rows) of the raster
+    :param block_size: the size of each window, in pixels
+
+    :returns windows: a list of rasterio.windows.Window objects that cover the raster
+    '''
+    windows = []
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            windows.append(rio.windows.Window(col, row, min(block_size, width - col), min(block_size, height - row)))
+    return windows
+
+
+def _window_counts(args):
+    # count the pixel values of each zone within a single window. This is run in the worker processes, so we
+    # open the raster here rather than passing around the (possibly large) array.
+    fn_raster, band, window, zone_ids, geoms, nodata, all_touched = args
+
+    with rio.open(fn_raster) as dataset:
+        data = dataset.read(band, window=window)
+        transform = dataset.window_transform(window)
+
+    valid = np.ones(data.shape, dtype=bool) if nodata is None else data != nodata
+    if np.issubdtype(data.dtype, np.floating):
+        valid &= ~np.isnan(data)
+
+    results = []
+    for zone_id, geom in zip(zone_ids, geoms):
+        inside = rio.features.geometry_mask([geom], out_shape=data.shape, transform=transform,
+                                            all_touched=all_touched, invert=True)
+        inside &= valid
+        if inside.any():
+            results.append((zone_id, count_values(data[inside])))
+
+    return results
+
+
+def _accumulate(stats, results):
+    # merge the per-window results into the per-zone totals
+    for result in results:
+        for zone_id, counts in result:
+            merge_counts(stats[zone_id], counts)
+
+
+def zonal_stats_windowed(zones, fn_raster, band=1, nodata=None, block_size=1024, all_touched=False,
+                         max_workers=None):
+    '''
+    Count the number of pixels of each value within each zone, reading the raster one block at a time.
+
+    The output is the same as rasterstats.zonal_stats(..., categorical=True): a list with one dict of
+    {pixel value: count} for each zone, in the same order as the zones. Peak memory is set by block_size, rather than
+    by the size of the raster.
+
+    :param zones: a GeoDataFrame of zone polygons (e.g., counties). If the CRS is different to the raster, the zones
+        are re-projected to the raster CRS.
+    :param fn_raster: the filename of the raster to read
+    :param band: the band of the raster to use
+    :param nodata: the nodata value to ignore. If None, uses the nodata value of the raster (if it has one).
+    :param block_size: the size (in pixels) of the square blocks to read from the raster
+    :param all_touched: include all pixels touched by each zone, rather than only pixels whose centers are inside
+    :param max_workers: the number of processes to use. If 1, the blocks are processed in the current process;
+        if None, uses the number of CPUs.
+
+    :returns stats: a list of {pixel value: count} dicts, one for each zone
+    '''
+    with rio.open(fn_raster) as dataset:
+        if nodata is None:
+            nodata = dataset.nodata
+        if zones.crs is not None and dataset.crs is not None and zones.crs != dataset.crs:
+            zones = zones.to_crs(dataset.crs)
+
+        windows = block_windows(dataset.width, dataset.height, block_size)
+        bounds = [box(*rio.windows.bounds(win, dataset.transform)) for win in windows]
+
+    # find which zones intersect which blocks, so that each block only rasterizes the zones it needs
+    win_idx, zone_idx = query_pairs(zones.sindex, bounds, predicate='intersects')
+    geoms = zones.geometry.values
+
+    # group the (window, zone) pairs by window
+    order = np.argsort(win_idx, kind='stable')
+    win_idx, zone_idx = win_idx[order], zone_idx[order]
+    splits = np.flatnonzero(np.diff(win_idx)) + 1
+
+    tasks = []
+    for these_wins, these_zones in zip(np.split(win_idx, splits), np.split(zone_idx, splits)):
+        if len(these_zones) > 0:
+            tasks.append((fn_raster, band, windows[these_wins[0]], these_zones.tolist(), list(geoms[these_zones]),
+                          nodata, all_touched))
+
+    stats = [dict() for _ in range(len(zones))]
+
+    if max_workers == 1:
+        _accumulate(stats, map(_window_counts, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            _accumulate(stats, pool.map(_window_counts, tasks))
+
+    return stats
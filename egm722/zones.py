@@ -0,0 +1,116 @@
+'''
+Clip a layer by a set of zones (e.g., counties or wards) in a single operation.
+
+This replaces the pattern used in the Week 3 practical, where gpd.clip() is called once per zone and the results
+are combined using pd.concat():
+
+    for county in counties['CountyName'].unique():
+        tmp_clip = gpd.clip(roads_itm, counties[counties['CountyName'] == county])
+        ...
+
+Each call to gpd.clip() re-scans the whole layer, so the cost grows with (number of zones) x (number of features).
+Here, we build the spatial index once, find all (zone, feature) pairs whose bounding boxes intersect, and only
+intersect those pairs.
+'''
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import MultiLineString, MultiPoint, MultiPolygon
+from egm722.measures import add_measure
+
+
+GEOM_FAMILIES = {'Point': 'point', 'MultiPoint': 'point',
+                 'LineString': 'line', 'MultiLineString': 'line', 'LinearRing': 'line',
+                 'Polygon': 'polygon', 'MultiPolygon': 'polygon'}
+
+MULTI_TYPES = {'point': MultiPoint, 'line': MultiLineString, 'polygon': MultiPolygon}
+
+
+def _family_parts(geom, family):
+    # the parts of a geometry (or collection of geometries) that belong to a type family, as single geometries
+    if GEOM_FAMILIES.get(geom.geom_type) == family:
+        return list(geom.geoms) if geom.geom_type.startswith('Multi') else [geom]
+    if geom.geom_type == 'GeometryCollection':
+        return [part for g in geom.geoms for part in _family_parts(g, family)]
+    return []
+
+
+def _extract_family(geom, family):
+    # keep only the parts of a GeometryCollection with the same type family as the input feature, as gpd.clip() does
+    parts = _family_parts(geom, family)
+    if len(parts) == 0:
+        return None
+    return parts[0] if len(parts) == 1 else MULTI_TYPES[family](parts)
+
+
+def query_pairs(sindex, geoms, predicate=None):
+    '''
+    Query a spatial index with an array of geometries.
+
+    :param sindex: the spatial index (GeoDataFrame.sindex) to query
+    :param geoms: a GeoSeries or array of geometries to query the index with
+    :param predicate: an optional predicate (e.g., 'intersects') to test against the indexed geometries
+
+    :returns input_idx, tree_idx: integer arrays giving the positions of each matching (input, tree) pair
+    '''
+    geoms = getattr(geoms, 'values', geoms)
+    if hasattr(sindex, 'query_bulk'):  # older versions of geopandas use query_bulk for arrays of geometries
+        pairs = sindex.query_bulk(geoms, predicate=predicate)
+    else:
+        pairs = sindex.query(geoms, predicate=predicate)
+    return pairs[0], pairs[1]
+
+
+def clip_by_zones(gdf, zones, zone_field, length_field='Length', keep_geom_type=True):
+    '''
+    Split the features of a GeoDataFrame at zone boundaries, and tag each piece with its zone.
+
+    Features that fall across a zone boundary are split into one piece per zone; features that are outside of all of
+    the zones are dropped. Both layers must be in the same CRS.
+
+    :param gdf: the GeoDataFrame to clip (e.g., roads)
+    :param zones: a GeoDataFrame of zone polygons (e.g., counties)
+    :param zone_field: the name of the zone attribute (or a list of names) to copy to each piece (e.g., 'CountyName')
+    :param length_field: the name of the column to write the length of each piece to. If None, lengths are not
+        re-calculated.
+    :param keep_geom_type: only keep pieces with the same type (point, line, polygon) as the input feature - for
+        example, drop the single points where a line touches a zone boundary. Where a piece is a GeometryCollection,
+        only the parts with the same type are kept.
+
+    :returns clipped: a GeoDataFrame with one row per (feature, zone) piece, keeping the index of the input features.
+    '''
+    if not gdf.crs == zones.crs:
+        raise ValueError('gdf and zones must have the same CRS: {} != {}'.format(gdf.crs, zones.crs))
+
+    fields = [zone_field] if isinstance(zone_field, str) else list(zone_field)
+
+    # query the index of the (larger) feature layer once, using all of the zones at the same time
+    zone_idx, feat_idx = query_pairs(gdf.sindex, zones.geometry, predicate='intersects')
+
+    # sort the pairs so that the output is in the order of the input features, then the zones
+    order = np.lexsort((zone_idx, feat_idx))
+    zone_idx, feat_idx = zone_idx[order], feat_idx[order]
+
+    # intersect only the candidate pairs - memory scales with the number of output pieces
+    feats = gdf.geometry.values[feat_idx]
+    pieces = feats.intersection(zones.geometry.values[zone_idx])
+
+    keep = ~(pieces.isna() | pieces.is_empty)
+    if keep_geom_type:
+        in_types = gpd.GeoSeries(feats).geom_type.map(GEOM_FAMILIES).to_numpy()
+        out_types = gpd.GeoSeries(pieces).geom_type
+
+        # a line that runs along (or touches) a zone boundary can give a collection of lines and points
+        for ii in np.flatnonzero(keep & (out_types == 'GeometryCollection').to_numpy()):
+            pieces[ii] = _extract_family(pieces[ii], in_types[ii])
+        keep &= ~(pieces.isna() | pieces.is_empty)
+        keep &= (gpd.GeoSeries(pieces).geom_type.map(GEOM_FAMILIES).to_numpy() == in_types)
+
+    clipped = gdf.iloc[feat_idx[keep]].copy()
+    clipped[gdf.geometry.name] = pieces[keep]
+    for field in fields:
+        clipped[field] = zones[field].to_numpy()[zone_idx[keep]]
+
+    if length_field is not None:
+        clipped = add_measure(clipped, length_field, 'length')
+
+    return clipped
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from egm722.counts import count_unique
+
+
+def original_count_unique(array, nodata=0):
+    # count_unique() from the Week 5 practical
+    count_dict = {}
+    for val in np.unique(array):
+        if val == nodata:
+            continue
+        count_dict[str(val)] = np.count_nonzero(array == val)
+    return count_dict
+
+
+def test_count_unique_matches_original_for_integers():
+    array = np.random.default_rng(0).integers(0, 12, size=(50, 40)).astype(np.uint8)
+    assert count_unique(array) == original_count_unique(array)
+
+
+def test_count_unique_matches_original_for_float32():
+    array = np.random.default_rng(1).choice([0, 1.1, 2.5, 3.3], size=(50, 40)).astype(np.float32)
+    assert count_unique(array) == original_count_unique(array)
+    assert '1.1' in count_unique(array)
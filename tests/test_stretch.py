@@ -0,0 +1,32 @@
+import os
+import sys
+import warnings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from egm722.stretch import band_limits, stretch_image
+
+
+def test_constant_band_is_zero_without_warnings():
+    img = np.stack([np.full((20, 30), 7, dtype=np.uint16),
+                    np.arange(600, dtype=np.uint16).reshape(20, 30)])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        dispimg = stretch_image(img, [0, 1])
+    assert (dispimg[..., 0] == 0).all()
+    assert dispimg[..., 1].min() == 0 and dispimg[..., 1].max() == 255
+
+
+def test_nodata_is_left_out_of_the_percentiles():
+    band = np.random.default_rng(0).uniform(100, 200, (40, 50)).astype(np.float32)
+    band[:10] = -9999
+    img = band[None]
+
+    (minval, maxval), = band_limits(img, pmin=2, pmax=98, nodata=-9999)
+    valid = band[band != -9999]
+    assert np.isclose(minval, np.percentile(valid, 2), atol=1e-2)
+    assert np.isclose(maxval, np.percentile(valid, 98), atol=1e-2)
+
+    dispimg = stretch_image(img, [0], pmin=2, pmax=98, nodata=-9999)
+    assert (dispimg[:10] == 0).all()
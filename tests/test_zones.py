@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import geopandas as gpd
+from shapely.geometry import LineString, box
+from egm722.zones import clip_by_zones
+
+
+def test_clip_keeps_lines_that_touch_the_boundary():
+    # the intersection of this line with the box is a GeometryCollection of a line and the point where it touches
+    roads = gpd.GeoDataFrame({'Road_class': ['A', 'B']},
+                             geometry=[LineString([(0.5, 0.5), (0.5, 1.5), (1.5, 0.5)]),
+                                       LineString([(0.2, 0.2), (0.8, 0.2)])], crs='epsg:2157')
+    zones = gpd.GeoDataFrame({'CountyName': ['Down']}, geometry=[box(0, 0, 1, 1)], crs='epsg:2157')
+
+    clipped = clip_by_zones(roads, zones, 'CountyName')
+    expected = gpd.clip(roads, zones, keep_geom_type=True).sort_index()
+
+    assert list(clipped.index) == list(expected.index)
+    assert (clipped.geom_type == 'LineString').all()
+    assert clipped['Length'].round(6).tolist() == expected.length.round(6).tolist()
+    assert clipped.geometry.geom_equals(expected.geometry).all()